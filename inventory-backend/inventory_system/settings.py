@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'products.middleware.SlowQueryLogMiddleware',
+    'products.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'products.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'inventory_system.urls'
@@ -151,9 +154,19 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Statements slower than this many milliseconds are logged with their query plan to
+# SLOW_QUERY_LOG_FILE (None disables it); summarize them with `manage.py slow_queries`
+SLOW_QUERY_THRESHOLD_MS = None
+SLOW_QUERY_LOG_FILE = os.path.join(BASE_DIR, 'slow_queries.log')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'message': {
+            'format': '%(message)s',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
@@ -163,6 +176,14 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': 'debug.log',
         },
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+            'delay': True,
+        },
     },
     'loggers': {
         'django': {
@@ -175,6 +196,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'products.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -185,7 +211,72 @@ VERSATILEIMAGEFIELD_SETTINGS = {
     'sized_directory_name': '__sized__',
     'filtered_directory_name': '__filtered__',
     'placeholder_directory_name': '__placeholder__',
+    # Renditions are pre-rendered in the background (products.renditions); creating them on
+    # demand only covers images uploaded before that, or whose renditions are still rendering
     'create_images_on_demand': True,
     'image_key_post_processor': None,
     'progressive_jpeg': False
 }
+
+# Named renditions of Products.ProductImage, returned as `image_renditions` by ProductSerializer
+VERSATILEIMAGEFIELD_RENDITION_KEY_SETS = {
+    'product_image': [
+        ('full_size', 'url'),
+        ('list_thumbnail', 'thumbnail__160x160'),
+        ('detail', 'thumbnail__600x600'),
+        ('zoom', 'thumbnail__1600x1600'),
+    ],
+}
+
+# Threads pre-rendering renditions after an image is saved (0 renders inline on commit)
+IMAGE_RENDITION_WORKERS = 2
+
+# Uploaded product images are scaled down to this many pixels on their longest side before they
+# are stored (None keeps them as uploaded); the largest rendition is 1600x1600
+PRODUCT_IMAGE_MAX_SIZE = 1600
+
+# Seconds the dashboard_stats payload stays cached; stock and catalogue writes invalidate it
+# on commit, the timeout only bounds staleness across processes with a per-process cache
+DASHBOARD_STATS_CACHE_TIMEOUT = 60
+
+# Per-process LRU of SKU -> variant/product/balance behind /api/product-variants/by-sku(s)/.
+# Variant, product and stock writes invalidate it; the TTL (seconds) bounds staleness across processes
+SKU_LOOKUP_CACHE_SIZE = 10000
+SKU_LOOKUP_CACHE_TTL = 30
+
+# Per-process Bloom filter of product codes that lets check-code(s) skip the query for unused
+# codes; rebuilt after PRODUCT_CODE_FILTER_TTL seconds to pick up other processes' products
+PRODUCT_CODE_FILTER = True
+PRODUCT_CODE_FILTER_TTL = 300
+
+# Values each worker process reserves at a time from products_sequence (e.g. ProductID)
+SEQUENCE_BLOCK_SIZE = 20
+
+# Per-view latency / SQL histograms served at /api/metrics in Prometheus text format, to staff
+# users and to scrapers sending `Authorization: Bearer <METRICS_TOKEN>`
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = False
+METRICS_TOKEN = None
+
+# cProfile a view when the request sends this header (e.g. 'X-Profile'; None disables it) or is
+# sampled at this rate (0 disables sampling), and comes from a staff user or sends PROFILING_TOKEN
+# as the header value; the newest PROFILE_STORE_MAX profiles are kept in PROFILE_DIR
+PROFILING_HEADER = None
+PROFILING_TOKEN = None
+PROFILING_SAMPLE_RATE = 0.0
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_STORE_MAX = 200
+
+# Serve JSON catalogue lists/details and the stock report from values_list() rows instead of
+# ModelSerializer instances (products.payloads); the output is the same either way
+FAST_READ_PAYLOADS = True
+
+# Background jobs (products.jobs) run by `manage.py run_jobs`: a running job's heartbeat is
+# refreshed every JOB_HEARTBEAT_INTERVAL seconds, and after JOB_STALE_AFTER seconds without
+# one it is queued again (unless its worker process is still alive on this host), until it has
+# been claimed JOB_MAX_ATTEMPTS times
+JOB_HEARTBEAT_INTERVAL = 10
+JOB_STALE_AFTER = 60
+JOB_MAX_ATTEMPTS = 3
+# Uploaded job inputs (deleted once the job finishes) and outputs; keep it out of MEDIA_ROOT
+JOB_FILES_ROOT = os.path.join(BASE_DIR, 'job_files')
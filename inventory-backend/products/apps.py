@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
-    verbose_name = 'Product Inventory'
\ No newline at end of file
+    verbose_name = 'Product Inventory'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,168 @@
+"""
+Native async versions of the read-heavy endpoints, mounted under /api/async/.
+
+DRF views are synchronous, so under ASGI each request holds a worker thread for its whole
+lifetime. These views await the async ORM instead and only borrow a thread per query. They
+share querysets, serializers and pagination with the DRF views in views.py and return the
+same JSON. Writes stay on the synchronous DRF endpoints.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .dashboard import aget_dashboard_stats
+from .exports import stream_stock_report
+from .pagination import CursorOrPageNumberPagination, KeysetPagination
+from .renderers import CSVRenderer, NDJSONRenderer
+from .serializers import ProductSerializer, ProductVariantSerializer, StockReportSerializer
+from .versions import acatalogue_validators, aproduct_validators, not_modified, set_validators
+from .views import (
+    ProductViewSet, ProductVariantViewSet, StockViewSet,
+    filter_product_variants, product_queryset, product_variant_queryset, stock_report_queryset
+)
+
+EXPORT_FORMATS = (CSVRenderer.format, NDJSONRenderer.format)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def error_response(exc):
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = json_response(data, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+        response['WWW-Authenticate'] = authenticator.authenticate_header(None)
+    return response
+
+
+def _drf_authenticate(request):
+    return Request(
+        request,
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    ).user
+
+
+async def authenticate(request):
+    """
+    Resolve the user for a request.
+
+    A valid `Authorization: Token <key>` header is checked on the async ORM; anything else
+    (sessions, basic auth, malformed headers) goes through DRF's configured authenticators
+    in a thread so the errors match the synchronous API.
+    """
+    auth = get_authorization_header(request).split()
+    if len(auth) == 2 and auth[0].lower() == b'token':
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            key = None
+        if key:
+            token = await Token.objects.select_related('user').filter(key=key).afirst()
+            if token is not None and token.user.is_active:
+                return token.user
+    return await sync_to_async(_drf_authenticate)(request)
+
+
+def async_api_view(view):
+    """
+    Wrap an async GET view with authentication, IsAuthenticated and DRF-style error bodies.
+    The view receives a DRF Request so query_params and the pagination classes work unchanged.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return error_response(exceptions.MethodNotAllowed(request.method))
+
+        drf_request = Request(request)
+        try:
+            user = await authenticate(request)
+            if not (user and user.is_authenticated):
+                raise exceptions.NotAuthenticated()
+            drf_request.user = user
+            return await view(drf_request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return error_response(exc)
+    return wrapper
+
+
+async def paginated_response(request, queryset, view, serializer_class, **serializer_kwargs):
+    paginator = CursorOrPageNumberPagination()
+    page = await paginator.apaginate_queryset(queryset, request, view)
+    serializer = serializer_class(page, many=True, context={'request': request}, **serializer_kwargs)
+    return json_response(paginator.get_paginated_response(serializer.data).data)
+
+
+@async_api_view
+async def dashboard_stats(request):
+    return json_response(await aget_dashboard_stats())
+
+
+def aconditional(validators):
+    """
+    Async counterpart of versions.conditional for the views below
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag, last_modified = await validators(request, *args, **kwargs)
+            response = not_modified(request, etag, last_modified) or await view(request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+@async_api_view
+@aconditional(acatalogue_validators)
+async def product_list(request):
+    fields = ProductSerializer.requested_fields(request.query_params)
+    return await paginated_response(
+        request, product_queryset(fields), ProductViewSet, ProductSerializer, fields=fields
+    )
+
+
+@async_api_view
+@aconditional(aproduct_validators)
+async def product_detail(request, pk):
+    fields = ProductSerializer.requested_fields(request.query_params)
+    try:
+        product = await product_queryset(fields).filter(pk=pk).afirst()
+    except (ValidationError, ValueError):
+        product = None
+    if product is None:
+        raise exceptions.NotFound()
+    return json_response(ProductSerializer(product, context={'request': request}, fields=fields).data)
+
+
+@async_api_view
+@aconditional(acatalogue_validators)
+async def product_variant_list(request):
+    queryset = filter_product_variants(product_variant_queryset().select_related('product'), request.query_params)
+    return await paginated_response(request, queryset, ProductVariantViewSet, ProductVariantSerializer)
+
+
+@async_api_view
+async def stock_report(request):
+    queryset = stock_report_queryset(request)
+
+    export_format = request.query_params.get(api_settings.URL_FORMAT_OVERRIDE)
+    if export_format in EXPORT_FORMATS:
+        return stream_stock_report(queryset, export_format, asynchronous=True)
+
+    queryset = queryset.select_related('product_variant__product')
+
+    if KeysetPagination.cursor_query_param in request.query_params:
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(queryset, request, StockViewSet)
+        serializer = StockReportSerializer(page, many=True)
+        return json_response(paginator.get_paginated_response(serializer.data).data)
+
+    serializer = StockReportSerializer([stock async for stock in queryset], many=True)
+    return json_response(serializer.data)
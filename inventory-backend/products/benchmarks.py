@@ -0,0 +1,400 @@
+import asyncio
+import json
+import logging
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+from asgiref.sync import ThreadSensitiveContext, async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .importers import CatalogueImporter
+from .ledger import rebuild_stock_balances, rebuild_stock_rollups
+from .models import Products, Variant, VariantOption, ProductVariant, Stock, StockSnapshot
+from .utils import BULK_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_CODE_PREFIX = 'BENCH'
+AXIS_NAMES = ('Size', 'Colour', 'Fit', 'Material')
+
+
+def seed_inventory(user, products=1000, axes=(3, 4), stock_rows=100000, days=365, out_ratio=0.4, seed=0):
+    """
+    Fill the database with a synthetic catalogue and ledger.
+
+    `axes` gives the option count per variant axis, so (3, 4) yields 12 SKUs per product.
+    Ledger rows are spread chronologically over the last `days` days with roughly
+    `out_ratio` OUT movements that never overdraw a variant.
+    """
+    rng = random.Random(seed)
+    start = Products.objects.filter(ProductCode__startswith=BENCHMARK_CODE_PREFIX).count()
+    variants = ';'.join(
+        f"{AXIS_NAMES[index % len(AXIS_NAMES)]}{index // len(AXIS_NAMES) or ''}:"
+        + '|'.join(f'{value}' for value in range(count))
+        for index, count in enumerate(axes)
+    )
+    rows = (
+        {
+            'ProductCode': f'{BENCHMARK_CODE_PREFIX}{number:07d}',
+            'ProductName': f'Benchmark product {number}',
+            'HSNCode': f'{rng.randint(1000, 9999)}',
+            'Variants': variants,
+        }
+        for number in range(start, start + products)
+    )
+    report = CatalogueImporter(user).run(rows)
+
+    variant_ids = list(ProductVariant.objects.filter(
+        product__ProductCode__startswith=BENCHMARK_CODE_PREFIX
+    ).values_list('pk', flat=True))
+    balances = dict.fromkeys(variant_ids, Decimal(0))
+
+    now = timezone.now()
+    per_batch = max(1, stock_rows // max(days, 1))
+    written = 0
+    with transaction.atomic():
+        while written < stock_rows and variant_ids:
+            # One batch per simulated day, stamped after insert because created_at is auto_now_add
+            day = now - timedelta(days=days * (1 - written / stock_rows))
+            batch = []
+            for _ in range(min(per_batch, stock_rows - written)):
+                product_variant_id = rng.choice(variant_ids)
+                quantity = Decimal(rng.randint(1, 20))
+                transaction_type = 'IN'
+                if rng.random() < out_ratio and balances[product_variant_id] >= quantity:
+                    transaction_type = 'OUT'
+                balances[product_variant_id] += quantity if transaction_type == 'IN' else -quantity
+                batch.append(Stock(product_variant_id=product_variant_id, quantity=quantity, transaction_type=transaction_type))
+            Stock.objects.bulk_create(batch, batch_size=BULK_BATCH_SIZE)
+            # Balances, snapshots and rollups are rebuilt once below rather than per batch
+            Stock.objects.filter(pk__in=[stock.pk for stock in batch]).update_untracked(created_at=day, updated_at=day)
+            written += len(batch)
+        # Backdated rows predate any snapshot of these variants
+        StockSnapshot.objects.filter(product_variant__product__ProductCode__startswith=BENCHMARK_CODE_PREFIX).delete()
+
+    rebuild_stock_balances()
+    rebuild_stock_rollups()
+    cache.clear()
+
+    logger.info(f"Seeded {report['products']} products, {report['skus']} SKUs and {written} stock rows")
+    return {'products': report['products'], 'skus': report['skus'], 'stock_rows': written}
+
+
+def client_host_allowed():
+    # The benchmark clients send Host: localhost, which Django only accepts unlisted with DEBUG on
+    return override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost'])
+
+
+class BenchmarkRunner:
+    """
+    Drive the API through the Django test client and record latency, queries and peak memory.
+
+    Each scenario is timed over `iterations` requests; query count and peak traced memory come
+    from one extra instrumented request so tracing does not distort the latency figures.
+    """
+
+    def __init__(self, user, iterations=20, seed=0):
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(user)
+        self.user = user
+        variants = ProductVariant.objects.order_by('sku')
+        self.variant_ids = [str(pk) for pk in variants.values_list('pk', flat=True)[:1000]]
+        # remove_stock needs variants that can absorb every iteration without going negative
+        self.stocked_variant_ids = [
+            str(pk) for pk in variants.filter(stock_balance__gte=iterations + 1).values_list('pk', flat=True)[:1000]
+        ]
+        self.generated = 0
+
+    def request(self, method, url, data=None):
+        response = getattr(self.client, method)(url, data, format='json')
+        if getattr(response, 'streaming', False):
+            for _ in response.streaming_content:
+                pass
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {url} returned {response.status_code}")
+        return response
+
+    def scenarios(self):
+        today = timezone.localdate()
+        month_ago = (today - timedelta(days=30)).isoformat()
+
+        def clear_cache():
+            cache.clear()
+
+        def stock_line(transaction_type, variant_ids):
+            def build():
+                return {
+                    'product_variant': self.rng.choice(variant_ids),
+                    'quantity': '1',
+                    'transaction_type': transaction_type,
+                }
+            return build
+
+        def new_product():
+            self.generated += 1
+            product = Products.objects.create(
+                ProductCode=f'{BENCHMARK_CODE_PREFIX}-GEN-{time.time_ns()}-{self.generated}',
+                ProductName='Benchmark generation',
+                CreatedUser=self.user
+            )
+            for name, count in (('Size', 5), ('Colour', 6), ('Fit', 8)):
+                variant = Variant.objects.create(product=product, name=name)
+                VariantOption.objects.bulk_create([VariantOption(variant=variant, value=str(value)) for value in range(count)])
+            return f'/api/products/{product.pk}/generate_variants/'
+
+        return [
+            ('dashboard_stats', 'get', lambda: '/api/stock/dashboard_stats/', None, clear_cache),
+            ('dashboard_stats_cached', 'get', lambda: '/api/stock/dashboard_stats/', None, None),
+            ('product_list', 'get', lambda: '/api/products/', None, None),
+            ('product_list_cursor', 'get', lambda: '/api/products/?cursor=', None, None),
+            ('stock_report_30d', 'get', lambda: f'/api/stock/report/?start_date={month_ago}', None, None),
+            ('stock_report_csv_30d', 'get', lambda: f'/api/stock/report/?format=csv&start_date={month_ago}', None, None),
+            ('add_stock', 'post', lambda: '/api/stock/add_stock/', stock_line('IN', self.variant_ids), None),
+            ('remove_stock', 'post', lambda: '/api/stock/remove_stock/', stock_line('OUT', self.stocked_variant_ids), None),
+            ('generate_variants', 'post', new_product, None, None),
+        ]
+
+    def measure(self, method, url, data):
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.request(method, url, data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return len(queries), peak
+
+    def run_scenario(self, method, url_factory, data_factory, setup):
+        timings = []
+        for _ in range(self.iterations):
+            url = url_factory()
+            data = data_factory() if data_factory else None
+            if setup:
+                setup()
+            started = time.perf_counter()
+            self.request(method, url, data)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        if setup:
+            setup()
+        queries, peak = self.measure(method, url_factory(), data_factory() if data_factory else None)
+
+        timings.sort()
+        return {
+            'iterations': self.iterations,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': queries,
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, only=None):
+        if not self.variant_ids:
+            raise RuntimeError("No product variants found; run seed_inventory first.")
+
+        results = {}
+        with client_host_allowed():
+            # Warm up imports, URL resolution and connection state
+            self.request('get', '/api/products/')
+
+            for name, method, url_factory, data_factory, setup in self.scenarios():
+                if only and name not in only:
+                    continue
+                if name == 'remove_stock' and not self.stocked_variant_ids:
+                    logger.warning("Skipping remove_stock: no variant holds enough stock")
+                    continue
+                logger.info(f"Benchmarking {name}")
+                results[name] = self.run_scenario(method, url_factory, data_factory, setup)
+
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'dataset': {
+                'products': Products.objects.count(),
+                'product_variants': ProductVariant.objects.count(),
+                'stock_rows': Stock.objects.count(),
+            },
+            'results': results,
+        }
+
+
+class AsyncLoadTest:
+    """
+    Compare the synchronous DRF read endpoints (/api/) with their async versions (/api/async/)
+    under concurrent mixed traffic.
+
+    Requests go through Django's ASGI request path, each in its own thread-sensitive context as
+    under a real ASGI server, so sync views hold a worker thread for the whole request while
+    async views only borrow one per query. A `write_ratio` share of requests are add_stock
+    posts, which stay synchronous in both modes.
+    """
+    READ_PATHS = (
+        'stock/dashboard_stats/',
+        'products/',
+        'product-variants/',
+        'stock/report/?cursor=&page_size=100',
+    )
+
+    def __init__(self, user, requests=200, concurrency=20, write_ratio=0.2, seed=0):
+        self.user = user
+        self.requests = requests
+        self.concurrency = concurrency
+        self.write_ratio = write_ratio
+        self.seed = seed
+        self.token, _ = Token.objects.get_or_create(user=user)
+        self.variant_ids = [str(pk) for pk in ProductVariant.objects.values_list('pk', flat=True)[:1000]]
+
+    def plan(self):
+        # The same request sequence for both modes so they are comparable
+        rng = random.Random(self.seed)
+        for _ in range(self.requests):
+            if self.variant_ids and rng.random() < self.write_ratio:
+                yield 'post', '/api/stock/add_stock/', {
+                    'product_variant': rng.choice(self.variant_ids),
+                    'quantity': '1',
+                    'transaction_type': 'IN',
+                }
+            else:
+                yield 'get', rng.choice(self.READ_PATHS), None
+
+    async def run_mode(self, prefix):
+        client = AsyncClient()
+        headers = {'Authorization': f'Token {self.token.key}'}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timings = {'read': [], 'write': []}
+        failures = 0
+
+        async def send(method, path, data):
+            nonlocal failures
+            async with semaphore, ThreadSensitiveContext():
+                started = time.perf_counter()
+                if method == 'post':
+                    response = await client.post(path, data, content_type='application/json', headers=headers)
+                else:
+                    response = await client.get(f'{prefix}{path}', headers=headers)
+                if getattr(response, 'streaming', False):
+                    async for _ in response.streaming_content:
+                        pass
+                elapsed = (time.perf_counter() - started) * 1000
+            timings['write' if method == 'post' else 'read'].append(elapsed)
+            if response.status_code >= 400:
+                failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(*request) for request in self.plan()))
+        wall = time.perf_counter() - started
+
+        result = {
+            'requests': self.requests,
+            'failures': failures,
+            'wall_s': round(wall, 3),
+            'throughput_rps': round(self.requests / wall, 1),
+        }
+        for kind, values in timings.items():
+            if values:
+                values.sort()
+                result[f'{kind}_p50_ms'] = round(statistics.median(values), 3)
+                result[f'{kind}_p95_ms'] = round(values[min(len(values) - 1, int(len(values) * 0.95))], 3)
+        return result
+
+    async def arun(self):
+        results = {}
+        for mode, prefix in (('sync', '/api/'), ('async', '/api/async/')):
+            await sync_to_async(cache.clear)()
+            logger.info(f"Load testing {mode} read endpoints")
+            results[mode] = await self.run_mode(prefix)
+        return results
+
+    def run(self):
+        if not self.variant_ids:
+            raise RuntimeError("No product variants found; run seed_inventory first.")
+        # AsyncClient always sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = async_to_sync(self.arun)()
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'concurrency': self.concurrency,
+            'write_ratio': self.write_ratio,
+            'results': results,
+        }
+
+
+class SerializationBenchmark:
+    """
+    Rows/sec/core of the JSON read endpoints with ModelSerializers (FAST_READ_PAYLOADS off)
+    and with the values_list() payloads of products.payloads.
+
+    Each mode runs the same requests through the test client and is timed with process CPU
+    time, so queries, serialization and rendering all count and idle time does not.
+    """
+    PATHS = {
+        'products': '/api/products/?page_size=100',
+        'product_variants': '/api/product-variants/?page_size=100',
+        'stock_report': '/api/stock/report/?cursor=&page_size=100',
+    }
+
+    def __init__(self, user, iterations=20):
+        self.iterations = iterations
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(user)
+
+    def request(self, path):
+        response = self.client.get(path)
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return response
+
+    def run_path(self, path, fast):
+        with override_settings(FAST_READ_PAYLOADS=fast):
+            rows = len(json.loads(self.request(path).content)['results'])
+            started = time.process_time()
+            for _ in range(self.iterations):
+                self.request(path)
+            cpu = time.process_time() - started
+        return {
+            'rows_per_request': rows,
+            'cpu_ms_per_request': round(cpu * 1000 / self.iterations, 3),
+            'rows_per_sec_per_core': round(rows * self.iterations / cpu, 1) if cpu else None,
+        }
+
+    def run(self):
+        if not ProductVariant.objects.exists():
+            raise RuntimeError("No product variants found; run seed_inventory first.")
+
+        results = {}
+        with client_host_allowed():
+            for name, path in self.PATHS.items():
+                logger.info(f"Benchmarking serialization of {name}")
+                serializer, fast = self.run_path(path, fast=False), self.run_path(path, fast=True)
+                results[name] = {
+                    'serializer': serializer,
+                    'fast': fast,
+                    'speedup': round(serializer['cpu_ms_per_request'] / fast['cpu_ms_per_request'], 2),
+                }
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'results': results,
+        }
+
+
+def write_results(results, path):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2)
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from .models import Products
+
+logger = logging.getLogger(__name__)
+
+CHECK_CODES_BATCH_SIZE = 500
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: `in` may give false positives, never false negatives
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class ProductCodeFilter:
+    """
+    In-memory Bloom filter of every ProductCode, used to answer "definitely not taken" without
+    a query. Codes it may contain are still checked against the database.
+
+    The filter is built from the catalogue on first use in each process and kept current by
+    the product signals and the importer. Deleted codes cannot be removed from a Bloom filter,
+    so deletes only count towards a rebuild. Products created by other processes are only
+    seen after PRODUCT_CODE_FILTER_TTL seconds, when the filter is rebuilt; the unique
+    constraint on ProductCode still rejects them on save.
+    """
+    def __init__(self, error_rate=0.01):
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._filter = None
+        self._pending = None
+        self._built_at = 0
+        self._removed = 0
+
+    def enabled(self):
+        return getattr(settings, 'PRODUCT_CODE_FILTER', True)
+
+    def _stale(self):
+        ttl = getattr(settings, 'PRODUCT_CODE_FILTER_TTL', 300)
+        return (
+            self._filter is None
+            or time.monotonic() - self._built_at > ttl
+            or self._filter.count > self._filter.capacity
+            or self._removed > self._filter.count // 4
+        )
+
+    def rebuild(self, only_if_stale=False):
+        with self._rebuild_lock:
+            if only_if_stale and not self._stale():
+                # Another thread rebuilt it while this one waited
+                return
+            started = time.perf_counter()
+            with self._lock:
+                # Codes added while the catalogue is read may be missing from the new filter
+                self._pending = []
+            codes = list(Products.objects.values_list('ProductCode', flat=True).iterator())
+            # Head room so creates do not push the error rate up before the next rebuild
+            bloom = BloomFilter(int(len(codes) * 1.25) + 1000, self.error_rate)
+            for code in codes:
+                bloom.add(code)
+            with self._lock:
+                for code in self._pending:
+                    bloom.add(code)
+                self._filter, self._pending = bloom, None
+                self._built_at, self._removed = time.monotonic(), 0
+        logger.info(f"Built product code filter over {len(codes)} codes in {time.perf_counter() - started:.3f}s")
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+    def might_contain(self, code):
+        if self._stale():
+            self.rebuild(only_if_stale=True)
+        return code in self._filter
+
+    def add(self, codes):
+        with self._lock:
+            for code in codes:
+                if self._filter is not None:
+                    self._filter.add(code)
+                if self._pending is not None:
+                    self._pending.append(code)
+
+    def add_on_commit(self, codes):
+        """
+        Add codes now and again after the transaction commits, in case a rebuild reading the
+        catalogue concurrently did not see them yet
+        """
+        codes = list(codes)
+        self.add(codes)
+        transaction.on_commit(lambda: self.add(codes))
+
+    def discard(self, count=1):
+        with self._lock:
+            self._removed += count
+
+
+product_codes = ProductCodeFilter()
+
+
+def existing_product_codes(codes):
+    """
+    Return the subset of `codes` already used by a product, with one IN query per
+    CHECK_CODES_BATCH_SIZE codes the filter could not rule out
+    """
+    codes = set(codes)
+    if product_codes.enabled():
+        codes = {code for code in codes if product_codes.might_contain(code)}
+    existing = set()
+    codes = list(codes)
+    for start in range(0, len(codes), CHECK_CODES_BATCH_SIZE):
+        existing.update(Products.objects.filter(
+            ProductCode__in=codes[start:start + CHECK_CODES_BATCH_SIZE]
+        ).values_list('ProductCode', flat=True))
+    return existing
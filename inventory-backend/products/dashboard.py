@@ -0,0 +1,97 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Products, ProductVariant, Stock
+from .serializers import StockReportSerializer
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_STATS_CACHE_KEY = 'products:dashboard_stats'
+LOW_STOCK_THRESHOLD = 10
+UNIT_VALUE = 10
+
+
+def _stock_totals():
+    return dict(
+        stock_total=Coalesce(
+            Sum('stock_balance'), Value(0),
+            output_field=models.DecimalField(max_digits=20, decimal_places=8)
+        ),
+        in_stock=Count('pk', filter=Q(stock_balance__gte=LOW_STOCK_THRESHOLD)),
+        low_stock=Count('pk', filter=Q(stock_balance__lt=LOW_STOCK_THRESHOLD, stock_balance__gt=0)),
+        out_of_stock=Count('pk', filter=Q(stock_balance=0)),
+    )
+
+
+def _recent_transactions():
+    return Stock.objects.select_related(
+        'product_variant', 'product_variant__product'
+    ).order_by('-created_at')[:5]
+
+
+def _build_dashboard_stats(totals, recent_transactions, total_products):
+    return {
+        'total_products': total_products,
+        'inventory_value': round(float(totals['stock_total']) * UNIT_VALUE, 2),
+        'low_stock_items': totals['low_stock'],
+        'recent_transactions': StockReportSerializer(recent_transactions, many=True).data,
+        'stock_status': {
+            'in_stock': totals['in_stock'],
+            'low_stock': totals['low_stock'],
+            'out_of_stock': totals['out_of_stock']
+        }
+    }
+
+
+def compute_dashboard_stats():
+    """
+    Build the dashboard payload: one conditional aggregate over variant balances plus the recent ledger
+    """
+    return _build_dashboard_stats(
+        ProductVariant.objects.aggregate(**_stock_totals()),
+        list(_recent_transactions()),
+        Products.objects.count()
+    )
+
+
+async def acompute_dashboard_stats():
+    return _build_dashboard_stats(
+        await ProductVariant.objects.aaggregate(**_stock_totals()),
+        [stock async for stock in _recent_transactions()],
+        await Products.objects.acount()
+    )
+
+
+def get_dashboard_stats():
+    """
+    Return the cached dashboard payload, computing it on a miss
+    """
+    stats = cache.get(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_dashboard_stats()
+        cache.set(
+            DASHBOARD_STATS_CACHE_KEY, stats,
+            getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 60)
+        )
+    return stats
+
+
+async def aget_dashboard_stats():
+    stats = await cache.aget(DASHBOARD_STATS_CACHE_KEY)
+    if stats is None:
+        stats = await acompute_dashboard_stats()
+        await cache.aset(
+            DASHBOARD_STATS_CACHE_KEY, stats,
+            getattr(settings, 'DASHBOARD_STATS_CACHE_TIMEOUT', 60)
+        )
+    return stats
+
+
+def invalidate_dashboard_stats():
+    """
+    Drop the cached payload once the current transaction commits
+    """
+    transaction.on_commit(lambda: cache.delete(DASHBOARD_STATS_CACHE_KEY))
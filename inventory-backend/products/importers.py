@@ -0,0 +1,255 @@
+import csv
+import io
+import logging
+import os
+from zipfile import BadZipFile
+from itertools import islice, product as itertools_product
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .codes import product_codes
+from .dashboard import invalidate_dashboard_stats
+from .models import Products, Variant, VariantOption, ProductVariant, ProductVariantOption
+from .search import reindex_products_on_commit
+from .sequences import product_ids
+from .utils import BULK_BATCH_SIZE, QueryCounter, build_variant_rows
+from .versions import catalogue_changed
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 500
+IMPORT_FORMATS = ('csv', 'xlsx')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+
+class CatalogueImportError(Exception):
+    pass
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension not in IMPORT_FORMATS:
+        raise CatalogueImportError(f"Unsupported file type '{extension}'. Use one of: {', '.join(IMPORT_FORMATS)}.")
+    return extension
+
+
+def read_csv_rows(fileobj):
+    """
+    Yield one dict per CSV data row without loading the file into memory
+    """
+    text = fileobj if isinstance(fileobj, io.TextIOBase) else io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.DictReader(text)
+    except UnicodeDecodeError:
+        raise CatalogueImportError("The CSV file is not UTF-8 encoded. Save it as 'CSV UTF-8' and upload it again.")
+    except csv.Error as e:
+        raise CatalogueImportError(f"The CSV file could not be read: {e}.")
+
+
+def read_xlsx_rows(fileobj):
+    """
+    Yield one dict per row of the first worksheet using openpyxl's read-only streaming mode
+    """
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise CatalogueImportError("XLSX import requires the 'openpyxl' package.")
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (BadZipFile, InvalidFileException, KeyError):
+        raise CatalogueImportError("The file is not a valid XLSX workbook.")
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, [])]
+        for values in rows:
+            yield {
+                column: '' if value is None else str(value)
+                for column, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, file_format):
+    if file_format == 'xlsx':
+        return read_xlsx_rows(fileobj)
+    return read_csv_rows(fileobj)
+
+
+def parse_variants(value):
+    """
+    Parse 'Size:S|M|L;Colour:Red|Blue' into [('Size', ['S', 'M', 'L']), ('Colour', ['Red', 'Blue'])]
+    """
+    axes = []
+    names = set()
+    for part in filter(None, (chunk.strip() for chunk in (value or '').split(';'))):
+        name, separator, options = part.partition(':')
+        name = name.strip()
+        if not separator or not name:
+            raise ValueError(f"Invalid variant definition '{part}'. Use Name:Option1|Option2.")
+        if name in names:
+            raise ValueError(f"Variant '{name}' is defined more than once.")
+        values = list(dict.fromkeys(option.strip() for option in options.split('|') if option.strip()))
+        if not values:
+            raise ValueError(f"Variant '{name}' has no options.")
+        names.add(name)
+        axes.append((name, values))
+    return axes
+
+
+class CatalogueImporter:
+    """
+    Load products, their variant axes/options and generated SKUs with chunked bulk_create.
+
+    Existing product codes are loaded once into memory, rows are validated as they stream
+    in, and every chunk of products is written in its own transaction. Invalid rows are
+    reported and skipped; a chunk the database rejects (e.g. an SKU clash) is written again
+    one row per savepoint so only the offending rows are reported and skipped.
+    """
+
+    def __init__(self, user, chunk_size=IMPORT_CHUNK_SIZE, generate_variants=True, progress=None):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.generate_variants = generate_variants
+        self.progress = progress
+        self.existing_codes = set(Products.objects.values_list('ProductCode', flat=True))
+        self.report = {'products': 0, 'variants': 0, 'skus': 0, 'errors': []}
+
+    def error(self, row_number, detail):
+        self.report['errors'].append({'row': row_number, 'detail': detail})
+
+    def validate(self, row_number, row):
+        code = (row.get('ProductCode') or '').strip()
+        name = (row.get('ProductName') or '').strip()
+        if not code or not name:
+            self.error(row_number, "ProductCode and ProductName are required.")
+            return None
+        if code in self.existing_codes:
+            self.error(row_number, f"ProductCode '{code}' must be unique.")
+            return None
+        try:
+            axes = parse_variants(row.get('Variants'))
+        except ValueError as e:
+            self.error(row_number, str(e))
+            return None
+
+        self.existing_codes.add(code)
+        return {
+            'ProductCode': code,
+            'ProductName': name,
+            'HSNCode': (row.get('HSNCode') or '').strip(),
+            'IsFavourite': (row.get('IsFavourite') or 'false').strip().lower() in TRUE_VALUES,
+            'Active': (row.get('Active') or 'true').strip().lower() in TRUE_VALUES,
+            'axes': axes,
+        }
+
+    def write_chunk(self, chunk):
+        products, variants, options, product_variants, links = [], [], [], [], []
+        generated = []
+
+        now = timezone.now()
+        for (_, data), product_id in zip(chunk, product_ids.allocate(len(chunk))):
+            product = Products(
+                ProductID=product_id,
+                UpdatedDate=now,
+                CreatedUser=self.user,
+                **{key: value for key, value in data.items() if key != 'axes'}
+            )
+            products.append(product)
+            axes = []
+            for name, values in data['axes']:
+                variant = Variant(product=product, name=name)
+                variant_options = [VariantOption(variant=variant, value=value) for value in values]
+                variants.append(variant)
+                options.extend(variant_options)
+                axes.append((variant, variant_options))
+            if self.generate_variants and axes:
+                generated.append((product, axes))
+
+        Products.objects.bulk_create(products, batch_size=BULK_BATCH_SIZE)
+        Variant.objects.bulk_create(variants, batch_size=BULK_BATCH_SIZE)
+        VariantOption.objects.bulk_create(options, batch_size=BULK_BATCH_SIZE)
+
+        skus = 0
+        for product, axes in generated:
+            combinations = itertools_product(*[variant_options for _, variant_options in axes])
+            while True:
+                combos = list(islice(combinations, BULK_BATCH_SIZE))
+                if not combos:
+                    break
+                rows, row_links = build_variant_rows(product, axes, combos)
+                product_variants.extend(rows)
+                links.extend(row_links)
+                if len(product_variants) >= BULK_BATCH_SIZE:
+                    skus += self.flush_skus(product_variants, links)
+        skus += self.flush_skus(product_variants, links)
+
+        # Products, options and SKUs were bulk-created, so no signal indexed them for search or code checks
+        reindex_products_on_commit(product.pk for product in products)
+        product_codes.add_on_commit(product.ProductCode for product in products)
+        catalogue_changed()
+
+        self.report['products'] += len(products)
+        self.report['variants'] += len(variants)
+        self.report['skus'] += skus
+
+    def flush_skus(self, product_variants, links):
+        count = len(product_variants)
+        ProductVariant.objects.bulk_create(product_variants, batch_size=BULK_BATCH_SIZE)
+        ProductVariantOption.objects.bulk_create(links, batch_size=BULK_BATCH_SIZE)
+        product_variants.clear()
+        links.clear()
+        return count
+
+    def flush(self, chunk):
+        if not chunk:
+            return
+        try:
+            with transaction.atomic():
+                self.write_chunk(chunk)
+        except IntegrityError:
+            with transaction.atomic():
+                for row_number, data in chunk:
+                    try:
+                        with transaction.atomic():
+                            self.write_chunk([(row_number, data)])
+                    except IntegrityError as e:
+                        self.existing_codes.discard(data['ProductCode'])
+                        self.error(row_number, f"Row was not imported: {e}")
+        if self.progress:
+            self.progress(self.report)
+
+    def run(self, rows):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            chunk = []
+            # Row 1 is the header, so data rows start at 2
+            row_number = 1
+            try:
+                for row_number, row in enumerate(rows, start=2):
+                    data = self.validate(row_number, row)
+                    if data is not None:
+                        chunk.append((row_number, data))
+                    if len(chunk) >= self.chunk_size:
+                        self.flush(chunk)
+                        chunk = []
+            except CatalogueImportError as e:
+                # An unreadable file fails as a whole, unless earlier chunks were already
+                # imported: then keep the rows read so far and report where reading stopped
+                if not self.report['products']:
+                    raise
+                self.error(row_number + 1, f"{e} Rows from here on were not imported.")
+            self.flush(chunk)
+
+        if self.report['products']:
+            invalidate_dashboard_stats()
+        logger.info(
+            f"Imported {self.report['products']} products, {self.report['skus']} SKUs "
+            f"with {len(self.report['errors'])} errors in {counter.count} queries"
+        )
+        return self.report
+
+
+def import_catalogue(fileobj, file_format, user, **kwargs):
+    return CatalogueImporter(user, **kwargs).run(read_rows(fileobj, file_format))
@@ -0,0 +1,319 @@
+"""
+A small database-backed job queue for work too slow for a request.
+
+Views enqueue a Job row and answer 202 with its id; `manage.py run_jobs` worker processes
+claim queued jobs with a conditional UPDATE (no broker, and it works the same on SQLite and
+PostgreSQL), run the registered task and record its progress, result or error on the row,
+which clients poll at /api/jobs/<id>/. A running job's worker refreshes heartbeat_at in the
+background; jobs whose heartbeat stops are queued again once their worker process is gone
+(a killed worker), up to JOB_MAX_ATTEMPTS claims.
+"""
+import csv
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+from .exports import EXPORT_CHUNK_SIZE, STOCK_REPORT_FIELDS, stock_report_row, stock_report_values
+from .importers import CatalogueImportError, import_catalogue
+from .models import Job, Products, Stock
+from .utils import generate_product_variants, load_variant_axes
+
+logger = logging.getLogger(__name__)
+
+JOB_TASKS = {}
+
+# Seconds a worker waits at most between polls after repeated database errors
+MAX_POLL_BACKOFF = 60
+
+
+class JobError(Exception):
+    """
+    Raised by a task for an expected failure; its message is the job's error
+    """
+
+
+def job_task(kind):
+    """
+    Register `function(job, **params)` as the task run for jobs of `kind`. Its return value
+    (JSON-serializable) becomes the job's result.
+    """
+    def decorator(function):
+        JOB_TASKS[kind] = function
+        return function
+    return decorator
+
+
+def enqueue(kind, params=None, user=None, input=None):
+    """
+    Queue a job; `input` is an optional uploaded file the task reads from job.input
+    """
+    if kind not in JOB_TASKS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+    job = Job(kind=kind, params=params or {}, created_by=user)
+    if input is not None:
+        job.input.save(os.path.basename(input.name), input, save=False)
+    job.save()
+    return job
+
+
+def report_progress(job, **progress):
+    """
+    Record a running job's progress, e.g. report_progress(job, done=10, total=200)
+    """
+    job.progress = progress
+    Job.objects.filter(pk=job.pk).update(progress=progress, heartbeat_at=timezone.now())
+
+
+def worker_alive(name):
+    """
+    Whether `name` (a JobWorker's default host:pid name) is a process running on this host.
+    Workers elsewhere can't be checked, so their jobs are judged by the heartbeat alone.
+    """
+    host, _, pid = name.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+class Heartbeat(threading.Thread):
+    """
+    Refresh a running job's heartbeat_at every `interval` seconds until stopped
+    """
+    def __init__(self, job_id, interval):
+        super().__init__(name=f'job-heartbeat-{job_id}', daemon=True)
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job_id, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+                except Exception:
+                    # e.g. SQLite busy behind the task's own write transaction; try again next beat
+                    logger.warning(f"Could not record heartbeat of job {self.job_id}", exc_info=True)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class JobWorker:
+    """
+    Claim and run queued jobs one at a time. Several workers (threads or processes) can poll
+    the same table: a job only runs where the UPDATE flipping it from queued to running matched.
+    """
+    def __init__(self, name=None, poll_interval=1.0, kinds=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_interval = poll_interval
+        self.kinds = kinds
+        self.stopping = threading.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    def requeue_stale(self):
+        """
+        Queue running jobs whose heartbeat stopped again, or fail them after JOB_MAX_ATTEMPTS claims.
+        Jobs of a worker process still alive on this host are left alone: its heartbeat may only
+        be held up behind the task's own write transaction, and running the task a second time
+        would apply an import or a stock posting twice.
+        """
+        cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_STALE_AFTER', 60))
+        stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff)
+        alive = [worker for worker in stale.values_list('worker', flat=True).distinct() if worker_alive(worker)]
+        if alive:
+            logger.warning(f"Not requeueing stale jobs of running workers {', '.join(alive)}")
+            stale = stale.exclude(worker__in=alive)
+        max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+        failed = stale.filter(attempts__gte=max_attempts).update(
+            status=Job.FAILED, finished_at=timezone.now(),
+            error=f"Worker stopped responding (attempt {max_attempts} of {max_attempts})."
+        )
+        requeued = stale.update(status=Job.QUEUED, worker='')
+        if failed or requeued:
+            logger.warning(f"Requeued {requeued} and failed {failed} jobs of unresponsive workers")
+
+    def claim(self):
+        queued = Job.objects.filter(status=Job.QUEUED).order_by('created_at')
+        if self.kinds:
+            queued = queued.filter(kind__in=self.kinds)
+        for job_id in queued.values_list('pk', flat=True)[:10]:
+            now = timezone.now()
+            claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=self.name, started_at=now, heartbeat_at=now,
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return Job.objects.get(pk=job_id)
+        return None
+
+    def execute(self, job):
+        task = JOB_TASKS.get(job.kind)
+        heartbeat = Heartbeat(job.pk, getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 10))
+        heartbeat.start()
+        started = time.perf_counter()
+        try:
+            if task is None:
+                raise JobError(f"Unknown job kind '{job.kind}'.")
+            result = task(job, **job.params)
+        except Exception as e:
+            if not isinstance(e, JobError):
+                logger.exception(f"Job {job.pk} ({job.kind}) failed")
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, error=str(e) or e.__class__.__name__, finished_at=timezone.now()
+            )
+        else:
+            # Round-trip through the encoder so dates and decimals in results are stored as strings
+            result = json.loads(json.dumps(result, cls=DjangoJSONEncoder))
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.SUCCEEDED, result=result, output=job.output.name or '', finished_at=timezone.now()
+            )
+            logger.info(f"Job {job.pk} ({job.kind}) finished in {time.perf_counter() - started:.3f}s")
+        finally:
+            heartbeat.stop()
+            if job.input:
+                # Uploads are only needed while the job runs
+                job.input.delete(save=False)
+                Job.objects.filter(pk=job.pk).update(input='')
+
+    def run_once(self):
+        """
+        Run one job if there is one; returns whether it did
+        """
+        close_old_connections()
+        self.requeue_stale()
+        job = self.claim()
+        if job is None:
+            return False
+        self.execute(job)
+        return True
+
+    def run(self, burst=False):
+        """
+        Work until stop() is called, or with `burst` until the queue is empty
+        """
+        logger.info(f"Job worker {self.name} started")
+        failures = 0
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                # e.g. SQLite busy while another worker's job holds the write lock; the worker
+                # must outlive that, so back off and poll again
+                failures += 1
+                delay = min(self.poll_interval * 2 ** failures, MAX_POLL_BACKOFF)
+                logger.exception(f"Job worker {self.name} could not poll the queue, retrying in {delay:.1f}s")
+                self.stopping.wait(delay)
+                continue
+            failures = 0
+            if not ran:
+                if burst:
+                    break
+                self.stopping.wait(self.poll_interval)
+        logger.info(f"Job worker {self.name} stopped")
+
+
+@job_task('generate_variants')
+def generate_variants_task(job, product, deactivate_orphans=False):
+    try:
+        product = Products.objects.get(pk=product)
+    except Products.DoesNotExist:
+        raise JobError("The product no longer exists.")
+    axes = load_variant_axes(product)
+    if not axes:
+        raise JobError("No variants found for this product.")
+    total = 1
+    for _, options in axes:
+        total *= len(options)
+    report_progress(job, skus=0, total=total)
+    created = generate_product_variants(product, axes, deactivate_orphans=deactivate_orphans)
+    report_progress(job, skus=len(created), total=total)
+    return {'product': str(product.pk), 'skus': len(created)}
+
+
+@job_task('import_catalogue')
+def import_catalogue_task(job, file_format, generate_variants=True):
+    if job.created_by is None:
+        raise JobError("The user who queued the import no longer exists.")
+    with job.input.open('rb') as fileobj:
+        try:
+            return import_catalogue(
+                fileobj, file_format, job.created_by,
+                generate_variants=generate_variants,
+                progress=lambda report: report_progress(
+                    job, products=report['products'], skus=report['skus'], errors=len(report['errors'])
+                ),
+            )
+        except CatalogueImportError as e:
+            raise JobError(str(e))
+
+
+def _ledger_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stock report rows newest first, one keyset query per chunk. Unlike a streaming cursor no
+    read stays open between chunks, which on SQLite would make this job's progress writes and
+    other workers' writes fail with "database is locked".
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(created_at__lt=last.created_at) | Q(created_at=last.created_at, id__lt=last.id))
+        rows = list(stock_report_values(page, named=True)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+
+
+@job_task('stock_report')
+def stock_report_task(job, start=None, end=None, export_format='csv'):
+    """
+    Write the stock report between `start` and `end` (ISO datetimes, end exclusive) to job.output
+    """
+    queryset = Stock.objects.all()
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+
+    rows = 0
+    with tempfile.NamedTemporaryFile('w+', encoding='utf-8', newline='', suffix=f'.{export_format}') as output:
+        if export_format == 'csv':
+            writer = csv.DictWriter(output, fieldnames=STOCK_REPORT_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: output.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+        for chunk in _ledger_chunks(queryset):
+            for row in chunk:
+                write(stock_report_row(row))
+            rows += len(chunk)
+            report_progress(job, rows=rows)
+        output.flush()
+        with open(output.name, 'rb') as written:
+            job.output.save(f'stock-report-{job.pk}.{export_format}', File(written), save=False)
+    report_progress(job, rows=rows)
+    return {'rows': rows, 'format': export_format}
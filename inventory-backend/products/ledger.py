@@ -0,0 +1,276 @@
+import logging
+from collections import defaultdict
+from django.db import models, transaction
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .dashboard import invalidate_dashboard_stats
+from .lookups import invalidate_sku_lookups, sku_cache
+from .models import Products, ProductVariant, Stock, StockDailyRollup, StockSnapshot
+from .versions import catalogue_changed, touch_products
+
+logger = logging.getLogger(__name__)
+
+BALANCE_FIELD = models.DecimalField(max_digits=20, decimal_places=8)
+LEDGER_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+def signed_quantity():
+    """
+    Ledger quantity as a signed expression: IN rows count up, OUT rows count down
+    """
+    return Case(
+        When(transaction_type='IN', then=F('quantity')),
+        default=-F('quantity'),
+        output_field=BALANCE_FIELD
+    )
+
+
+def rebuild_stock_balances(include_products=True, variant_ids=None):
+    """
+    Recompute every ProductVariant.stock_balance (and Products.TotalStock) from the Stock ledger,
+    or only those of the given variants (and their products)
+    """
+    ledger_total = Stock.objects.filter(
+        product_variant=OuterRef('pk')
+    ).order_by().values('product_variant').annotate(
+        total=Sum(signed_quantity())
+    ).values('total')
+
+    variant_total = ProductVariant.objects.filter(
+        product=OuterRef('pk')
+    ).order_by().values('product').annotate(
+        total=Sum('stock_balance')
+    ).values('total')
+
+    variants = ProductVariant.objects.all()
+    products = Products.objects.all()
+    if variant_ids is not None:
+        variant_ids = list(variant_ids)
+        variants = variants.filter(pk__in=variant_ids)
+        products = products.filter(pk__in=variants.values('product_id'))
+
+    with transaction.atomic():
+        variants_updated = variants.update(
+            stock_balance=Coalesce(Subquery(ledger_total, output_field=BALANCE_FIELD), Value(0), output_field=BALANCE_FIELD)
+        )
+        products_updated = 0
+        if include_products:
+            products_updated = products.update(
+                TotalStock=Coalesce(Subquery(variant_total, output_field=BALANCE_FIELD), Value(0), output_field=BALANCE_FIELD)
+            )
+        if variant_ids is None:
+            Products.objects.update(UpdatedDate=timezone.now())
+            catalogue_changed()
+            transaction.on_commit(sku_cache.clear)
+        else:
+            touch_products(products)
+            invalidate_sku_lookups(variant_ids=variant_ids)
+
+    logger.info(f"Rebuilt stock balances for {variants_updated} variants and {products_updated} products")
+    return variants_updated, products_updated
+
+
+def resync_stock(variant_ids, since=None, balances=True):
+    """
+    Re-derive the balances, snapshots and daily rollups of variants whose ledger rows changed
+    behind Stock.save() (e.g. QuerySet.update()); snapshots from `since` on are dropped, all of
+    them without it. Pass balances=False when only timestamps changed.
+    """
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+    with transaction.atomic():
+        if balances:
+            rebuild_stock_balances(include_products=False, variant_ids=variant_ids)
+        snapshots = StockSnapshot.objects.filter(product_variant_id__in=variant_ids)
+        if since is not None:
+            snapshots = snapshots.filter(taken_at__gte=since)
+        snapshots.delete()
+        rebuild_stock_rollups(variant_ids=variant_ids)
+        invalidate_dashboard_stats()
+
+
+def _apply_deltas(model, field, deltas):
+    # One UPDATE for all rows: field = field + CASE pk WHEN ... THEN delta END
+    if not deltas:
+        return
+    model.objects.filter(pk__in=list(deltas)).update(**{
+        field: Coalesce(F(field), Value(0), output_field=BALANCE_FIELD) + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=BALANCE_FIELD
+        )
+    })
+
+
+def apply_daily_rollups(stocks):
+    """
+    Fold freshly inserted ledger rows into StockDailyRollup with one upsert per (variant, day)
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for stock in stocks:
+        entry = totals[(stock.product_variant_id, timezone.localdate(stock.created_at))]
+        entry[0 if stock.transaction_type == 'IN' else 1] += stock.quantity
+        entry[2] += 1
+
+    for (product_variant_id, day), (quantity_in, quantity_out, count) in totals.items():
+        StockDailyRollup.apply(product_variant_id, day, quantity_in, quantity_out, count)
+
+
+def rebuild_stock_rollups(variant_ids=None):
+    """
+    Recompute StockDailyRollup from the Stock ledger, or only the given variants' rollups
+    """
+    ledger = Stock.objects.all()
+    rollups = StockDailyRollup.objects.all()
+    if variant_ids is not None:
+        ledger = ledger.filter(product_variant_id__in=variant_ids)
+        rollups = rollups.filter(product_variant_id__in=variant_ids)
+    totals = ledger.annotate(day=TruncDate('created_at')).order_by().values(
+        'product_variant_id', 'day'
+    ).annotate(
+        quantity_in=Coalesce(Sum('quantity', filter=Q(transaction_type='IN')), Value(0), output_field=BALANCE_FIELD),
+        quantity_out=Coalesce(Sum('quantity', filter=Q(transaction_type='OUT')), Value(0), output_field=BALANCE_FIELD),
+        transaction_count=Count('pk'),
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in totals.iterator(chunk_size=SNAPSHOT_BATCH_SIZE):
+            batch.append(StockDailyRollup(**row))
+            if len(batch) >= SNAPSHOT_BATCH_SIZE:
+                StockDailyRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        StockDailyRollup.objects.bulk_create(batch)
+        created += len(batch)
+
+    logger.info(f"Rebuilt {created} daily stock rollups")
+    return created
+
+
+def post_stock_batch(lines, atomic=True):
+    """
+    Record many IN/OUT movements in one transaction.
+
+    Balances for every referenced variant are read (and locked) with a single query, ledger rows
+    are written with bulk_create and variant/product balances with one aggregated UPDATE each.
+    With atomic=True any invalid line rejects the whole batch; otherwise valid lines are kept.
+    Returns (created_stocks, errors) where errors are {'line': index, 'detail': message}.
+    """
+    with transaction.atomic():
+        variant_ids = {line['product_variant'] for line in lines}
+        variants = {
+            row['id']: row
+            for row in ProductVariant.objects.select_for_update().filter(
+                pk__in=variant_ids
+            ).order_by('pk').values('id', 'product_id', 'stock_balance')
+        }
+
+        balances = {pk: row['stock_balance'] for pk, row in variants.items()}
+        stocks = []
+        errors = []
+        for index, line in enumerate(lines):
+            variant = variants.get(line['product_variant'])
+            if variant is None:
+                errors.append({'line': index, 'detail': "Invalid product variant."})
+                continue
+
+            stock = Stock(
+                product_variant_id=variant['id'],
+                quantity=line['quantity'],
+                transaction_type=line['transaction_type'],
+                notes=line.get('notes')
+            )
+            if balances[variant['id']] + stock.signed_quantity < 0:
+                errors.append({'line': index, 'detail': "Insufficient stock available."})
+                continue
+
+            balances[variant['id']] += stock.signed_quantity
+            stocks.append(stock)
+
+        if not stocks or (errors and atomic):
+            return [], errors
+
+        variant_deltas = defaultdict(int)
+        product_deltas = defaultdict(int)
+        for stock in stocks:
+            variant_deltas[stock.product_variant_id] += stock.signed_quantity
+            product_deltas[variants[stock.product_variant_id]['product_id']] += stock.signed_quantity
+
+        Stock.objects.bulk_create(stocks)
+        _apply_deltas(ProductVariant, 'stock_balance', variant_deltas)
+        _apply_deltas(Products, 'TotalStock', product_deltas)
+        apply_daily_rollups(stocks)
+        invalidate_dashboard_stats()
+        invalidate_sku_lookups(variant_ids=variant_deltas)
+        touch_products(product_deltas)
+
+    logger.info(f"Stock batch recorded: {len(stocks)} movements across {len(variant_deltas)} variants")
+    return stocks, errors
+
+
+def balances_as_of(at, queryset=None):
+    """
+    Annotate variants with `balance` as of `at`: their latest snapshot taken at or before `at`
+    plus the signed ledger rows created after that snapshot, up to and including `at`.
+
+    Only the ledger tail since the last snapshot is summed, so the cost stays bounded as
+    the ledger grows, provided snapshots are taken regularly.
+    """
+    queryset = ProductVariant.objects.all() if queryset is None else queryset
+    latest_snapshot = StockSnapshot.objects.filter(
+        product_variant=OuterRef('pk'), taken_at__lte=at
+    ).order_by('-taken_at')
+
+    ledger_tail = Stock.objects.filter(
+        product_variant=OuterRef('pk'),
+        created_at__lte=at,
+        created_at__gt=Coalesce(
+            OuterRef('snapshot_at'), Value(LEDGER_EPOCH, output_field=models.DateTimeField())
+        )
+    ).order_by().values('product_variant').annotate(
+        total=Sum(signed_quantity())
+    ).values('total')
+
+    return queryset.annotate(
+        snapshot_at=Subquery(latest_snapshot.values('taken_at')[:1]),
+        snapshot_balance=Subquery(latest_snapshot.values('balance')[:1], output_field=BALANCE_FIELD),
+    ).annotate(
+        balance=ExpressionWrapper(
+            Coalesce(F('snapshot_balance'), Value(0), output_field=BALANCE_FIELD)
+            + Coalesce(Subquery(ledger_tail, output_field=BALANCE_FIELD), Value(0), output_field=BALANCE_FIELD),
+            output_field=BALANCE_FIELD
+        )
+    )
+
+
+def take_stock_snapshots(at, batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Write one StockSnapshot per variant holding its balance as of `at`
+    """
+    created = 0
+    last_pk = None
+    with transaction.atomic():
+        while True:
+            # Walk variants in primary-key pages so reads never overlap the rows being inserted
+            variants = ProductVariant.objects.exclude(snapshots__taken_at=at).order_by('pk')
+            if last_pk is not None:
+                variants = variants.filter(pk__gt=last_pk)
+            rows = list(balances_as_of(at, variants).values_list('pk', 'balance')[:batch_size])
+            if not rows:
+                break
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(product_variant_id=product_variant_id, balance=balance, taken_at=at)
+                for product_variant_id, balance in rows
+            ])
+            created += len(rows)
+            last_pk = rows[-1][0]
+
+    logger.info(f"Took {created} stock snapshots as of {at.isoformat()}")
+    return created
@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connection, transaction
+from .models import ProductVariant
+from .serializers import SKULookupSerializer
+
+
+class SKULookupCache:
+    """
+    Bounded, thread-safe LRU map of SKU -> serialized scan lookup (variant id, product,
+    product name and balance), with a time-to-live per entry.
+
+    Entries are dropped by invalidate_variants()/invalidate_products() when a variant, its
+    product or its stock changes. Every invalidation bumps a generation counter and a batch
+    read from the database is only stored if no invalidation happened while it was being
+    read, so a lookup racing a stock movement cannot cache the old balance. The cache is per
+    process: the TTL bounds how long other workers may serve a balance changed elsewhere.
+    """
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.clear()
+
+    def get_max_size(self):
+        return self.max_size if self.max_size is not None else getattr(settings, 'SKU_LOOKUP_CACHE_SIZE', 10000)
+
+    def get_ttl(self):
+        return self.ttl if self.ttl is not None else getattr(settings, 'SKU_LOOKUP_CACHE_TTL', 30)
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._by_variant = {}
+            self._by_product = {}
+            self.generation = getattr(self, 'generation', 0) + 1
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_many(self, skus):
+        """
+        Return ({sku: entry} for cached SKUs, [uncached SKUs])
+        """
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for sku in skus:
+                cached = self._entries.get(sku)
+                if cached is not None and cached[0] > now:
+                    self._entries.move_to_end(sku)
+                    found[sku] = cached[1]
+                else:
+                    if cached is not None:
+                        self._discard(sku)
+                    missing.append(sku)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, entries, generation):
+        """
+        Store entries read from the database, unless something was invalidated since `generation`
+        """
+        max_size = self.get_max_size()
+        if max_size <= 0:
+            return
+        expires = time.monotonic() + self.get_ttl()
+        with self._lock:
+            if generation != self.generation:
+                return
+            for entry in entries:
+                sku = entry['sku']
+                self._discard(sku)
+                self._entries[sku] = (expires, entry)
+                self._by_variant[entry['id']] = sku
+                self._by_product.setdefault(entry['product'], set()).add(sku)
+            while len(self._entries) > max_size:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, sku):
+        cached = self._entries.pop(sku, None)
+        if cached is None:
+            return
+        entry = cached[1]
+        self._by_variant.pop(entry['id'], None)
+        skus = self._by_product.get(entry['product'])
+        if skus is not None:
+            skus.discard(sku)
+            if not skus:
+                del self._by_product[entry['product']]
+
+    def invalidate_variants(self, variant_ids):
+        with self._lock:
+            self.generation += 1
+            for variant_id in variant_ids:
+                sku = self._by_variant.get(str(variant_id))
+                if sku is not None:
+                    self._discard(sku)
+
+    def invalidate_products(self, product_ids):
+        with self._lock:
+            self.generation += 1
+            for product_id in product_ids:
+                for sku in list(self._by_product.get(str(product_id), ())):
+                    self._discard(sku)
+
+
+sku_cache = SKULookupCache()
+
+
+def lookup_skus(skus):
+    """
+    Resolve active SKUs to scan lookup entries, reading only cache misses with a single query.
+    Returns {sku: entry}; unknown and inactive SKUs are left out and never cached.
+    """
+    found, missing = sku_cache.get_many(skus)
+    if missing:
+        generation = sku_cache.generation
+        # Retired SKUs (see generate_product_variants) no longer resolve
+        rows = ProductVariant.objects.filter(sku__in=set(missing), is_active=True).values(
+            'id', 'product_id', 'sku', 'product__ProductName', 'stock_balance'
+        )
+        entries = SKULookupSerializer(rows, many=True).data
+        if not connection.in_atomic_block:
+            # Inside a transaction the rows may be uncommitted, and a rollback would not invalidate them
+            sku_cache.set_many(entries, generation)
+        found.update((entry['sku'], entry) for entry in entries)
+    return found
+
+
+def invalidate_sku_lookups(variant_ids=(), product_ids=()):
+    """
+    Drop cached lookups of the given variants/products now and again once the current transaction
+    commits, so a lookup in another thread cannot re-cache the pre-commit balance in between
+    """
+    variant_ids, product_ids = set(variant_ids), set(product_ids)
+
+    def invalidate():
+        if variant_ids:
+            sku_cache.invalidate_variants(variant_ids)
+        if product_ids:
+            sku_cache.invalidate_products(product_ids)
+
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.benchmarks import SerializationBenchmark, write_results
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure rows/sec/core of the JSON product, product variant and stock report endpoints with "
+        "ModelSerializers and with the fast values_list() payloads. Read-only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username the requests authenticate as")
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per endpoint and mode")
+        parser.add_argument('--output', default='serialization-results.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        try:
+            results = SerializationBenchmark(user, iterations=options['iterations']).run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        write_results(results, options['output'])
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f"{name:<18} serializer {result['serializer']['rows_per_sec_per_core']:>10.1f} rows/s  "
+                f"fast {result['fast']['rows_per_sec_per_core']:>10.1f} rows/s  x{result['speedup']:.2f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.importers import IMPORT_CHUNK_SIZE, CatalogueImportError, detect_format, import_catalogue
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Import products, variant axes and generated SKUs from a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/XLSX file with ProductCode, ProductName, HSNCode, IsFavourite, Active, Variants columns")
+        parser.add_argument('--user', required=True, help="Username recorded as CreatedUser")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Products written per transaction")
+        parser.add_argument('--no-generate', action='store_true', help="Do not generate ProductVariant rows")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        try:
+            file_format = detect_format(options['path'])
+            with open(options['path'], 'rb') as fileobj:
+                report = import_catalogue(
+                    fileobj, file_format, user,
+                    chunk_size=options['chunk_size'],
+                    generate_variants=not options['no_generate'],
+                    progress=lambda report: self.stdout.write(f"  {report['products']} products imported..."),
+                )
+        except (OSError, CatalogueImportError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['detail']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['products']} products, {report['variants']} variants "
+            f"and {report['skus']} SKUs ({len(report['errors'])} rows rejected)."
+        ))
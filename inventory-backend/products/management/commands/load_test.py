@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.benchmarks import AsyncLoadTest, write_results
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent mixed read/write traffic at the sync and async read endpoints through the "
+        "ASGI request path and compare throughput and latency. Writes stock; use a seeded scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username the requests authenticate as (by token)")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per mode")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once")
+        parser.add_argument('--write-ratio', type=float, default=0.2, help="Share of requests that are add_stock posts")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the request mix")
+        parser.add_argument('--output', default='load-test-results.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        load_test = AsyncLoadTest(
+            user, requests=options['requests'], concurrency=options['concurrency'],
+            write_ratio=options['write_ratio'], seed=options['seed']
+        )
+        try:
+            results = load_test.run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        write_results(results, options['output'])
+        for mode, result in results['results'].items():
+            self.stdout.write(
+                f"{mode:<6} {result['throughput_rps']:>8.1f} req/s  "
+                f"read p50 {result.get('read_p50_ms', 0):>8.2f} ms  p95 {result.get('read_p95_ms', 0):>8.2f} ms  "
+                f"write p95 {result.get('write_p95_ms', 0):>8.2f} ms  {result['failures']} failures"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from products.profiling import ProfileStore
+
+
+class Command(BaseCommand):
+    help = "List, inspect and prune request profiles recorded by ProfilingMiddleware"
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        subcommands.add_parser('list', help="List stored profiles, oldest first")
+
+        show = subcommands.add_parser('show', help="Print a profile's hottest functions")
+        show.add_argument('profile_id')
+        show.add_argument('--sort', default='cumulative', choices=('cumulative', 'tottime', 'calls', 'name', 'filename'))
+        show.add_argument('--limit', type=int, default=30, help="Number of functions to print")
+
+        prune = subcommands.add_parser('prune', help="Delete old profiles")
+        prune.add_argument('--keep', type=int, help="Keep only the newest N profiles")
+        prune.add_argument('--older-than-days', type=int, help="Delete profiles older than this many days")
+
+    def handle(self, *args, **options):
+        store = ProfileStore()
+        getattr(self, f"handle_{options['action']}")(store, options)
+
+    def handle_list(self, store, options):
+        profiles = store.list()
+        if not profiles:
+            self.stdout.write("No profiles stored.")
+        for profile in profiles:
+            self.stdout.write(
+                f"{profile['id']}  {profile.get('method', ''):<6} {profile.get('path', '')}  "
+                f"{profile.get('status', '')}  {profile.get('duration_ms', 0):.1f} ms  {profile.get('user', '')}"
+            )
+
+    def handle_show(self, store, options):
+        try:
+            self.stdout.write(store.report(options['profile_id'], sort=options['sort'], limit=options['limit']))
+        except KeyError:
+            raise CommandError(f"Profile '{options['profile_id']}' does not exist.")
+
+    def handle_prune(self, store, options):
+        if options['keep'] is None and options['older_than_days'] is None:
+            raise CommandError("Pass --keep and/or --older-than-days.")
+        before = None
+        if options['older_than_days'] is not None:
+            before = timezone.now() - timedelta(days=options['older_than_days'])
+        deleted = store.prune(keep=options['keep'], before=before)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} profiles."))
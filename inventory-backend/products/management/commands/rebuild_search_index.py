@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from products.search import create_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text product search index (SQLite FTS5) from the catalogue"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not create_search_index(connection):
+                raise CommandError(f"Full-text search is not available on the '{connection.vendor}' backend.")
+            rows = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rows} products."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products.ledger import rebuild_stock_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild ProductVariant.stock_balance and Products.TotalStock from the Stock ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--skip-products',
+            action='store_true',
+            help="Only rebuild variant balances, leave Products.TotalStock untouched",
+        )
+
+    def handle(self, *args, **options):
+        variants, products = rebuild_stock_balances(include_products=not options['skip_products'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt balances for {variants} variants and {products} products."
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.ledger import rebuild_stock_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-variant daily movement rollup (StockDailyRollup) from the Stock ledger"
+
+    def handle(self, *args, **options):
+        created = rebuild_stock_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} daily rollup rows."))
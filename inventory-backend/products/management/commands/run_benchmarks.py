@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.benchmarks import BenchmarkRunner, write_results
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the hot API endpoints through the Django test client and write p50/p95 latency, "
+        "queries per request and peak memory as JSON. Mutates data; use a seeded scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username the requests authenticate as")
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per scenario")
+        parser.add_argument('--only', nargs='*', help="Scenario names to run (default: all)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for request inputs")
+        parser.add_argument('--output', default='benchmark-results.json', help="Where to write the JSON results")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        runner = BenchmarkRunner(user, iterations=options['iterations'], seed=options['seed'])
+        try:
+            results = runner.run(only=options['only'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        write_results(results, options['output'])
+        for name, result in results['results'].items():
+            self.stdout.write(
+                f"{name:<24} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"{result['queries']:>4} queries  {result['peak_memory_kb']:>9.1f} KiB"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
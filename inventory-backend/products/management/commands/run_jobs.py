@@ -0,0 +1,65 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from products.jobs import JOB_TASKS, JobWorker
+
+
+def work(options):
+    worker = JobWorker(poll_interval=options['poll_interval'], kinds=options['kind'])
+    # Finish the current job, then exit
+    signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+    signal.signal(signal.SIGINT, lambda *args: worker.stop())
+    try:
+        worker.run(burst=options['burst'])
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (variant generation, catalogue imports, stock report exports) "
+        "in one or more worker processes. SIGTERM/Ctrl-C lets running jobs finish before exiting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Worker processes")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds an idle worker waits between polls")
+        parser.add_argument('--kind', nargs='*', choices=sorted(JOB_TASKS), help="Only run jobs of these kinds")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes < 1:
+            raise CommandError("--processes must be at least 1.")
+        if processes == 1:
+            work(options)
+            return
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("Several worker processes need fork(); run with --processes 1 instead.")
+
+        # Children must open their own connections rather than share the parent's sockets
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=work, args=(options,), name=f'job-worker-{index}')
+            for index in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Started {processes} job workers: {', '.join(str(worker.pid) for worker in workers)}")
+
+        def forward(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+        signal.signal(signal.SIGTERM, forward)
+        # Ctrl-C already reaches the whole process group
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        for worker in workers:
+            worker.join()
+        failed = [worker for worker in workers if worker.exitcode]
+        if failed:
+            raise CommandError(f"{len(failed)} job workers exited abnormally.")
+        self.stdout.write(self.style.SUCCESS("Job workers stopped."))
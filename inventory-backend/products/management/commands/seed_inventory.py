@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.benchmarks import seed_inventory
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic catalogue and stock ledger for benchmarking. "
+        "Point it at a scratch database, not production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help="Username recorded as CreatedUser")
+        parser.add_argument('--products', type=int, default=1000, help="Number of products to create")
+        parser.add_argument(
+            '--axes', default='3,4',
+            help="Comma-separated option counts per variant axis, e.g. 5,6,8 for 240 SKUs per product"
+        )
+        parser.add_argument('--stock-rows', type=int, default=100000, help="Number of Stock ledger rows")
+        parser.add_argument('--days', type=int, default=365, help="Days of history the ledger is spread over")
+        parser.add_argument('--out-ratio', type=float, default=0.4, help="Share of movements that are OUT")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for a reproducible dataset")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+        try:
+            axes = tuple(int(count) for count in options['axes'].split(',') if count.strip())
+        except ValueError:
+            raise CommandError("--axes must be a comma-separated list of integers.")
+
+        summary = seed_inventory(
+            user,
+            products=options['products'],
+            axes=axes,
+            stock_rows=options['stock_rows'],
+            days=options['days'],
+            out_ratio=options['out_ratio'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {summary['products']} products, {summary['skus']} SKUs and {summary['stock_rows']} stock rows."
+        ))
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.slowlog import read_slow_queries, summarize_slow_queries
+
+
+class Command(BaseCommand):
+    help = "Summarize the slow query log (SLOW_QUERY_THRESHOLD_MS) by total time per statement"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.SLOW_QUERY_LOG_FILE, help="Slow query log to read, rotated backups included")
+        parser.add_argument('--top', type=int, default=10, help="Number of statements to show")
+        parser.add_argument('--plans', action='store_true', help="Print the plan of each statement's slowest run")
+
+    def handle(self, *args, **options):
+        summary = summarize_slow_queries(read_slow_queries(options['file']), top=options['top'])
+        if not summary:
+            self.stdout.write("No slow queries logged.")
+            return
+
+        for rank, group in enumerate(summary, start=1):
+            self.stdout.write(self.style.WARNING(
+                f"#{rank}  total {group['total_ms']:.1f} ms  count {group['count']}  "
+                f"mean {group['mean_ms']:.1f} ms  max {group['max_ms']:.1f} ms"
+            ))
+            if group['sources']:
+                self.stdout.write(f"    from: {', '.join(group['sources'])}")
+            self.stdout.write(f"    {group['sql']}")
+            if options['plans'] and group['plan']:
+                for line in group['plan']:
+                    self.stdout.write(f"      {line}")
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from products.ledger import take_stock_snapshots
+from products.models import StockSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Record every variant's stock balance as of a timestamp so point-in-time balances only "
+        "sum the ledger since the last snapshot. Run it from cron (e.g. nightly)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help="ISO timestamp to snapshot (defaults to five minutes ago)")
+        parser.add_argument('--prune-days', type=int, help="Delete snapshots older than this many days")
+
+    def handle(self, *args, **options):
+        # Stay a little behind now so rows from still-open transactions are not missed
+        at = timezone.now() - timedelta(minutes=5)
+        if options['at']:
+            at = parse_datetime(options['at'])
+            if at is None:
+                raise CommandError("Invalid --at timestamp. Use ISO 8601, e.g. 2025-03-31T23:59:59.")
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+            if at > timezone.now():
+                raise CommandError("Cannot snapshot a timestamp in the future.")
+
+        created = take_stock_snapshots(at)
+        self.stdout.write(self.style.SUCCESS(f"Recorded {created} snapshots as of {at.isoformat()}."))
+
+        if options['prune_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['prune_days'])
+            deleted, _ = StockSnapshot.objects.filter(taken_at__lt=cutoff).delete()
+            self.stdout.write(f"Pruned {deleted} snapshots taken before {cutoff.isoformat()}.")
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.renditions import warm_all_product_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Render every product image rendition (VERSATILEIMAGEFIELD_RENDITION_KEY_SETS['product_image']) "
+        "in parallel. Run it after changing rendition sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=max(settings.IMAGE_RENDITION_WORKERS, 4), help="Rendering threads")
+        parser.add_argument('--batch-size', type=int, default=100, help="Products per task")
+
+    def handle(self, *args, **options):
+        def progress(warmed, failed):
+            self.stdout.write(f"Rendered {warmed} renditions, {failed} failures")
+
+        warmed, failed = warm_all_product_images(
+            workers=options['workers'], batch_size=options['batch_size'], progress=progress
+        )
+        for path in failed:
+            self.stderr.write(f"Failed: {path}")
+        self.stdout.write(self.style.SUCCESS(f"Rendered {warmed} image renditions with {len(failed)} failures."))
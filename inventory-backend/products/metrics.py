@@ -0,0 +1,112 @@
+import hmac
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Any other request method is counted as 'other', so clients can't add label values at will
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram in the Prometheus cumulative layout
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield _format_number(bound), cumulative
+        yield '+Inf', self.count
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+    """
+    In-process registry of per-view request latency, SQL query count and SQL time
+    """
+    METRICS = (
+        ('inventory_request_duration_seconds', 'Request latency per view.', LATENCY_BUCKETS),
+        ('inventory_request_queries', 'SQL queries executed per request.', QUERY_BUCKETS),
+        ('inventory_request_sql_duration_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {
+                name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                for name, _, buckets in self.METRICS
+            }
+            self._responses = defaultdict(int)
+
+    def observe(self, view, method, status, duration, queries, sql_duration):
+        method = method if method in METHODS else 'other'
+        key = (view, method)
+        with self._lock:
+            self._histograms['inventory_request_duration_seconds'][key].observe(duration)
+            self._histograms['inventory_request_queries'][key].observe(queries)
+            self._histograms['inventory_request_sql_duration_seconds'][key].observe(sql_duration)
+            self._responses[(view, method, str(status))] += 1
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for name, help_text, _ in self.METRICS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (view, method), histogram in sorted(self._histograms[name].items()):
+                    labels = f'view="{_escape(view)}",method="{method}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {_format_number(float(histogram.total))}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+            lines.append('# HELP inventory_responses_total Responses per view and status code.')
+            lines.append('# TYPE inventory_responses_total counter')
+            for (view, method, status), count in sorted(self._responses.items()):
+                lines.append(
+                    f'inventory_responses_total{{view="{_escape(view)}",method="{method}",status="{status}"}} {count}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+class IsMetricsScraper(BasePermission):
+    """
+    Allows requests sending `Authorization: Bearer <METRICS_TOKEN>`, as Prometheus scrapers do
+    """
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if not token:
+            return False
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,231 @@
+import hmac
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .metrics import request_metrics
+from .profiling import ProfileStore, RequestProfiler
+from .slowlog import SlowQueryLogger
+
+# Execute wrappers active for the current request. Connections are per thread while async
+# views run their queries in sync_to_async worker threads, so request-scoped wrappers are
+# kept in a context variable (copied into those threads) rather than on one connection.
+_request_execute_wrappers = ContextVar('request_execute_wrappers', default=())
+
+
+def dispatch_request_execute_wrappers(execute, sql, params, many, context):
+    for wrapper in reversed(_request_execute_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_request_execute_wrappers(sender, connection, **kwargs):
+    """
+    connection_created receiver; first in the list so connection.execute_wrapper() pops stay balanced
+    """
+    if dispatch_request_execute_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, dispatch_request_execute_wrappers)
+
+
+@contextmanager
+def request_execute_wrapper(wrapper):
+    """
+    Like connection.execute_wrapper(), but covers every connection the current context uses
+    """
+    token = _request_execute_wrappers.set(_request_execute_wrappers.get() + (wrapper,))
+    try:
+        yield wrapper
+    finally:
+        _request_execute_wrappers.reset(token)
+
+
+class SQLTimer:
+    """
+    Execute wrapper that counts queries and accumulates their wall-clock time
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Unresolved paths share one label so 404 scans cannot blow up cardinality
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI, so async views are
+    not pushed back onto a thread. Subclasses implement `process(request)` and
+    `aprocess(request)`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.aprocess(request)
+        return self.process(request)
+
+
+class RequestMetricsMiddleware(SyncAndAsyncMiddleware):
+    """
+    Record per-view latency, SQL query count and SQL time into the in-process registry.
+
+    Set METRICS_ENABLED = False to bypass it and METRICS_SERVER_TIMING = True to add a
+    Server-Timing header. SQL run while a streaming response is consumed is not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', False)
+
+    def process(self, request):
+        started = time.perf_counter()
+        with request_execute_wrapper(SQLTimer()) as timer:
+            response = self.get_response(request)
+        return self.record(request, response, started, timer)
+
+    async def aprocess(self, request):
+        started = time.perf_counter()
+        with request_execute_wrapper(SQLTimer()) as timer:
+            response = await self.get_response(request)
+        return self.record(request, response, started, timer)
+
+    def record(self, request, response, started, timer):
+        duration = time.perf_counter() - started
+        request_metrics.observe(
+            view_label(request), request.method, response.status_code,
+            duration, timer.count, timer.duration
+        )
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+            )
+        return response
+
+
+class SlowQueryLogMiddleware(SyncAndAsyncMiddleware):
+    """
+    Log SQL slower than SLOW_QUERY_THRESHOLD_MS, with its query plan, to the slow query log.
+
+    Disabled unless the threshold is set. It sits outside RequestMetricsMiddleware so the
+    EXPLAIN it runs is not counted as the view's SQL time.
+    """
+
+    def __init__(self, get_response):
+        threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+        if threshold is None:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.threshold = threshold
+
+    def logger(self, request):
+        return SlowQueryLogger(self.threshold, source=lambda: view_label(request))
+
+    def process(self, request):
+        with request_execute_wrapper(self.logger(request)):
+            return self.get_response(request)
+
+    async def aprocess(self, request):
+        with request_execute_wrapper(self.logger(request)):
+            return await self.get_response(request)
+
+
+class ProfilingMiddleware(SyncAndAsyncMiddleware):
+    """
+    Profile the view with cProfile when a staff user asks to.
+
+    A request is considered when it carries the PROFILING_HEADER header (unset by default, which
+    turns profiling off) or is sampled at PROFILING_SAMPLE_RATE. It is only profiled when its
+    credentials belong to a staff user, checked here with DRF's authenticators before the view
+    runs, or when the header's value is PROFILING_TOKEN. Profiled responses carry the stored
+    profile id in X-Profile-Id. Inspect profiles with `manage.py profiles`.
+    Under ASGI only the event loop thread is profiled, not queries run in worker threads.
+    """
+
+    def __init__(self, get_response):
+        self.header = getattr(settings, 'PROFILING_HEADER', None)
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if not self.header and not self.sample_rate:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.meta_key = 'HTTP_' + self.header.upper().replace('-', '_') if self.header else None
+        self.token = getattr(settings, 'PROFILING_TOKEN', None)
+        self.store = ProfileStore()
+
+    def should_profile(self, request):
+        if self.meta_key and request.META.get(self.meta_key):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def allowed(self, request):
+        if self.token and self.meta_key and hmac.compare_digest(request.META.get(self.meta_key, ''), self.token):
+            return True
+        drf_request = Request(request, authenticators=[
+            authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ])
+        try:
+            return drf_request.user.is_staff
+        except APIException:
+            # Bad credentials (or a CSRF failure); the view will answer that itself
+            return False
+
+    def process(self, request):
+        if not self.should_profile(request) or not self.allowed(request):
+            return self.get_response(request)
+
+        with RequestProfiler() as profiler:
+            response = self.get_response(request)
+        return self.save(request, response, profiler)
+
+    async def aprocess(self, request):
+        # Authenticating needs the sync ORM
+        if not self.should_profile(request) or not await sync_to_async(self.allowed)(request):
+            return await self.get_response(request)
+
+        with RequestProfiler() as profiler:
+            response = await self.get_response(request)
+        return await sync_to_async(self.save)(request, response, profiler)
+
+    def save(self, request, response, profiler):
+        user = getattr(request, 'user', None)
+        if profiler.profile is not None:
+            response['X-Profile-Id'] = self.store.save(profiler.profile, {
+                'timestamp': timezone.now().isoformat(),
+                'method': request.method,
+                'path': request.path,
+                'view': view_label(request),
+                'status': response.status_code,
+                'user': user.get_username() if user is not None else '',
+                'duration_ms': round(profiler.duration * 1000, 3),
+            })
+        return response
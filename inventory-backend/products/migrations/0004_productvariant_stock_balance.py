@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:01
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_stock_balance(apps, schema_editor):
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    Stock = apps.get_model('products', 'Stock')
+
+    balances = {}
+    totals = Stock.objects.order_by().values('product_variant_id', 'transaction_type').annotate(total=Sum('quantity'))
+    for row in totals:
+        sign = 1 if row['transaction_type'] == 'IN' else -1
+        balances[row['product_variant_id']] = balances.get(row['product_variant_id'], 0) + sign * row['total']
+
+    for product_variant_id, balance in balances.items():
+        ProductVariant.objects.filter(pk=product_variant_id).update(stock_balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_productvariant_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='stock_balance',
+            field=models.DecimalField(decimal_places=8, default=0.0, editable=False, max_digits=20),
+        ),
+        migrations.RunPython(backfill_stock_balance, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_productvariant_stock_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['-CreatedDate', 'ProductID'], name='products_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['-created_at', 'id'], name='products_stock_created_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_product_id_sequence(apps, schema_editor):
+    Products = apps.get_model('products', 'Products')
+    Sequence = apps.get_model('products', 'Sequence')
+    last = Products.objects.aggregate(last=Max('ProductID'))['last'] or 0
+    Sequence.objects.update_or_create(name='products.ProductID', defaults={'next_value': last + 1})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+            options={
+                'verbose_name': 'sequence',
+                'verbose_name_plural': 'sequences',
+                'db_table': 'products_sequence',
+            },
+        ),
+        migrations.RunPython(seed_product_id_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('balance', models.DecimalField(decimal_places=8, default=0.0, max_digits=20)),
+                ('taken_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'stock snapshot',
+                'verbose_name_plural': 'stock snapshots',
+                'db_table': 'products_stock_snapshot',
+                'ordering': ('-taken_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['product_variant', 'created_at'], name='products_stock_variant_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product_variant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='products.productvariant'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stocksnapshot',
+            unique_together={('product_variant', 'taken_at')},
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:10
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+import uuid
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    Stock = apps.get_model('products', 'Stock')
+    StockDailyRollup = apps.get_model('products', 'StockDailyRollup')
+
+    totals = Stock.objects.annotate(day=TruncDate('created_at')).order_by().values(
+        'product_variant_id', 'day'
+    ).annotate(
+        quantity_in=Sum('quantity', filter=Q(transaction_type='IN')),
+        quantity_out=Sum('quantity', filter=Q(transaction_type='OUT')),
+        transaction_count=Count('id'),
+    )
+    StockDailyRollup.objects.bulk_create([
+        StockDailyRollup(
+            product_variant_id=row['product_variant_id'], day=row['day'],
+            quantity_in=row['quantity_in'] or 0, quantity_out=row['quantity_out'] or 0,
+            transaction_count=row['transaction_count']
+        )
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_stock_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockDailyRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('quantity_in', models.DecimalField(decimal_places=8, default=0.0, max_digits=20)),
+                ('quantity_out', models.DecimalField(decimal_places=8, default=0.0, max_digits=20)),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('product_variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='products.productvariant')),
+            ],
+            options={
+                'verbose_name': 'stock daily rollup',
+                'verbose_name_plural': 'stock daily rollups',
+                'db_table': 'products_stock_daily_rollup',
+                'ordering': ('-day',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockdailyrollup',
+            index=models.Index(fields=['day'], name='products_rollup_day_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockdailyrollup',
+            unique_together={('product_variant', 'day')},
+        ),
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
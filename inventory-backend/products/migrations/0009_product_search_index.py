@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:40
+
+import logging
+from django.db import OperationalError, migrations
+
+logger = logging.getLogger(__name__)
+
+# Frozen copies of the SQL in products.search as of this migration, so later changes to that
+# module or to the models don't change what this migration does
+CREATE_SEARCH_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5("
+    "code, name, hsn, skus, options, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3 4 5 6 8')"
+)
+
+POPULATE_SEARCH_TABLE = """
+    INSERT INTO products_search (rowid, code, name, hsn, skus, options)
+    SELECT p."ProductID", p."ProductCode", p."ProductName", COALESCE(p."HSNCode", ''),
+        COALESCE((
+            SELECT group_concat(pv.sku, ' ') FROM products_product_variant pv
+            WHERE pv.product_id = p.id
+        ), ''),
+        COALESCE((
+            SELECT group_concat(vo.value, ' ') FROM products_variant_option vo
+            INNER JOIN products_variant v ON vo.variant_id = v.id
+            WHERE v.product_id = p.id
+        ), '')
+    FROM products_product p
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite only; without it (or on other backends) search falls back to LIKE lookups
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SEARCH_TABLE)
+        except OperationalError as e:
+            logger.warning(f"Full-text product search unavailable: {e}")
+            return
+        cursor.execute(POPULATE_SEARCH_TABLE)
+        cursor.execute("INSERT INTO products_search (products_search) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS products_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_stock_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:25
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+
+def seed_catalogue_version(apps, schema_editor):
+    Products = apps.get_model('products', 'Products')
+    Sequence = apps.get_model('products', 'Sequence')
+    Products.objects.filter(UpdatedDate__isnull=True).update(UpdatedDate=F('CreatedDate'))
+    Sequence.objects.update_or_create(
+        name='catalogue', defaults={'next_value': 1, 'updated_at': timezone.now()}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sequence',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(seed_catalogue_version, migrations.RunPython.noop),
+    ]
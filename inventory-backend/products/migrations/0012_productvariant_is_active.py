@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariant',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
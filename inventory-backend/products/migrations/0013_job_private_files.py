@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 23:10
+
+from django.db import migrations, models
+import products.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_productvariant_is_active'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='input',
+            field=models.FileField(blank=True, storage=products.models.JobFileStorage(), upload_to=products.models.job_file_name),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='output',
+            field=models.FileField(blank=True, storage=products.models.JobFileStorage(), upload_to=products.models.job_file_name),
+        ),
+    ]
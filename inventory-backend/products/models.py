@@ -1,8 +1,14 @@
 from django.db import models
 
 # Create your models here.
+import os
 import uuid
-from django.db import models
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from versatileimagefield.fields import VersatileImageField
 
@@ -42,6 +48,9 @@ class ProductVariant(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product = models.ForeignKey('Products', related_name='product_variants', on_delete=models.CASCADE)
     sku = models.CharField(max_length=255, unique=True)
+    stock_balance = models.DecimalField(default=0.00, max_digits=20, decimal_places=8, editable=False)
+    # Cleared when the SKU's option combination is no longer offered, see generate_product_variants()
+    is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -56,15 +65,14 @@ class ProductVariant(models.Model):
 
     @property
     def current_stock(self):
-        total_in = sum(
-            stock.quantity for stock in 
-            self.stocks.filter(transaction_type='IN')
-        )
-        total_out = sum(
-            stock.quantity for stock in 
-            self.stocks.filter(transaction_type='OUT')
+        # Maintained by Stock.save() and deletes; rebuild with `manage.py rebuild_stock_balances`
+        return self.stock_balance
+
+    @classmethod
+    def apply_stock_delta(cls, product_variant_id, delta):
+        cls.objects.filter(pk=product_variant_id).update(
+            stock_balance=F('stock_balance') + delta
         )
-        return total_in - total_out
 
 class ProductVariantOption(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -81,6 +89,41 @@ class ProductVariantOption(models.Model):
     def __str__(self):
         return f"{self.product_variant.sku} - {self.variant_option.value}"
 
+class StockQuerySet(models.QuerySet):
+    """
+    Bulk updates of ledger fields skip Stock.save(), so they re-derive the balances, snapshots
+    and rollups of the variants they touch. Bulk deletes are handled by signals.stock_row_deleted.
+    """
+    LEDGER_FIELDS = frozenset(('product_variant', 'product_variant_id', 'quantity', 'transaction_type'))
+    # Moving rows in time leaves balances alone but not snapshots and daily rollups
+    TIMESTAMP_FIELDS = frozenset(('created_at',))
+
+    def update(self, **kwargs):
+        changes_ledger = bool(self.LEDGER_FIELDS.intersection(kwargs))
+        if not changes_ledger and not self.TIMESTAMP_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+
+        from .ledger import resync_stock
+        with transaction.atomic():
+            rows = list(self.order_by().values_list('product_variant_id', 'created_at'))
+            updated = super().update(**kwargs)
+            variant_ids = {product_variant_id for product_variant_id, _ in rows}
+            moved_to = kwargs.get('product_variant', kwargs.get('product_variant_id'))
+            if moved_to is not None:
+                variant_ids.add(getattr(moved_to, 'pk', moved_to))
+            # Rows moved in time invalidate every snapshot, otherwise only those after the earliest row
+            since = None if 'created_at' in kwargs or not rows else min(created_at for _, created_at in rows)
+            resync_stock(variant_ids, since, balances=changes_ledger)
+        return updated
+
+    def update_untracked(self, **kwargs):
+        """
+        Plain UPDATE that leaves balances, snapshots and rollups stale, for bulk loaders that
+        rebuild them once at the end (see benchmarks.seed_inventory)
+        """
+        return super().update(**kwargs)
+
+
 class Stock(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product_variant = models.ForeignKey(ProductVariant, related_name='stocks', on_delete=models.CASCADE)
@@ -90,15 +133,119 @@ class Stock(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = StockQuerySet.as_manager()
+
     class Meta:
         db_table = "products_stock"
         verbose_name = _("stock")
         verbose_name_plural = _("stocks")
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='products_stock_created_idx'),
+            models.Index(fields=['product_variant', 'created_at'], name='products_stock_variant_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product_variant.sku} - {self.quantity} ({self.transaction_type})"
 
+    @property
+    def signed_quantity(self):
+        return self.quantity if self.transaction_type == 'IN' else -self.quantity
+
+    def save(self, *args, **kwargs):
+        # Keep ProductVariant.stock_balance in step with the ledger in the same transaction
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Stock.objects.filter(pk=self.pk).first()
+            super().save(*args, **kwargs)
+            if previous is not None:
+                ProductVariant.apply_stock_delta(previous.product_variant_id, -previous.signed_quantity)
+                # Editing history makes every later snapshot of the variant wrong
+                StockSnapshot.discard_after(previous.product_variant_id, previous.created_at)
+                if self.product_variant_id != previous.product_variant_id:
+                    StockSnapshot.discard_after(self.product_variant_id, previous.created_at)
+                StockDailyRollup.apply_stock(previous, sign=-1)
+            ProductVariant.apply_stock_delta(self.product_variant_id, self.signed_quantity)
+            StockDailyRollup.apply_stock(self)
+
+    def remove_from_balances(self):
+        # Undo a deleted row; run from post_delete so QuerySet.delete() (e.g. the admin's bulk delete) is covered
+        ProductVariant.apply_stock_delta(self.product_variant_id, -self.signed_quantity)
+        StockSnapshot.discard_after(self.product_variant_id, self.created_at)
+        StockDailyRollup.apply_stock(self, sign=-1)
+
+class StockSnapshot(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product_variant = models.ForeignKey(ProductVariant, related_name='snapshots', on_delete=models.CASCADE)
+    balance = models.DecimalField(default=0.00, max_digits=20, decimal_places=8)
+    taken_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "products_stock_snapshot"
+        verbose_name = _("stock snapshot")
+        verbose_name_plural = _("stock snapshots")
+        ordering = ('-taken_at',)
+        unique_together = ('product_variant', 'taken_at')
+
+    def __str__(self):
+        return f"{self.product_variant.sku} - {self.balance} @ {self.taken_at}"
+
+    @classmethod
+    def discard_after(cls, product_variant_id, timestamp):
+        cls.objects.filter(product_variant_id=product_variant_id, taken_at__gte=timestamp).delete()
+
+class StockDailyRollup(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product_variant = models.ForeignKey(ProductVariant, related_name='daily_rollups', on_delete=models.CASCADE)
+    day = models.DateField()
+    quantity_in = models.DecimalField(default=0.00, max_digits=20, decimal_places=8)
+    quantity_out = models.DecimalField(default=0.00, max_digits=20, decimal_places=8)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "products_stock_daily_rollup"
+        verbose_name = _("stock daily rollup")
+        verbose_name_plural = _("stock daily rollups")
+        ordering = ('-day',)
+        unique_together = ('product_variant', 'day')
+        indexes = [
+            models.Index(fields=['day'], name='products_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_variant.sku} - {self.day}"
+
+    @classmethod
+    def apply(cls, product_variant_id, day, quantity_in=0, quantity_out=0, transaction_count=0):
+        # Upsert that adds to the counters; retries the update if a concurrent insert wins
+        changes = {
+            'quantity_in': F('quantity_in') + quantity_in,
+            'quantity_out': F('quantity_out') + quantity_out,
+            'transaction_count': F('transaction_count') + transaction_count,
+        }
+        rows = cls.objects.filter(product_variant_id=product_variant_id, day=day)
+        if rows.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    product_variant_id=product_variant_id, day=day, quantity_in=quantity_in,
+                    quantity_out=quantity_out, transaction_count=transaction_count
+                )
+        except IntegrityError:
+            rows.update(**changes)
+
+    @classmethod
+    def apply_stock(cls, stock, sign=1):
+        quantity_in = stock.quantity if stock.transaction_type == 'IN' else 0
+        quantity_out = stock.quantity if stock.transaction_type == 'OUT' else 0
+        cls.apply(
+            stock.product_variant_id, timezone.localdate(stock.created_at),
+            sign * quantity_in, sign * quantity_out, sign
+        )
+
 class Products(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     ProductID = models.BigIntegerField(unique=True,blank=True)
@@ -119,14 +266,104 @@ class Products(models.Model):
         verbose_name_plural = _("products")
         unique_together = (("ProductCode", "ProductID"),)
         ordering = ("-CreatedDate", "ProductID")
+        indexes = [
+            models.Index(fields=['-CreatedDate', 'ProductID'], name='products_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.ProductID:
             # Generate a ProductID if not provided
-            last_product = Products.objects.order_by('-ProductID').first()
-            self.ProductID = (last_product.ProductID + 1) if last_product else 1
+            from .sequences import product_ids
+            self.ProductID = product_ids.next_value()
+        # Also the product's version for conditional GETs, see versions.py
+        self.UpdatedDate = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'UpdatedDate'}
         super().save(*args, **kwargs)
     
     
     def __str__(self):
-        return self.ProductName
\ No newline at end of file
+        return self.ProductName
+
+class Sequence(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "products_sequence"
+        verbose_name = _("sequence")
+        verbose_name_plural = _("sequences")
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+class JobFileStorage(FileSystemStorage):
+    """
+    Job inputs and outputs. They live in JOB_FILES_ROOT rather than MEDIA_ROOT, which is served
+    publicly, and have no URL: clients fetch outputs through JobViewSet.download.
+    """
+    @cached_property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.JOB_FILES_ROOT)
+
+    def url(self, name):
+        raise ValueError("Job files are only served through /api/jobs/<id>/download/.")
+
+    def _clear_cached_properties(self, setting, **kwargs):
+        super()._clear_cached_properties(setting, **kwargs)
+        if setting == 'JOB_FILES_ROOT':
+            self.__dict__.pop('base_location', None)
+            self.__dict__.pop('location', None)
+
+
+def job_file_name(instance, filename):
+    # A random name, so nothing about the file can be guessed from the upload; keep the extension
+    return f'{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}'
+
+
+class Job(models.Model):
+    """
+    A unit of background work (see products.jobs), claimed and run by `manage.py run_jobs`
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    input = models.FileField(upload_to=job_file_name, storage=JobFileStorage(), blank=True)
+    output = models.FileField(upload_to=job_file_name, storage=JobFileStorage(), blank=True)
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    created_by = models.ForeignKey("auth.User", related_name='jobs', on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "products_job"
+        verbose_name = _("job")
+        verbose_name_plural = _("jobs")
+        ordering = ('-created_at',)
+        indexes = [
+            # Workers look for the oldest queued job and for running jobs whose worker went quiet
+            models.Index(fields=['status', 'created_at'], name='products_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.pk} ({self.status})"
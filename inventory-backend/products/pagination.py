@@ -0,0 +1,195 @@
+import base64
+import binascii
+import json
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a composite ordering.
+
+    The cursor is an opaque token holding the ordering values of the row at the page edge,
+    so every page is a `WHERE (a, b) > (x, y) ... LIMIT n` query and costs the same no matter
+    how deep it is. No COUNT(*) is issued. The ordering must end in a unique column.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        self.ordering = tuple(ordering) if ordering else None
+
+    def get_ordering(self, view):
+        ordering = self.ordering or getattr(view, 'cursor_ordering', None)
+        assert ordering, (
+            f'{self.__class__.__name__} requires an ordering, set `cursor_ordering` on the view.'
+        )
+        return tuple(ordering)
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = payload['p'], bool(payload['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        position = [_encode_value(getattr(instance, field.lstrip('-'))) for field in self.ordering]
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _keyset_filter(self, position, reverse):
+        # (a DESC, b ASC) after (x, y)  ->  a < x OR (a = x AND b > y)
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            term = Q(**{f'{field.lstrip("-")}__{lookup}': position[index]})
+            for previous_field, previous_value in zip(self.ordering[:index], position[:index]):
+                term &= Q(**{previous_field.lstrip('-'): previous_value})
+            condition |= term
+        return condition
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Return the unevaluated slice for the requested page (one row more than the page size)
+        """
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.base_url = request.build_absolute_uri()
+        self.page_size_value = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        if self.reverse:
+            order_by = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        else:
+            order_by = list(self.ordering)
+
+        queryset = queryset.order_by(*order_by)
+        if self.position is not None:
+            queryset = queryset.filter(self._keyset_filter(self.position, self.reverse))
+        return queryset[:self.page_size_value + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size_value
+        self.page = results[:self.page_size_value]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([instance async for instance in page_queryset])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class CursorOrPageNumberPagination(StandardResultsSetPagination):
+    """
+    Page-number pagination by default; switches to keyset pagination when `?cursor=` is present
+    (an empty cursor requests the first page). Views declare the keyset with `cursor_ordering`.
+    """
+    cursor_query_param = KeysetPagination.cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async counterpart of paginate_queryset for views built on the async ORM
+        """
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        self.keyset = None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Pre-fill the cached count so the paginator never issues a synchronous COUNT(*)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [instance async for instance in self.page.object_list]
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
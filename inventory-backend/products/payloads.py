@@ -0,0 +1,213 @@
+"""
+Read payloads built straight from values_list() rows.
+
+Once their queries are fixed, the catalogue list endpoints spend most of their CPU building
+model instances and walking DRF's per-field machinery in ProductSerializer,
+ProductVariantSerializer and StockReportSerializer. The builders here run the same queries (same filters and ordering,
+so the same rows, order and query count) as values_list() and map each row with converters
+set up once at import, producing exactly the serializers' output. They only serve JSON
+responses; the browsable API keeps the serializers. Turn them off with FAST_READ_PAYLOADS.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from rest_framework import serializers
+from .exports import stock_report_row, stock_report_values
+from .models import Products, ProductVariant, ProductVariantOption, Variant, VariantOption
+from .renditions import rendition_urls
+from .serializers import ProductSerializer
+
+PRODUCT_COLUMNS = (
+    'id', 'ProductID', 'ProductCode', 'ProductName', 'ProductImage', 'CreatedDate', 'UpdatedDate',
+    'CreatedUser', 'IsFavourite', 'Active', 'HSNCode', 'TotalStock',
+)
+PRODUCT_VARIANT_COLUMNS = ('id', 'product', 'sku', 'is_active', 'stock_balance', 'product_name')
+
+_balance_field = serializers.DecimalField(max_digits=20, decimal_places=8)
+_datetime_field = serializers.DateTimeField()
+_image_field = Products._meta.get_field('ProductImage')
+_image_sizes = ProductSerializer._declared_fields['image_renditions'].sizes
+
+
+def fast_payloads_enabled(request):
+    return (
+        getattr(settings, 'FAST_READ_PAYLOADS', True)
+        and getattr(request, 'accepted_renderer', None) is not None
+        and request.accepted_renderer.format == 'json'
+    )
+
+
+def _decimal(value):
+    return None if value is None else _balance_field.to_representation(value)
+
+
+def _datetime(value):
+    return None if value is None else _datetime_field.to_representation(value)
+
+
+def _image_url(name, request):
+    # serializers.ImageField: absolute URL of the stored file, None without one
+    if not name:
+        return None
+    url = _image_field.storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _image_renditions(name, request):
+    if not name and not _image_field.placeholder_image:
+        return {}
+    image = Products(ProductImage=name).ProductImage
+    return rendition_urls(image, _image_sizes, request=request)
+
+
+def _group(rows, key):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[getattr(row, key)].append(row)
+    return grouped
+
+
+def _product_variant_options(product_variant_ids):
+    """
+    ProductVariantOptionSerializer payloads per product variant id
+    """
+    options = defaultdict(list)
+    if not product_variant_ids:
+        return options
+    rows = ProductVariantOption.objects.filter(product_variant_id__in=product_variant_ids).values_list(
+        'id', 'product_variant_id', 'variant__name', 'variant_option__value'
+    )
+    for option_id, product_variant_id, variant_name, option_value in rows:
+        options[product_variant_id].append({
+            'id': str(option_id),
+            'variant_name': variant_name,
+            'option_value': option_value,
+        })
+    return options
+
+
+def _product_variant(row, options, product_name):
+    return {
+        'id': str(row.id),
+        'product': str(row.product),
+        'sku': row.sku,
+        'is_active': row.is_active,
+        'options': options.get(row.id, []),
+        'current_stock': _decimal(row.stock_balance),
+        'product_name': product_name,
+    }
+
+
+def product_variant_rows(queryset):
+    # The product name comes from a correlated subquery rather than a join, which values_list()
+    # would keep in the paginator's COUNT(*) over every variant
+    product_name = Subquery(Products.objects.filter(pk=OuterRef('product_id')).order_by().values('ProductName')[:1])
+    return queryset.prefetch_related(None).annotate(product_name=product_name).values_list(
+        *PRODUCT_VARIANT_COLUMNS, named=True
+    )
+
+
+def product_variant_payloads(rows):
+    """
+    ProductVariantSerializer output for product_variant_rows()
+    """
+    rows = list(rows)
+    options = _product_variant_options([row.id for row in rows])
+    return [_product_variant(row, options, row.product_name) for row in rows]
+
+
+def product_rows(queryset):
+    return queryset.prefetch_related(None).values_list(*PRODUCT_COLUMNS, named=True)
+
+
+# ProductSerializer's plain fields; product_payloads() renders them in Meta.fields order
+_PRODUCT_FIELDS = {
+    'id': lambda row, request: str(row.id),
+    'ProductID': lambda row, request: row.ProductID,
+    'ProductCode': lambda row, request: row.ProductCode,
+    'ProductName': lambda row, request: row.ProductName,
+    'ProductImage': lambda row, request: _image_url(row.ProductImage, request),
+    'image_renditions': lambda row, request: _image_renditions(row.ProductImage, request),
+    'CreatedDate': lambda row, request: _datetime(row.CreatedDate),
+    'UpdatedDate': lambda row, request: _datetime(row.UpdatedDate),
+    'CreatedUser': lambda row, request: row.CreatedUser,
+    'IsFavourite': lambda row, request: row.IsFavourite,
+    'Active': lambda row, request: row.Active,
+    'HSNCode': lambda row, request: row.HSNCode,
+    'TotalStock': lambda row, request: _decimal(row.TotalStock),
+}
+
+
+def _variants_by_product(product_ids):
+    """
+    VariantSerializer payloads per product id
+    """
+    variants = _group(Variant.objects.filter(product_id__in=product_ids).values_list(
+        'id', 'name', 'product_id', named=True
+    ), 'product_id')
+    variant_ids = [variant.id for product_variants in variants.values() for variant in product_variants]
+    variant_options = defaultdict(list)
+    if variant_ids:
+        for option_id, value, variant_id in VariantOption.objects.filter(
+            variant_id__in=variant_ids
+        ).values_list('id', 'value', 'variant_id'):
+            variant_options[variant_id].append({'id': str(option_id), 'value': value})
+    return {
+        product_id: [
+            {'id': str(variant.id), 'name': variant.name, 'options': variant_options.get(variant.id, [])}
+            for variant in product_variants
+        ]
+        for product_id, product_variants in variants.items()
+    }
+
+
+def _product_variants_by_product(product_names):
+    """
+    ProductVariantSerializer payloads per product id, for {product id: ProductName}
+    """
+    product_variants = _group(ProductVariant.objects.filter(product_id__in=list(product_names)).values_list(
+        'id', 'product', 'sku', 'is_active', 'stock_balance', named=True
+    ), 'product')
+    options = _product_variant_options([
+        product_variant.id for skus in product_variants.values() for product_variant in skus
+    ])
+    return {
+        product_id: [_product_variant(row, options, product_names[product_id]) for row in skus]
+        for product_id, skus in product_variants.items()
+    }
+
+
+def product_payloads(rows, request=None, fields=None):
+    """
+    ProductSerializer output for product_rows(), limited to `fields` (as ProductSerializer's
+    `fields=`). Nested variants and SKUs are loaded, when requested, in the same queries as
+    product_queryset()'s prefetches.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    if fields is None:
+        fields = ProductSerializer.Meta.fields
+
+    nested = {}
+    if 'variants' in fields:
+        variants = _variants_by_product([row.id for row in rows])
+        nested['variants'] = lambda row, request: variants.get(row.id, [])
+    if 'product_variants' in fields:
+        product_variants = _product_variants_by_product({row.id: row.ProductName for row in rows})
+        nested['product_variants'] = lambda row, request: product_variants.get(row.id, [])
+
+    converters = [(name, _PRODUCT_FIELDS.get(name) or nested[name]) for name in fields]
+    return [{name: convert(row, request) for name, convert in converters} for row in rows]
+
+
+def stock_report_rows(queryset):
+    # Named rows keep the cursor columns (created_at, id) readable as attributes for KeysetPagination
+    return stock_report_values(queryset, named=True)
+
+
+def stock_report_payloads(rows):
+    """
+    StockReportSerializer output for stock_report_rows()
+    """
+    return [stock_report_row(row) for row in rows]
@@ -0,0 +1,113 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+from datetime import timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+
+# cProfile allows one active profiler per process on newer Pythons, so requests take turns
+_profiler_lock = threading.Lock()
+
+
+class RequestProfiler:
+    """
+    Deterministic cProfile run around a block; `stats` is None if another profile was running
+    """
+    def __init__(self):
+        self.profile = None
+        self.duration = 0.0
+
+    def __enter__(self):
+        if _profiler_lock.acquire(blocking=False):
+            self.profile = cProfile.Profile()
+            self.started = time.perf_counter()
+            self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.disable()
+            self.duration = time.perf_counter() - self.started
+            _profiler_lock.release()
+        return False
+
+
+class ProfileStore:
+    """
+    Bounded on-disk store of request profiles.
+
+    Each profile is a pstats dump (`<id>.prof`) plus a JSON metadata file (`<id>.json`); ids
+    sort chronologically, and saving drops the oldest profiles beyond `max_profiles`.
+    """
+    ID_PATTERN = re.compile(r'^[\w.-]+$')
+
+    def __init__(self, directory=None, max_profiles=None):
+        self.directory = str(directory or settings.PROFILE_DIR)
+        self.max_profiles = max_profiles if max_profiles is not None else settings.PROFILE_STORE_MAX
+
+    def path(self, profile_id, extension):
+        if not self.ID_PATTERN.match(profile_id):
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, f'{profile_id}.{extension}')
+
+    def save(self, profile, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        profile.dump_stats(self.path(profile_id, 'prof'))
+        with open(self.path(profile_id, 'json'), 'w') as metadata_file:
+            json.dump(dict(metadata, id=profile_id), metadata_file)
+        self.prune(keep=self.max_profiles)
+        return profile_id
+
+    def ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.prof'))
+
+    def metadata(self, profile_id):
+        try:
+            with open(self.path(profile_id, 'json')) as metadata_file:
+                return json.load(metadata_file)
+        except FileNotFoundError:
+            if not os.path.exists(self.path(profile_id, 'prof')):
+                raise KeyError(profile_id)
+            return {'id': profile_id}
+
+    def list(self):
+        return [self.metadata(profile_id) for profile_id in self.ids()]
+
+    def report(self, profile_id, sort='cumulative', limit=30):
+        path = self.path(profile_id, 'prof')
+        if not os.path.exists(path):
+            raise KeyError(profile_id)
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def delete(self, profile_id):
+        for extension in ('prof', 'json'):
+            try:
+                os.remove(self.path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+    def prune(self, keep=None, before=None):
+        """
+        Delete profiles older than `before` (an aware datetime) and all but the newest `keep`
+        """
+        ids = self.ids()
+        doomed = set()
+        if keep is not None:
+            doomed.update(ids[:max(len(ids) - keep, 0)])
+        if before is not None:
+            cutoff = f'{before.astimezone(dt_timezone.utc):%Y%m%dT%H%M%S%f}'
+            doomed.update(profile_id for profile_id in ids if profile_id < cutoff)
+        for profile_id in doomed:
+            self.delete(profile_id)
+        return len(doomed)
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import renderers
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Renders a list of flat dicts (or a single dict) as CSV
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        if not rows:
+            return b''
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Renders a list as newline-delimited JSON, one object per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return ''.join(
+            json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows
+        ).encode(self.charset)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed, producing the same compact
+    bytes as DRF's encoder for the catalogue payloads (strings, ints, bools, nulls; decimals and
+    dates arrive as strings). Everything else DRF's encoder handles (datetimes, lazy strings,
+    querysets) still goes through its default(). Indented output, the ASCII/non-strict settings
+    and payloads orjson rejects fall back to JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escapes as JSONRenderer, so the output is valid JavaScript too
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def with_fast_json(renderer_classes=None):
+    """
+    `renderer_classes` (default: DEFAULT_RENDERER_CLASSES) with JSONRenderer swapped for FastJSONRenderer
+    """
+    if renderer_classes is None:
+        renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    return [
+        FastJSONRenderer if renderer is renderers.JSONRenderer else renderer
+        for renderer in renderer_classes
+    ]
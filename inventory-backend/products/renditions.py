@@ -0,0 +1,129 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+from versatileimagefield.image_warmer import VersatileImageFieldWarmer
+from versatileimagefield.utils import build_versatileimagefield_url_set
+from .models import Products
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_IMAGE_RENDITIONS = 'product_image'
+# Formats downsize_upload() re-encodes; others (e.g. animated GIFs) are stored as uploaded
+DOWNSIZE_FORMATS = {'JPEG': {'quality': 90, 'optimize': True}, 'PNG': {'optimize': True}, 'WEBP': {'quality': 90}}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix='renditions'
+        )
+    return _executor
+
+
+def rendition_urls(image, sizes, request=None):
+    """
+    The image's rendition URLs (build_versatileimagefield_url_set). Renditions the warmers have
+    not rendered yet are rendered on demand; if that fails (e.g. the original is missing), the
+    URLs are still returned rather than failing the whole response.
+    """
+    try:
+        return build_versatileimagefield_url_set(image, sizes, request=request)
+    except OSError as e:
+        logger.warning(f"Could not render image renditions for {image.name}: {e}")
+        image.create_on_demand = False
+        return build_versatileimagefield_url_set(image, sizes, request=request)
+
+
+def downsize_upload(upload):
+    """
+    Return the uploaded image scaled down to PRODUCT_IMAGE_MAX_SIZE pixels on its longest side,
+    or `upload` itself when it is small enough already
+    """
+    max_size = getattr(settings, 'PRODUCT_IMAGE_MAX_SIZE', None)
+    if not upload or not max_size:
+        return upload
+    upload.seek(0)
+    with Image.open(upload) as image:
+        save_kwargs = DOWNSIZE_FORMATS.get(image.format)
+        if save_kwargs is None or max(image.size) <= max_size:
+            upload.seek(0)
+            return upload
+        image_format = image.format
+        # Bake in the EXIF rotation, which re-encoding drops
+        resized = ImageOps.exif_transpose(image)
+        resized.thumbnail((max_size, max_size), Image.LANCZOS)
+        if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        output = io.BytesIO()
+        resized.save(output, format=image_format, **save_kwargs)
+    logger.debug(f"Downsized {upload.name} from {image.size} to {resized.size}")
+    return ContentFile(output.getvalue(), name=os.path.basename(upload.name))
+
+
+def warm_product_images(queryset):
+    """
+    Render every PRODUCT_IMAGE_RENDITIONS size for the products in `queryset`
+    """
+    warmer = VersatileImageFieldWarmer(
+        instance_or_queryset=queryset.exclude(ProductImage='').exclude(ProductImage__isnull=True),
+        rendition_key_set=PRODUCT_IMAGE_RENDITIONS,
+        image_attr='ProductImage'
+    )
+    warmed, failed = warmer.warm()
+    for path in failed:
+        logger.error(f"Could not render image renditions for {path}")
+    return warmed, failed
+
+
+def _warm_in_worker(product_pks):
+    try:
+        warmed, failed = warm_product_images(Products.objects.filter(pk__in=product_pks))
+        logger.info(f"Rendered {warmed} image renditions for {len(product_pks)} products")
+        return warmed, failed
+    except Exception:
+        logger.exception("Image rendition warming failed")
+        raise
+    finally:
+        # Worker threads own their connections; don't leave them open between jobs
+        connections.close_all()
+
+
+def schedule_rendition_warming(product):
+    """
+    Pre-render the product's image renditions on the worker pool once the current transaction
+    commits, so the first request showing the image doesn't resize it
+    """
+    if not product.ProductImage:
+        return
+    if not settings.IMAGE_RENDITION_WORKERS:
+        transaction.on_commit(lambda: warm_product_images(Products.objects.filter(pk=product.pk)))
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_warm_in_worker, [product.pk]))
+
+
+def warm_all_product_images(workers, batch_size=100, progress=None):
+    """
+    Re-render every product image in parallel, `batch_size` products per task
+    """
+    pks = list(
+        Products.objects.exclude(ProductImage='').exclude(ProductImage__isnull=True)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    batches = [pks[index:index + batch_size] for index in range(0, len(pks), batch_size)]
+    warmed, failed = 0, []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='renditions') as executor:
+        for batch_warmed, batch_failed in executor.map(_warm_in_worker, batches):
+            warmed += batch_warmed
+            failed.extend(batch_failed)
+            if progress:
+                progress(warmed, len(failed))
+    return warmed, failed
@@ -0,0 +1,184 @@
+import logging
+import re
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from .models import Products, Variant, VariantOption, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'products_search'
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+REINDEX_BATCH_SIZE = 500
+
+# bm25() column weights, in table column order: a code hit outranks a name hit, and so on
+SEARCH_COLUMNS = (('code', 10.0), ('name', 5.0), ('hsn', 2.0), ('skus', 3.0), ('options', 1.0))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# One row per product keyed by rowid = ProductID, so reindexing a product is an indexed delete + insert
+_INDEX_ROWS_SQL = f"""
+    SELECT p."ProductID", p."ProductCode", p."ProductName", COALESCE(p."HSNCode", ''),
+        COALESCE((
+            SELECT group_concat(pv.sku, ' ') FROM {ProductVariant._meta.db_table} pv
+            WHERE pv.product_id = p.id
+        ), ''),
+        COALESCE((
+            SELECT group_concat(vo.value, ' ') FROM {VariantOption._meta.db_table} vo
+            INNER JOIN {Variant._meta.db_table} v ON vo.variant_id = v.id
+            WHERE v.product_id = p.id
+        ), '')
+    FROM {Products._meta.db_table} p
+"""
+
+_search_available = None
+
+
+def create_search_index(conn):
+    """
+    Create the FTS5 table on SQLite. Returns False when the backend or build lacks FTS5,
+    in which case search falls back to LIKE lookups.
+    """
+    if conn.vendor != 'sqlite':
+        return False
+    columns = ', '.join(name for name, _ in SEARCH_COLUMNS)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                f"{columns}, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3 4 5 6 8')"
+            )
+    except OperationalError as e:
+        logger.warning(f"Full-text product search unavailable: {e}")
+        return False
+    return True
+
+
+def drop_search_index(conn):
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+def search_index_available():
+    global _search_available
+    if _search_available is None:
+        _search_available = (
+            connection.vendor == 'sqlite'
+            and SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _search_available
+
+
+def index_products(product_pks):
+    """
+    Rewrite the search rows of the given products (by pk) from the current catalogue
+    """
+    product_pks = list(product_pks)
+    if not product_pks or not search_index_available():
+        return
+    columns = ', '.join(name for name, _ in SEARCH_COLUMNS)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_pks), REINDEX_BATCH_SIZE):
+            batch = [
+                Products._meta.pk.get_db_prep_value(pk, connection)
+                for pk in product_pks[start:start + REINDEX_BATCH_SIZE]
+            ]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                f"(SELECT \"ProductID\" FROM {Products._meta.db_table} WHERE id IN ({placeholders}))",
+                batch
+            )
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}) {_INDEX_ROWS_SQL} WHERE p.id IN ({placeholders})",
+                batch
+            )
+
+
+def unindex_products(product_ids):
+    """
+    Drop the search rows of deleted products, by ProductID
+    """
+    product_ids = list(product_ids)
+    if not product_ids or not search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(product_ids))})",
+            product_ids
+        )
+
+
+def reindex_products_on_commit(product_pks):
+    """
+    Refresh the products' search rows once the current transaction commits
+    """
+    product_pks = set(product_pks)
+    if product_pks and search_index_available():
+        transaction.on_commit(lambda: index_products(product_pks))
+
+
+def rebuild_search_index(conn=None):
+    """
+    Repopulate the whole index with one set-based INSERT ... SELECT; returns the row count
+    """
+    conn = conn or connection
+    columns = ', '.join(name for name, _ in SEARCH_COLUMNS)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} (rowid, {columns}) {_INDEX_ROWS_SQL}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def build_match_query(query):
+    """
+    Turn user input into an FTS5 query: every token must match as a prefix, e.g.
+    'red sh' -> '"red"* "sh"*'. Tokens are quoted so FTS5 syntax in the input is inert.
+    """
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def _fts_search(query, limit):
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ', '.join(str(weight) for _, weight in SEARCH_COLUMNS)
+    with connection.cursor() as cursor:
+        # Every match is scored, so the best ones are found however broad the query; ORDER BY ...
+        # LIMIT only keeps the top `limit` rows in SQLite's sorter rather than sorting them all
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s",
+            [match, limit]
+        )
+        ranked = [row[0] for row in cursor.fetchall()]
+    products = {product.ProductID: product for product in Products.objects.filter(ProductID__in=ranked)}
+    return [products[product_id] for product_id in ranked if product_id in products]
+
+
+def _like_search(query, limit):
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return []
+    condition = Q()
+    for token in tokens:
+        condition &= (
+            Q(ProductCode__icontains=token) | Q(ProductName__icontains=token) | Q(HSNCode__icontains=token)
+            | Q(product_variants__sku__icontains=token) | Q(variants__options__value__icontains=token)
+        )
+    pks = Products.objects.filter(condition).order_by('ProductCode').values_list('pk', flat=True).distinct()[:limit]
+    return list(Products.objects.filter(pk__in=list(pks)).order_by('ProductCode'))
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """
+    Products matching every token of `query` as a prefix of a word in their code, name, HSN code,
+    SKUs or option values, best match first. Uses the FTS5 index when available and falls back
+    to (unranked, unindexed) LIKE lookups otherwise.
+    """
+    if search_index_available():
+        return _fts_search(query, limit)
+    return _like_search(query, limit)
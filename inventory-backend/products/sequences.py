@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Max
+from .models import Products, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class BlockAllocator:
+    """
+    Hands out unique integers from a counter row in the `products_sequence` table.
+
+    Each process reserves a block of `block_size` values with a single atomic
+    `UPDATE ... SET next_value = next_value + n` and serves later calls from memory, so
+    concurrent workers never race on the same value and no MAX() scan is needed. Values left
+    in a block when a process exits are simply skipped, so the sequence may have gaps.
+
+    Blocks are reserved on a helper thread with its own autocommit connection, so a reservation
+    never joins (or holds the counter row locked for) the caller's transaction and survives its
+    rollback, leaving a gap like a database sequence would. Should that connection be unable to
+    write (SQLite while the caller's transaction already holds the write lock), a block is
+    reserved in the caller's transaction instead. That block only serves the rest of the
+    transaction until it commits (a rollback returns its values to the counter), and the helper
+    is not tried again in the same transaction, where it would only wait on the caller's lock.
+    """
+
+    def __init__(self, name, seed, block_size=None):
+        self.name = name
+        self.seed = seed
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+        self._executor = None
+        self._local = threading.local()
+
+    def get_block_size(self):
+        return self.block_size or getattr(settings, 'SEQUENCE_BLOCK_SIZE', 20)
+
+    def _reserve(self, count):
+        with transaction.atomic():
+            updated = Sequence.objects.filter(name=self.name).update(next_value=F('next_value') + count)
+            if not updated:
+                Sequence.objects.get_or_create(name=self.name, defaults={'next_value': self.seed()})
+                Sequence.objects.filter(name=self.name).update(next_value=F('next_value') + count)
+            end = Sequence.objects.filter(name=self.name).values_list('next_value', flat=True).get()
+        return end - count, end
+
+    def _reserve_outside(self, count):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'sequence-{self.name}')
+        return self._executor.submit(self._reserve_and_release, count).result()
+
+    def _reserve_and_release(self, count):
+        try:
+            return self._reserve(count)
+        except DatabaseError:
+            # Leave no broken connection behind for the next reservation
+            connection.close()
+            raise
+
+    def _pending_block(self):
+        """
+        Return the block reserved in the current thread's open transaction, or None once that
+        transaction (or the savepoint it was reserved in) has been rolled back or committed
+        """
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None and not any(entry[1] is pending['commit'] for entry in connection.run_on_commit):
+            pending = self._local.pending = None
+        return pending
+
+    def _reserve_pending(self, size):
+        start, end = self._reserve(size)
+        pending = {'next': start, 'end': end}
+
+        def commit():
+            # The reservation is durable now: later transactions can use what is left of it.
+            # Callbacks run early by tests (captureOnCommitCallbacks) still sit in a transaction.
+            with self._lock:
+                if not connection.in_atomic_block and pending['end'] - pending['next'] > self._end - self._next:
+                    self._next, self._end = pending['next'], pending['end']
+            if self._local.pending is pending:
+                self._local.pending = None
+
+        pending['commit'] = commit
+        transaction.on_commit(commit)
+        self._local.pending = pending
+        return pending
+
+    def allocate(self, count=1):
+        """
+        Return a range of `count` unused values
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse the block its parent was holding
+                self._pid = os.getpid()
+                self._next = self._end = 0
+                self._executor = None
+                self._local = threading.local()
+
+            if self._end - self._next >= count:
+                start = self._next
+                self._next += count
+                return range(start, start + count)
+
+            size = max(count, self.get_block_size())
+            if not connection.in_atomic_block:
+                start, end = self._reserve(size)
+            else:
+                pending = self._pending_block()
+                if pending is None:
+                    try:
+                        start, end = self._reserve_outside(size)
+                    except DatabaseError as e:
+                        logger.debug(f"Reserving {self.name} inside the current transaction: {e}")
+                        pending = self._reserve_pending(size)
+                elif pending['end'] - pending['next'] < count:
+                    pending = self._reserve_pending(size)
+                if pending is not None:
+                    start = pending['next']
+                    pending['next'] += count
+                    return range(start, start + count)
+            self._next, self._end = start + count, end
+            logger.debug(f"Reserved {self.name} block {start}-{end - 1} for process {self._pid}")
+            return range(start, start + count)
+
+    def next_value(self):
+        return self.allocate(1)[0]
+
+    def reset(self):
+        with self._lock:
+            self._next = self._end = 0
+            self._local.pending = None
+
+
+def _next_product_id():
+    return (Products.objects.aggregate(last=Max('ProductID'))['last'] or 0) + 1
+
+
+product_ids = BlockAllocator('products.ProductID', seed=_next_product_id)
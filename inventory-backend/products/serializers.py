@@ -1,5 +1,8 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Products, Variant, VariantOption, ProductVariant, ProductVariantOption, Stock
+from versatileimagefield.serializers import VersatileImageFieldSerializer
+from .models import Job, Products, Variant, VariantOption, ProductVariant, ProductVariantOption, Stock
+from .renditions import downsize_upload, rendition_urls
 from django.contrib.auth import get_user_model
 import logging
 
@@ -33,7 +36,7 @@ class ProductVariantSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ProductVariant
-        fields = ['id', 'product', 'sku', 'options', 'current_stock', 'product_name']
+        fields = ['id', 'product', 'sku', 'is_active', 'options', 'current_stock', 'product_name']
         extra_kwargs = {
             'product': {'required': True},
             'sku': {'required': True}
@@ -77,14 +80,64 @@ class StockSerializer(serializers.ModelSerializer):
         model = Stock
         fields = ['id', 'quantity', 'transaction_type', 'notes', 'created_at']
 
-class ProductSerializer(serializers.ModelSerializer):
+def _split_param(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else None
+
+class SparseFieldsMixin:
+    """
+    Lets a read serializer render only some of its Meta.fields, passed as `fields=`.
+
+    `requested_fields()` turns the ?fields= and ?expand= query parameters (comma separated)
+    into that list. Nested relations in `expandable_fields` are only included when one of the
+    parameters names them, so `?fields=id,ProductName` also skips their queries; with neither
+    parameter every field is rendered as before.
+    """
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, query_params):
+        fields = _split_param(query_params.get('fields'))
+        expand = _split_param(query_params.get('expand'))
+        if fields is None and expand is None:
+            return None
+
+        errors = {}
+        unknown = set(fields or ()) - set(cls.Meta.fields)
+        if unknown:
+            errors['fields'] = f"Unknown fields: {', '.join(sorted(unknown))}."
+        unknown = set(expand or ()) - set(cls.expandable_fields)
+        if unknown:
+            errors['expand'] = (
+                f"Cannot expand: {', '.join(sorted(unknown))}. "
+                f"Expandable fields: {', '.join(cls.expandable_fields)}."
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        selected = set(fields) if fields is not None else set(cls.Meta.fields) - set(cls.expandable_fields)
+        selected.update(expand or ())
+        return [name for name in cls.Meta.fields if name in selected]
+
+class ImageRenditionsField(VersatileImageFieldSerializer):
+    def to_representation(self, value):
+        return rendition_urls(value, self.sizes, request=self.context.get('request'))
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('variants', 'product_variants')
     variants = VariantSerializer(many=True, required=False)
     product_variants = ProductVariantSerializer(many=True, read_only=True)
+    image_renditions = ImageRenditionsField(sizes='product_image', source='ProductImage', read_only=True)
 
     class Meta:
         model = Products
         fields = [
-            'id', 'ProductID', 'ProductCode', 'ProductName', 'ProductImage',
+            'id', 'ProductID', 'ProductCode', 'ProductName', 'ProductImage', 'image_renditions',
             'CreatedDate', 'UpdatedDate', 'CreatedUser', 'IsFavourite', 'Active',
             'HSNCode', 'TotalStock', 'variants', 'product_variants'
         ]
@@ -95,6 +148,10 @@ class ProductSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("ProductCode must be unique.")
         return value
 
+    def validate_ProductImage(self, value):
+        # Renditions are derived from the stored original, so it never needs to exceed the largest
+        return downsize_upload(value)
+
     def create(self, validated_data):
         variants_data = validated_data.pop('variants', [])
         product = Products.objects.create(**validated_data)
@@ -108,6 +165,32 @@ class ProductSerializer(serializers.ModelSerializer):
 
         return product
 
+class ProductSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Products
+        fields = ['id', 'ProductID', 'ProductCode', 'ProductName', 'HSNCode', 'Active']
+
+class SKULookupSerializer(serializers.Serializer):
+    # Serializes ProductVariant.values() rows; the field names match ProductVariantSerializer
+    id = serializers.UUIDField(read_only=True)
+    product = serializers.UUIDField(source='product_id', read_only=True)
+    sku = serializers.CharField(read_only=True)
+    product_name = serializers.CharField(source='product__ProductName', read_only=True)
+    current_stock = serializers.DecimalField(source='stock_balance', max_digits=20, decimal_places=8, read_only=True)
+
+MAX_LOOKUP_SKUS = 500
+MAX_CHECK_CODES = 500
+
+class SKUBatchLookupSerializer(serializers.Serializer):
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=255), allow_empty=False, max_length=MAX_LOOKUP_SKUS
+    )
+
+class ProductCodeCheckSerializer(serializers.Serializer):
+    codes = serializers.ListField(
+        child=serializers.CharField(max_length=255), allow_empty=False, max_length=MAX_CHECK_CODES
+    )
+
 class StockTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Stock
@@ -118,6 +201,21 @@ class StockTransactionSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Quantity must be greater than zero.")
         return data
 
+class StockBatchLineSerializer(serializers.Serializer):
+    product_variant = serializers.UUIDField()
+    quantity = serializers.DecimalField(max_digits=20, decimal_places=8)
+    transaction_type = serializers.ChoiceField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out')])
+    notes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Quantity must be greater than zero.")
+        return value
+
+class StockBatchSerializer(serializers.Serializer):
+    lines = StockBatchLineSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=True)
+
 class StockReportSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product_variant.product.ProductName', read_only=True)
     sku = serializers.CharField(source='product_variant.sku', read_only=True)
@@ -127,4 +225,48 @@ class StockReportSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'product_name', 'sku', 'quantity', 
             'transaction_type', 'notes', 'created_at'
-        ]
\ No newline at end of file
+        ]
+
+class StockReportExportSerializer(serializers.Serializer):
+    start_date = serializers.DateField(required=False, allow_null=True)
+    end_date = serializers.DateField(required=False, allow_null=True)
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+class JobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'result', 'error', 'attempts',
+            'created_at', 'started_at', 'finished_at', 'download'
+        ]
+
+    def get_download(self, job):
+        if not job.output:
+            return None
+        url = reverse('job-download', args=[job.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+class StockBalanceSerializer(serializers.Serializer):
+    product_variant = serializers.UUIDField(source='id', read_only=True)
+    sku = serializers.CharField(read_only=True)
+    balance = serializers.DecimalField(max_digits=20, decimal_places=8, read_only=True)
+
+class StockSummarySerializer(serializers.Serializer):
+    # Only the keys of the requested grouping are present; the others are skipped
+    day = serializers.DateField(read_only=True)
+    product_variant = serializers.UUIDField(read_only=True)
+    sku = serializers.CharField(source='product_variant__sku', read_only=True)
+    product = serializers.UUIDField(source='product_variant__product', read_only=True)
+    product_name = serializers.CharField(source='product_variant__product__ProductName', read_only=True)
+    quantity_in = serializers.DecimalField(max_digits=20, decimal_places=8, read_only=True)
+    quantity_out = serializers.DecimalField(max_digits=20, decimal_places=8, read_only=True)
+    net = serializers.SerializerMethodField()
+    transactions = serializers.IntegerField(read_only=True)
+
+    def get_net(self, row):
+        return serializers.DecimalField(max_digits=20, decimal_places=8).to_representation(
+            row['quantity_in'] - row['quantity_out']
+        )
@@ -0,0 +1,102 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .codes import product_codes
+from .dashboard import invalidate_dashboard_stats
+from .lookups import invalidate_sku_lookups
+from .middleware import install_request_execute_wrappers
+from .models import Products, ProductVariant, ProductVariantOption, Stock, Variant, VariantOption
+from .search import reindex_products_on_commit, unindex_products
+from .versions import catalogue_changed, touch_products
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def stock_changed(sender, **kwargs):
+    invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=Products)
+def product_saved(sender, instance, **kwargs):
+    reindex_products_on_commit([instance.pk])
+    product_codes.add_on_commit([instance.ProductCode])
+
+
+@receiver(post_delete, sender=Products)
+def product_deleted(sender, instance, **kwargs):
+    product_id = instance.ProductID
+    transaction.on_commit(lambda: unindex_products([product_id]))
+    transaction.on_commit(product_codes.discard)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Variant)
+@receiver(post_delete, sender=Variant)
+def product_child_changed(sender, instance, **kwargs):
+    reindex_products_on_commit([instance.product_id])
+    touch_products([instance.product_id])
+
+
+@receiver(post_save, sender=VariantOption)
+@receiver(post_delete, sender=VariantOption)
+def variant_option_changed(sender, instance, **kwargs):
+    product_id = Variant.objects.filter(pk=instance.variant_id).values_list('product_id', flat=True).first()
+    if product_id:
+        reindex_products_on_commit([product_id])
+        touch_products([product_id])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def product_variant_changed(sender, instance, **kwargs):
+    invalidate_sku_lookups(variant_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def stock_row_changed(sender, instance, **kwargs):
+    invalidate_sku_lookups(variant_ids=[instance.product_variant_id])
+    touch_products(ProductVariant.objects.filter(pk=instance.product_variant_id).values('product_id'))
+
+
+@receiver(post_delete, sender=Stock)
+def stock_row_deleted(sender, instance, origin=None, **kwargs):
+    # A row deleted along with its variant (a cascade) leaves no balance or rollup to correct
+    if getattr(origin, 'model', type(origin)) is Stock:
+        instance.remove_from_balances()
+
+
+@receiver(pre_save, sender=Stock)
+def stock_row_moving(sender, instance, **kwargs):
+    # An edited ledger row may move to another variant, whose old balance changes too
+    if not instance._state.adding:
+        variant_ids = list(Stock.objects.filter(pk=instance.pk).values_list('product_variant_id', flat=True))
+        invalidate_sku_lookups(variant_ids=variant_ids)
+        touch_products(ProductVariant.objects.filter(pk__in=variant_ids).values('product_id'))
+
+
+@receiver(post_save, sender=Products)
+def product_lookups_changed(sender, instance, **kwargs):
+    invalidate_sku_lookups(product_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def catalogue_product_changed(sender, **kwargs):
+    # Products.save() sets UpdatedDate itself
+    catalogue_changed()
+
+
+@receiver(post_save, sender=ProductVariantOption)
+@receiver(post_delete, sender=ProductVariantOption)
+def product_variant_option_changed(sender, instance, **kwargs):
+    touch_products(ProductVariant.objects.filter(pk=instance.product_variant_id).values('product_id'))
+
+
+connection_created.connect(install_request_execute_wrappers)
@@ -0,0 +1,109 @@
+import glob
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.utils import timezone
+
+logger = logging.getLogger('products.slow_queries')
+
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+_state = threading.local()
+
+
+def explain(connection, sql, params):
+    """
+    Return the plan the database reports for a statement, one line per plan row.
+
+    The EXPLAIN runs on a fresh raw DB-API cursor so it bypasses every execute wrapper
+    and leaves the caller's cursor and result set untouched.
+    """
+    if not sql.lstrip()[:6].upper().startswith(EXPLAINABLE):
+        return None
+    _state.explaining = True
+    try:
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        _state.explaining = False
+
+
+class SlowQueryLogger:
+    """
+    Execute wrapper that logs statements slower than `threshold_ms` with their query plan.
+
+    `source` is a callable naming where the query came from (e.g. the resolved view); it is
+    only called for slow queries, after the view has been resolved.
+    """
+    def __init__(self, threshold_ms, source=None):
+        self.threshold = threshold_ms / 1000
+        self.source = source
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'explaining', False):
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if duration >= self.threshold:
+                self.log(context['connection'], sql, params, many, duration)
+
+    def log(self, connection, sql, params, many, duration):
+        # executemany is explained with its first parameter set
+        explain_params = (params[0] if params else None) if many else params
+        logger.warning(json.dumps({
+            'timestamp': timezone.now().isoformat(),
+            'source': self.source() if self.source else None,
+            'duration_ms': round(duration * 1000, 3),
+            'sql': sql,
+            'params': explain_params,
+            'many': many,
+            'plan': explain(connection, sql, explain_params),
+        }, default=str))
+
+
+def read_slow_queries(path):
+    """
+    Yield logged slow-query records from the log file and its rotated backups
+    """
+    for filename in sorted(glob.glob(f'{glob.escape(str(path))}*')):
+        with open(filename, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize_slow_queries(records, top=10):
+    """
+    Group records by SQL text and return the `top` statements by total time spent
+    """
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sources': set(), 'plan': None})
+    for record in records:
+        group = groups[record['sql']]
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        if record['source']:
+            group['sources'].add(record['source'])
+        if record['duration_ms'] >= group['max_ms']:
+            group['max_ms'] = record['duration_ms']
+            group['plan'] = record.get('plan')
+
+    summary = [
+        dict(group, sql=sql, mean_ms=group['total_ms'] / group['count'], sources=sorted(group['sources']))
+        for sql, group in groups.items()
+    ]
+    summary.sort(key=lambda group: group['total_ms'], reverse=True)
+    return summary[:top]
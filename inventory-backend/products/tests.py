@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 # Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .models import (
+    Job, Products, ProductVariant, ProductVariantOption, Variant, VariantOption, Stock, StockDailyRollup, StockSnapshot,
+    Sequence
+)
+from . import renderers
+from .benchmarks import BENCHMARK_CODE_PREFIX, seed_inventory
+from .codes import product_codes
+from .importers import import_catalogue
+from .jobs import JobWorker, enqueue
+from .ledger import balances_as_of, post_stock_batch, rebuild_stock_balances, take_stock_snapshots
+from .lookups import sku_cache
+from .metrics import request_metrics
+from .profiling import ProfileStore, RequestProfiler
+from .search import index_products
+from .sequences import product_ids
+from .slowlog import SlowQueryLogger, summarize_slow_queries
+from .utils import generate_product_variants
+
+User = get_user_model()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every read endpoint must run in a fixed number of queries, however many products it returns
+    """
+    SIZES = (1, 10, 100)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def create_products(self, count):
+        start = Products.objects.count()
+        for index in range(start, start + count):
+            product = Products.objects.create(
+                ProductCode=f'P{index:04d}',
+                ProductName=f'Product {index}',
+                CreatedUser=self.user
+            )
+            for name, values in (('Size', ('S', 'M')), ('Colour', ('Red', 'Blue'))):
+                variant = Variant.objects.create(product=product, name=name)
+                VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in values])
+            for product_variant in generate_product_variants(product):
+                Stock.objects.create(product_variant=product_variant, quantity=5, transaction_type='IN')
+
+    def assertQueryBudget(self, budget, url):
+        for size in self.SIZES:
+            with self.subTest(products=size):
+                self.create_products(size - Products.objects.count())
+                cache.clear()
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_product_list(self):
+        # catalogue version, count, products, variants, variant options, product variants,
+        # product variant options
+        self.assertQueryBudget(7, '/api/products/?page_size=100')
+
+    def test_product_list_cursor(self):
+        self.assertQueryBudget(6, '/api/products/?cursor=&page_size=100')
+
+    def test_product_list_sparse(self):
+        # catalogue version, count, products: unrequested relations are not prefetched
+        self.assertQueryBudget(3, '/api/products/?page_size=100&fields=id,ProductName,ProductCode,ProductImage,TotalStock')
+
+    def test_product_list_expand(self):
+        # catalogue version, count, products, variants, variant options
+        self.assertQueryBudget(5, '/api/products/?page_size=100&fields=id,ProductName&expand=variants')
+
+    def test_product_detail(self):
+        self.create_products(1)
+        product = Products.objects.get()
+        # product version, then the product and its nested prefetches
+        self.assertQueryBudget(6, f'/api/products/{product.pk}/')
+
+    def test_product_variant_list(self):
+        # catalogue version, count, product variants joined to product, product variant options
+        self.assertQueryBudget(4, '/api/product-variants/?page_size=100')
+
+    def test_stock_report(self):
+        self.assertQueryBudget(1, '/api/stock/report/')
+
+    def test_dashboard_stats(self):
+        # variant aggregate, recent transactions, product count
+        self.assertQueryBudget(3, '/api/stock/dashboard_stats/')
+
+    def test_dashboard_stats_cached(self):
+        self.create_products(10)
+        self.client.get('/api/stock/dashboard_stats/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/stock/dashboard_stats/')
+
+
+class ProductIDAllocatorTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='allocator', password='secret')
+        product_ids.reset()
+
+    def test_products_get_unique_increasing_ids(self):
+        ids = [
+            Products.objects.create(ProductCode=f'A{index}', ProductName='A', CreatedUser=self.user).ProductID
+            for index in range(5)
+        ]
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_block_is_served_from_memory(self):
+        product_ids.next_value()
+        with self.assertNumQueries(0):
+            product_ids.next_value()
+
+    def test_block_survives_rolled_back_transaction(self):
+        try:
+            with transaction.atomic():
+                rolled_back = product_ids.next_value()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        # The block was reserved outside the transaction: its rolled back value is a gap, not reused
+        self.assertEqual(Sequence.objects.get(name=product_ids.name).next_value, rolled_back + settings.SEQUENCE_BLOCK_SIZE)
+        with self.assertNumQueries(0):
+            self.assertEqual(product_ids.allocate(3)[0], rolled_back + 1)
+
+    def test_creates_in_a_transaction_share_the_block(self):
+        with transaction.atomic():
+            first = Products.objects.create(ProductCode='T1', ProductName='T', CreatedUser=self.user)
+            with CaptureQueriesContext(connection) as queries:
+                second = Products.objects.create(ProductCode='T2', ProductName='T', CreatedUser=self.user)
+        self.assertEqual([query['sql'] for query in queries if 'products_sequence' in query['sql']], [])
+        self.assertEqual(second.ProductID, first.ProductID + 1)
+
+    def test_helper_is_tried_once_per_locked_transaction(self):
+        reserve_outside = mock.patch.object(product_ids, '_reserve_outside', wraps=product_ids._reserve_outside)
+        with reserve_outside as helper, transaction.atomic():
+            # Holding the write lock leaves the helper's connection unable to reserve a block
+            User.objects.create_user(username='writer', password='secret')
+            ids = [
+                Products.objects.create(ProductCode=f'L{index}', ProductName='L', CreatedUser=self.user).ProductID
+                for index in range(settings.SEQUENCE_BLOCK_SIZE + 5)
+            ]
+        self.assertEqual(helper.call_count, 1)
+        self.assertEqual(ids, list(range(ids[0], ids[0] + len(ids))))
+        # What is left of the committed block serves later transactions
+        with self.assertNumQueries(0):
+            self.assertEqual(product_ids.next_value(), ids[-1] + 1)
+
+    def test_block_reserved_in_rolled_back_transaction_is_dropped(self):
+        try:
+            with transaction.atomic():
+                User.objects.create_user(username='writer', password='secret')
+                rolled_back = product_ids.next_value()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(product_ids.next_value(), rolled_back)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='metrics', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        request_metrics.reset()
+
+    def test_view_latency_and_queries_are_exported(self):
+        self.client.get('/api/products/')
+        self.client.generic('BREW', '/api/products/')
+        self.client.force_authenticate(User.objects.create_user(username='metrics-staff', is_staff=True))
+        body = self.client.get('/api/metrics').content.decode()
+        self.assertIn('inventory_responses_total{view="products-list",method="other",status="405"} 1', body)
+        self.assertIn('inventory_request_queries_count{view="products-list",method="GET"} 1', body)
+        self.assertIn('inventory_responses_total{view="products-list",method="GET",status="200"} 1', body)
+        self.assertIn('# TYPE inventory_request_duration_seconds histogram', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_need_staff_or_token(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics').status_code, 401)
+        scraper = APIClient(HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(scraper.get('/api/metrics').status_code, 200)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/products/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+
+class SlowQueryLogTests(TestCase):
+    def test_slow_query_is_logged_with_its_plan(self):
+        with self.assertLogs('products.slow_queries', level='WARNING') as logs:
+            with connection.execute_wrapper(SlowQueryLogger(0, source=lambda: 'test')):
+                list(Products.objects.filter(ProductCode='missing'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['source'], 'test')
+        self.assertEqual(record['params'], ['missing'])
+        self.assertTrue(record['plan'])
+        self.assertEqual(summarize_slow_queries([record])[0]['count'], 1)
+
+
+@override_settings(PROFILING_HEADER='X-Profile', PROFILING_TOKEN='profile-secret')
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(PROFILE_DIR=directory.name, PROFILE_STORE_MAX=2)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.store = ProfileStore()
+
+    def get(self, is_staff, header='1'):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username=f'user{is_staff}', is_staff=is_staff))
+        return client.get('/api/products/', HTTP_X_PROFILE=header)
+
+    def test_only_staff_are_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.get(is_staff=False))
+        self.assertNotIn('X-Profile-Id', APIClient().get('/api/products/', HTTP_X_PROFILE='1'))
+        self.assertEqual(self.store.ids(), [])
+        profile_id = self.get(is_staff=True)['X-Profile-Id']
+        self.assertEqual(self.store.ids(), [profile_id])
+        self.assertEqual(self.store.metadata(profile_id)['view'], 'products-list')
+        self.assertIn('function calls', self.store.report(profile_id))
+
+    def test_shared_token_allows_profiling(self):
+        self.assertIn('X-Profile-Id', self.get(is_staff=False, header='profile-secret'))
+
+    @override_settings(PROFILING_HEADER=None)
+    def test_off_by_default(self):
+        self.assertNotIn('X-Profile-Id', self.get(is_staff=True))
+
+    def test_store_is_bounded(self):
+        for _ in range(3):
+            with RequestProfiler() as profiler:
+                sum(range(10))
+            self.store.save(profiler.profile, {})
+        self.assertEqual(len(self.store.ids()), 2)
+
+
+class AsyncReadEndpointTests(QueryBudgetTests):
+    """
+    The async read endpoints return exactly what the DRF endpoints do, within the same budgets
+    plus the token lookup
+    """
+    def setUp(self):
+        super().setUp()
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.user).key}'}
+
+    async def async_get(self, url):
+        return await self.async_client.get(url, headers=self.headers)
+
+    async def assertSameResponse(self, path):
+        expected = await sync_to_async(self.client.get)(f'/api/{path}')
+        response = await self.async_get(f'/api/async/{path}')
+        self.assertEqual(response.status_code, 200)
+        # Pagination links point back at the async endpoint
+        self.assertEqual(response.content, expected.content.replace(b'/api/', b'/api/async/'))
+
+    async def test_async_responses_match(self):
+        await sync_to_async(self.create_products)(3)
+        product = await Products.objects.afirst()
+        for path in (
+            'products/', f'products/{product.pk}/', 'products/?fields=id,ProductName&expand=variants',
+            'product-variants/', 'stock/report/', 'stock/dashboard_stats/',
+        ):
+            with self.subTest(path=path):
+                await self.assertSameResponse(path)
+
+    async def test_async_requires_authentication(self):
+        response = await self.async_client.get('/api/async/products/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def assertQueryBudget(self, budget, url):
+        # One extra query resolves the token
+        for size in self.SIZES:
+            with self.subTest(products=size):
+                self.create_products(size - Products.objects.count())
+                cache.clear()
+                with self.assertNumQueries(budget + 1):
+                    response = async_to_sync(self.async_get)(url.replace('/api/', '/api/async/', 1))
+                self.assertEqual(response.status_code, 200)
+
+    def test_product_list_cursor(self):
+        self.assertQueryBudget(6, '/api/products/?cursor=&page_size=100')
+
+
+@override_settings(FAST_READ_PAYLOADS=False)
+class SerializerReadPathTests(QueryBudgetTests):
+    """
+    The ModelSerializer read path keeps the same budgets and renders exactly what
+    products.payloads builds for JSON
+    """
+    def test_fast_payloads_match_serializers(self):
+        self.create_products(3)
+        product, other = Products.objects.all()[:2]
+        Products.objects.filter(pk=product.pk).update(
+            ProductImage='uploads/shirt.jpg', ProductName='Shïrt \u2028 "tee"', TotalStock=None
+        )
+        Stock.objects.create(
+            product_variant=other.product_variants.first(), quantity=Decimal('2.5'), transaction_type='OUT', notes='Ünïcode'
+        )
+        variant = other.product_variants.first()
+        for url in (
+            '/api/products/', '/api/products/?page=2&page_size=2', '/api/products/?cursor=&page_size=2',
+            f'/api/products/{product.pk}/', f'/api/products/{other.pk}/', '/api/products/not-a-uuid/',
+            '/api/product-variants/', f'/api/product-variants/?product_id={product.pk}',
+            '/api/product-variants/?cursor=&page_size=5', f'/api/product-variants/{variant.pk}/',
+            '/api/stock/report/', '/api/stock/report/?cursor=&page_size=5',
+            '/api/products/?fields=ProductName,id,ProductImage', '/api/products/?expand=product_variants',
+            f'/api/products/{product.pk}/?fields=ProductCode&expand=variants', '/api/products/?fields=Nope',
+        ):
+            with self.subTest(url=url):
+                expected = self.client.get(url)
+                with override_settings(FAST_READ_PAYLOADS=True):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response.content, expected.content)
+
+    @skipUnless(renderers.orjson, "orjson is not installed")
+    def test_fast_json_renderer_matches_json_renderer(self):
+        data = {
+            'id': uuid.uuid4(), 'amount': Decimal('1.50'), 'at': timezone.now(), 'day': date(2026, 1, 2),
+            'text': 'line\u2028sep\u2029 \x00 "quoted" ünï 🚀', 'nested': [OrderedDict(a=1, b=None), (True, False)],
+            1: 'int key',
+        }
+        # Integers orjson cannot encode fall back to JSONRenderer
+        for payload in (data, {'big': 2 ** 70}):
+            self.assertEqual(renderers.FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+
+
+# versatileimagefield resizes with Image.ANTIALIAS, which Pillow 10 removed
+renders_images = skipUnless(hasattr(Image, 'ANTIALIAS'), "versatileimagefield needs Image.ANTIALIAS (Pillow < 10)")
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=media.name, IMAGE_RENDITION_WORKERS=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        # versatileimagefield remembers which renditions exist in the cache, across media roots
+        cache.clear()
+        self.user = User.objects.create_user(username='images', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, size=(800, 600)):
+        image = io.BytesIO()
+        Image.new('RGB', size, 'red').save(image, 'JPEG')
+        image.seek(0)
+        image.name = 'photo.jpg'
+        return image
+
+    @renders_images
+    def test_renditions_are_rendered_after_create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/', {
+                'ProductCode': 'IMG1', 'ProductName': 'Image', 'variants': '[]', 'ProductImage': self.upload()
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        renditions = response.json()['image_renditions']
+        self.assertEqual(set(renditions), {'full_size', 'list_thumbnail', 'detail', 'zoom'})
+
+        product = Products.objects.get()
+        for size in ('160x160', '600x600', '1600x1600'):
+            self.assertTrue(product.ProductImage.storage.exists(product.ProductImage.thumbnail[size].name), size)
+
+    @renders_images
+    def test_missing_renditions_are_rendered_on_demand(self):
+        # e.g. images uploaded before renditions were pre-rendered
+        product = Products.objects.create(ProductCode='IMG2', ProductName='Image', CreatedUser=self.user)
+        product.ProductImage.save('old.jpg', ContentFile(self.upload().getvalue()))
+        product.ProductImage.create_on_demand = False
+        thumbnail = product.ProductImage.thumbnail['160x160'].name
+        self.assertFalse(product.ProductImage.storage.exists(thumbnail))
+        response = self.client.get(f'/api/products/{product.pk}/')
+        self.assertTrue(response.json()['image_renditions']['list_thumbnail'].endswith(thumbnail))
+        self.assertTrue(product.ProductImage.storage.exists(thumbnail))
+
+    def test_large_uploads_are_downsized(self):
+        for code, size, stored in (('BIG', (3200, 2000), (1600, 1000)), ('SMALL', (800, 600), (800, 600))):
+            response = self.client.post('/api/products/', {
+                'ProductCode': code, 'ProductName': 'Image', 'variants': '[]', 'ProductImage': self.upload(size)
+            }, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            with Image.open(Products.objects.get(ProductCode=code).ProductImage) as image:
+                self.assertEqual(image.size, stored)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='search', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for code, name in (('SHIRT1', 'Red cotton shirt'), ('SHOE2', 'Running shoe'), ('SHIRTX', 'Blue shirt')):
+                product = Products.objects.create(ProductCode=code, ProductName=name, CreatedUser=self.user)
+                variant = Variant.objects.create(product=product, name='Colour')
+                VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('Crimson', 'Navy')])
+                generate_product_variants(product)
+            Products.objects.create(ProductCode='NAVY1', ProductName='Navy blazer', CreatedUser=self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['ProductCode'] for product in response.json()]
+
+    def test_prefix_matching_and_ranking(self):
+        self.assertCountEqual(self.search('shi'), ['SHIRT1', 'SHIRTX'])
+        # a code or name hit outranks option values
+        self.assertEqual(self.search('nav')[0], 'NAVY1')
+        self.assertEqual(len(self.search('nav')), 4)
+        self.assertEqual(self.search('shirt re'), ['SHIRT1'])
+        self.assertEqual(self.search('SHOE2-Nav'), ['SHOE2'])
+        self.assertEqual(self.search('"shoe'), ['SHOE2'])
+        self.assertEqual(self.search('zzz'), [])
+        self.assertEqual(self.client.get('/api/products/search/').status_code, 400)
+
+    def test_best_match_is_found_among_many_matches(self):
+        # Enough weak matches that ranking only the first ones by rowid would miss the best
+        fillers = [
+            Products(ProductID=1000 + index, ProductCode=f'FILL{index}', ProductName='Navy filler', CreatedUser=self.user)
+            for index in range(1500)
+        ]
+        best = Products(ProductID=9000, ProductCode='NAVY9', ProductName='Navy navy', CreatedUser=self.user)
+        Products.objects.bulk_create([*fillers, best])
+        index_products([product.pk for product in [*fillers, best]])
+        self.assertEqual(self.search('navy')[:2], ['NAVY9', 'NAVY1'])
+
+    def test_index_follows_catalogue_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product_variant = Products.objects.get(ProductCode='SHOE2').product_variants.first()
+            product_variant.sku = 'ZEBRA-1'
+            product_variant.save()
+            Products.objects.get(ProductCode='SHIRTX').delete()
+        self.assertEqual(self.search('zebra'), ['SHOE2'])
+        self.assertEqual(self.search('shirt'), ['SHIRT1'])
+
+
+class SKULookupTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='scanner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Products.objects.create(ProductCode='SCAN1', ProductName='Scanner', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        self.small, self.medium = generate_product_variants(product)
+        Stock.objects.create(product_variant=self.small, quantity=5, transaction_type='IN')
+        sku_cache.clear()
+
+    def test_lookup_is_cached_until_stock_changes(self):
+        url = f'/api/product-variants/by-sku/{self.small.sku}/'
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {
+            'id': str(self.small.pk), 'product': str(self.small.product_id), 'sku': self.small.sku,
+            'product_name': 'Scanner', 'current_stock': '5.00000000'
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()['current_stock'], '5.00000000')
+
+        self.client.post('/api/stock/remove_stock/', {'product_variant': self.small.pk, 'quantity': 2, 'transaction_type': 'OUT'})
+        self.assertEqual(self.client.get(url).json()['current_stock'], '3.00000000')
+
+        post_stock_batch([{'product_variant': self.small.pk, 'quantity': 1, 'transaction_type': 'IN'}])
+        self.assertEqual(self.client.get(url).json()['current_stock'], '4.00000000')
+        self.assertEqual(self.client.get('/api/product-variants/by-sku/NOPE/').status_code, 404)
+
+    def test_bulk_lookup(self):
+        skus = [self.medium.sku, 'NOPE', self.small.sku, self.medium.sku]
+        response = self.client.post('/api/product-variants/by-skus/', {'skus': skus}, format='json')
+        self.assertEqual([entry['sku'] for entry in response.json()['results']], [self.medium.sku, self.small.sku])
+        self.assertEqual(response.json()['missing'], ['NOPE'])
+        self.assertEqual(len(sku_cache), 2)
+
+        self.medium.sku = 'RENAMED'
+        self.medium.save()
+        response = self.client.post('/api/product-variants/by-skus/', {'skus': skus}, format='json')
+        self.assertEqual(response.json()['missing'], [skus[0], 'NOPE'])
+        self.assertEqual(self.client.post('/api/product-variants/by-skus/', {'skus': []}, format='json').status_code, 400)
+
+    def test_retired_skus_stop_resolving(self):
+        url = f'/api/product-variants/by-sku/{self.medium.sku}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(sku_cache), 1)
+
+        VariantOption.objects.filter(value='M').delete()
+        generate_product_variants(self.small.product, deactivate_orphans=True)
+        self.assertEqual(len(sku_cache), 0)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.post('/api/product-variants/by-skus/', {'skus': [self.medium.sku]}, format='json')
+        self.assertEqual(response.json()['missing'], [self.medium.sku])
+
+
+class ProductCodeCheckTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='codes', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index in range(3):
+            Products.objects.create(ProductCode=f'TAKEN{index}', ProductName='Taken', CreatedUser=self.user)
+        product_codes.reset()
+
+    def check(self, codes):
+        response = self.client.post('/api/products/check-codes/', {'codes': codes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['exists']
+
+    def test_batch_check_uses_one_query(self):
+        free = [f'FREE{index}' for index in range(300)]
+        self.check(['TAKEN0'])
+        with self.assertNumQueries(1):
+            exists = self.check(['TAKEN0', 'TAKEN2'] + free)
+        self.assertEqual({code for code, taken in exists.items() if taken}, {'TAKEN0', 'TAKEN2'})
+        self.assertEqual(len(exists), 302)
+        # Codes the filter rules out need no query at all
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/products/check-code/', {'code': 'FREE1'}).json(), {'exists': False})
+
+    def test_filter_follows_creates(self):
+        self.assertEqual(self.check(['NEW1']), {'NEW1': False})
+        Products.objects.create(ProductCode='NEW1', ProductName='New', CreatedUser=self.user)
+        self.assertEqual(self.check(['NEW1']), {'NEW1': True})
+        self.assertEqual(self.client.get('/api/products/check-code/', {'code': 'NEW1'}).json(), {'exists': True})
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sparse', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Products.objects.create(ProductCode='SPARSE1', ProductName='Sparse', CreatedUser=self.user)
+        variant = Variant.objects.create(product=self.product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        generate_product_variants(self.product)
+
+    def get_product(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results'][0]
+
+    def test_fields_select_plain_fields_in_serializer_order(self):
+        product = self.get_product('fields=TotalStock,ProductName,id')
+        self.assertEqual(list(product), ['id', 'ProductName', 'TotalStock'])
+
+    def test_expand_adds_only_named_relations(self):
+        product = self.get_product('expand=product_variants')
+        self.assertIn('ProductCode', product)
+        self.assertNotIn('variants', product)
+        self.assertEqual([sku['sku'] for sku in product['product_variants']], ['SPARSE1-M', 'SPARSE1-S'])
+
+        product = self.get_product('fields=id&expand=variants')
+        self.assertEqual(list(product), ['id', 'variants'])
+        self.assertEqual([option['value'] for option in product['variants'][0]['options']], ['S', 'M'])
+
+    def test_without_parameters_everything_is_rendered(self):
+        product = self.get_product('')
+        self.assertIn('variants', product)
+        self.assertIn('product_variants', product)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/products/?fields=id,Price&expand=ProductName')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+
+    def test_writes_ignore_fieldsets(self):
+        response = self.client.post('/api/products/?fields=id', {
+            'ProductCode': 'SPARSE2', 'ProductName': 'Sparse 2', 'variants': '[]'
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn('variants', response.json())
+
+
+class BackgroundJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.settings_override = override_settings(JOB_FILES_ROOT=media.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username='jobs', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Products.objects.create(ProductCode='JOB1', ProductName='Job', CreatedUser=self.user)
+        for name, values in (('Size', ('S', 'M', 'L')), ('Colour', ('Red', 'Blue'))):
+            variant = Variant.objects.create(product=self.product, name=name)
+            VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in values])
+
+    def run_jobs(self):
+        JobWorker(name='test').run(burst=True)
+
+    def assertJobSucceeded(self, response):
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['status'], Job.QUEUED)
+        self.run_jobs()
+        job = self.client.get(response['Location'])
+        self.assertEqual(job.status_code, 200)
+        self.assertEqual(job.json()['status'], Job.SUCCEEDED, job.json()['error'])
+        return job.json()
+
+    def test_generate_variants_in_background(self):
+        job = self.assertJobSucceeded(
+            self.client.post(f'/api/products/{self.product.pk}/generate_variants/?background=true')
+        )
+        self.assertEqual(job['result'], {'product': str(self.product.pk), 'skus': 6})
+        self.assertEqual(job['progress'], {'skus': 6, 'total': 6})
+        self.assertEqual(self.product.product_variants.count(), 6)
+
+    def test_import_in_background(self):
+        upload = SimpleUploadedFile(
+            'catalogue.csv', b'ProductCode,ProductName,Variants\nJOB2,Imported,Size:S|M\n', content_type='text/csv'
+        )
+        job = self.assertJobSucceeded(self.client.post('/api/products/import/?background=true', {'file': upload}))
+        self.assertEqual(job['result']['products'], 1)
+        self.assertEqual(Products.objects.get(ProductCode='JOB2').product_variants.count(), 2)
+
+    def test_job_files_are_private(self):
+        upload = SimpleUploadedFile(
+            'catalogue.csv', b'ProductCode,ProductName,Variants\nJOB3,Imported,Size:S\n', content_type='text/csv'
+        )
+        response = self.client.post('/api/products/import/?background=true', {'file': upload})
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertNotIn('catalogue', job.input.name)
+        self.assertTrue(job.input.path.startswith(settings.JOB_FILES_ROOT))
+        with self.assertRaises(ValueError):
+            job.input.url
+        path = job.input.path
+        self.run_jobs()
+        job.refresh_from_db()
+        # The upload is removed once the job has run
+        self.assertEqual((job.status, job.input.name), (Job.SUCCEEDED, ''))
+        self.assertFalse(os.path.exists(path))
+
+    def test_stock_report_export(self):
+        small = generate_product_variants(self.product)[0]
+        Stock.objects.create(product_variant=small, quantity=4, transaction_type='IN')
+        today = timezone.localdate()
+        job = self.assertJobSucceeded(self.client.post('/api/stock/report/export/', {
+            'start_date': today.isoformat(), 'end_date': today.isoformat()
+        }, format='json'))
+        self.assertEqual(job['result'], {'rows': 1, 'format': 'csv'})
+        download = self.client.get(job['download'])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn(f'filename="stock-report-{job["id"]}.csv"', download['Content-Disposition'])
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,product_name,sku,quantity,transaction_type,notes,created_at')
+        self.assertIn(small.sku, lines[1])
+
+    def test_failed_job_records_error(self):
+        job = enqueue('generate_variants', {'product': str(uuid.uuid4())}, user=self.user)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.FAILED, "The product no longer exists."))
+
+    def test_jobs_of_unresponsive_workers_are_requeued(self):
+        stale = timezone.now() - timedelta(minutes=5)
+        retried = enqueue('generate_variants', {'product': str(self.product.pk)}, user=self.user)
+        given_up = enqueue('generate_variants', {'product': str(self.product.pk)}, user=self.user)
+        Job.objects.filter(pk=retried.pk).update(status=Job.RUNNING, heartbeat_at=stale, attempts=1)
+        Job.objects.filter(pk=given_up.pk).update(status=Job.RUNNING, heartbeat_at=stale, attempts=3)
+        self.run_jobs()
+        retried.refresh_from_db()
+        given_up.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), (Job.SUCCEEDED, 2))
+        self.assertEqual(given_up.status, Job.FAILED)
+
+    def test_jobs_of_live_workers_are_not_requeued(self):
+        # A worker on this host whose heartbeat is held up, e.g. behind its task's write transaction
+        stale = timezone.now() - timedelta(minutes=5)
+        job = enqueue('generate_variants', {'product': str(self.product.pk)}, user=self.user)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, heartbeat_at=stale, attempts=1, worker=f'{socket.gethostname()}:{os.getpid()}'
+        )
+        JobWorker(name='test').requeue_stale()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        Job.objects.filter(pk=job.pk).update(worker=f'{socket.gethostname()}:{exited.pid}')
+        JobWorker(name='test').requeue_stale()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+
+    def test_worker_survives_database_errors(self):
+        class LockedOnce(JobWorker):
+            locked = True
+
+            def requeue_stale(self):
+                if self.locked:
+                    self.locked = False
+                    raise OperationalError("database is locked")
+                super().requeue_stale()
+
+        job = enqueue('generate_variants', {'product': str(self.product.pk)}, user=self.user)
+        LockedOnce(name='test', poll_interval=0).run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+
+    def test_users_only_see_their_own_jobs(self):
+        job = enqueue('generate_variants', {'product': str(self.product.pk)}, user=self.user)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', password='secret'))
+        self.assertEqual(other.get(f'/api/jobs/{job.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/jobs/').json()['count'], 1)
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='etags', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Products.objects.create(ProductCode='ETAG1', ProductName='ETag', CreatedUser=self.user)
+            variant = Variant.objects.create(product=self.product, name='Size')
+            VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+            self.small, _ = generate_product_variants(self.product)
+
+    def assertNotModified(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        return response['ETag']
+
+    def test_unchanged_catalogue_is_not_modified(self):
+        for url in ('/api/products/', f'/api/products/{self.product.pk}/', '/api/product-variants/'):
+            with self.subTest(url=url):
+                self.assertNotModified(url)
+
+    def test_stock_change_invalidates_validators(self):
+        detail = f'/api/products/{self.product.pk}/'
+        etags = {url: self.assertNotModified(url) for url in ('/api/products/', detail)}
+        with self.captureOnCommitCallbacks(execute=True):
+            Stock.objects.create(product_variant=self.small, quantity=3, transaction_type='IN')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_edits_within_one_second_are_not_hidden_by_if_modified_since(self):
+        detail = f'/api/products/{self.product.pk}/'
+        second = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+        def edit_and_get(edited, requested, **headers):
+            Products.objects.filter(pk=self.product.pk).update(UpdatedDate=second + edited)
+            with mock.patch('products.versions.timezone.now', return_value=second + requested):
+                return self.client.get(detail, **headers)
+
+        first = edit_and_get(timedelta(milliseconds=300), timedelta(milliseconds=500))
+        self.assertEqual(first.status_code, 200)
+        # A second edit within the same second would get the same date
+        self.assertNotIn('Last-Modified', first)
+        stale = http_date(second.timestamp())
+        response = edit_and_get(timedelta(milliseconds=800), timedelta(milliseconds=900), HTTP_IF_MODIFIED_SINCE=stale)
+        self.assertEqual(response.status_code, 200)
+
+        # Once the second is over the date is a validator
+        response = edit_and_get(timedelta(milliseconds=800), timedelta(seconds=2))
+        self.assertEqual(response['Last-Modified'], stale)
+        response = edit_and_get(timedelta(milliseconds=800), timedelta(seconds=3), HTTP_IF_MODIFIED_SINCE=stale)
+        self.assertEqual(response.status_code, 304)
+
+
+class VariantRegenerationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='regen', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Products.objects.create(ProductCode='REGEN', ProductName='Regen', CreatedUser=self.user)
+        self.size = Variant.objects.create(product=self.product, name='Size')
+        self.colour = Variant.objects.create(product=self.product, name='Colour')
+        VariantOption.objects.bulk_create([VariantOption(variant=self.size, value=value) for value in ('S', 'M')])
+        VariantOption.objects.bulk_create([VariantOption(variant=self.colour, value=value) for value in ('Red', 'Blue')])
+        generate_product_variants(self.product)
+
+    def skus(self, **filters):
+        return set(self.product.product_variants.filter(**filters).values_list('sku', flat=True))
+
+    def test_regenerating_creates_nothing(self):
+        # Axes, the existing SKUs and their links, and the empty transaction's savepoint; nothing written
+        with self.assertNumQueries(6):
+            self.assertEqual(generate_product_variants(self.product), [])
+        response = self.client.post(f'/api/products/{self.product.pk}/generate_variants/')
+        self.assertEqual((response.status_code, response.json()), (201, []))
+        self.assertEqual(self.product.product_variants.count(), 4)
+
+    def test_query_count_does_not_grow_with_the_option_matrix(self):
+        def insert_batches(model, rows):
+            # bulk_create splits its INSERTs to stay under the backend's query parameter limit
+            fields = [field for field in model._meta.concrete_fields]
+            size = connection.ops.bulk_batch_size(fields, [None] * rows) or rows
+            return -(-rows // size)
+
+        for options in (2, 5, 10):
+            with self.subTest(options=options):
+                product = Products.objects.create(ProductCode=f'MATRIX{options}', ProductName='Matrix', CreatedUser=self.user)
+                for name in ('Size', 'Colour', 'Fit'):
+                    variant = Variant.objects.create(product=product, name=name)
+                    VariantOption.objects.bulk_create([VariantOption(variant=variant, value=f'{value}') for value in range(options)])
+                with CaptureQueriesContext(connection) as queries:
+                    created = generate_product_variants(product)
+                self.assertEqual(len(created), options ** 3)
+                inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+                # Axes, options, existing links and SKUs, the savepoint and its release, and the version bump
+                self.assertEqual(len(queries) - len(inserts), 7)
+                self.assertEqual(len(inserts), (
+                    insert_batches(ProductVariant, options ** 3)
+                    + insert_batches(ProductVariantOption, 3 * options ** 3)
+                ))
+
+    def test_new_option_only_creates_its_combinations(self):
+        existing = set(self.product.product_variants.values_list('id', flat=True))
+        VariantOption.objects.create(variant=self.size, value='L')
+        created = generate_product_variants(self.product)
+        self.assertEqual({variant.sku for variant in created}, {'REGEN-L-Red', 'REGEN-L-Blue'})
+        self.assertTrue(existing < set(self.product.product_variants.values_list('id', flat=True)))
+        self.assertEqual(self.product.product_variants.count(), 6)
+
+    def test_removed_options_retire_and_restore_skus(self):
+        VariantOption.objects.filter(variant=self.colour, value='Blue').delete()
+        self.assertEqual(generate_product_variants(self.product, deactivate_orphans=True), [])
+        self.assertEqual(self.skus(is_active=False), {'REGEN-S-Blue', 'REGEN-M-Blue'})
+        response = self.client.get(f'/api/product-variants/?product_id={self.product.pk}&is_active=true')
+        self.assertEqual({row['sku'] for row in response.json()['results']}, {'REGEN-S-Red', 'REGEN-M-Red'})
+
+        # Adding the option back links the retired SKUs to it again rather than clashing with them
+        VariantOption.objects.create(variant=self.colour, value='Blue')
+        self.assertEqual(generate_product_variants(self.product), [])
+        self.assertEqual(self.skus(is_active=False), set())
+        self.assertEqual(ProductVariant.objects.filter(product=self.product, options__variant_option__value='Blue').count(), 2)
+
+    def test_only_retired_skus_count_as_reactivated(self):
+        # Without deactivate_orphans the SKUs lose their links but stay active
+        VariantOption.objects.filter(variant=self.colour, value='Blue').delete()
+        generate_product_variants(self.product)
+        VariantOption.objects.create(variant=self.colour, value='Blue')
+        with self.assertLogs('products.utils', 'INFO') as logs:
+            self.assertEqual(generate_product_variants(self.product), [])
+        self.assertIn('2 relinked, 0 reactivated, 0 deactivated', logs.output[-1])
+        self.assertEqual(self.skus(is_active=False), set())
+
+
+class CatalogueImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Products.objects.create(ProductCode='TAKEN', ProductName='Existing', CreatedUser=self.user)
+
+    def upload(self, content, name='catalogue.csv'):
+        return self.client.post('/api/products/import/', {'file': SimpleUploadedFile(name, content)})
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        response = self.upload(
+            b'ProductCode,ProductName,Variants\n'
+            b'NEW1,New,Size:S|M\n'
+            b'NEW2,,\n'
+            b'TAKEN,Again,\n'
+            b'NEW1,Twice,\n'
+            b'NEW3,Bad,Size\n'
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        report = response.json()
+        self.assertEqual((report['products'], report['skus']), (1, 2))
+        self.assertEqual(report['errors'], [
+            {'row': 3, 'detail': "ProductCode and ProductName are required."},
+            {'row': 4, 'detail': "ProductCode 'TAKEN' must be unique."},
+            {'row': 5, 'detail': "ProductCode 'NEW1' must be unique."},
+            {'row': 6, 'detail': "Invalid variant definition 'Size'. Use Name:Option1|Option2."},
+        ])
+
+    def test_database_errors_only_reject_their_row(self):
+        # Both rows generate the SKU CLASH-B-C
+        response = self.upload(
+            b'ProductCode,ProductName,Variants\n'
+            b'CLASH,First,Size:B-C\n'
+            b'CLASH-B,Second,Size:C\n'
+            b'AFTER,Third,\n'
+        )
+        report = response.json()
+        self.assertEqual(report['products'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [3])
+        self.assertEqual(
+            set(Products.objects.values_list('ProductCode', flat=True)), {'TAKEN', 'CLASH', 'AFTER'}
+        )
+
+    def test_unreadable_files_are_rejected(self):
+        response = self.upload('ProductCode,ProductName\nCAFE,Café\n'.encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not UTF-8', response.json()['file'])
+        response = self.upload(b'not a workbook', name='catalogue.xlsx')
+        self.assertEqual(response.json(), {'file': "The file is not a valid XLSX workbook."})
+
+    def test_decode_error_after_imported_chunks_is_reported(self):
+        # Well past the first decoded block, so earlier rows are imported before reading fails
+        rows = ''.join(f'LONG{index},{"x" * 40}\n' for index in range(400))
+        content = f'ProductCode,ProductName\n{rows}CAFE,Café\n'.encode('latin-1')
+        report = import_catalogue(io.BytesIO(content), 'csv', self.user, chunk_size=100)
+        self.assertGreater(report['products'], 0)
+        self.assertIn('not UTF-8', report['errors'][-1]['detail'])
+
+    def test_xlsx_import(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(['ProductCode', 'ProductName', 'Variants'])
+        workbook.active.append(['XL1', 'Sheet', 'Size:S|M|L'])
+        content = io.BytesIO()
+        workbook.save(content)
+        response = self.upload(content.getvalue(), name='catalogue.xlsx')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Products.objects.get(ProductCode='XL1').product_variants.count(), 3)
+
+
+class StockBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='balances', password='secret')
+        product = Products.objects.create(ProductCode='BAL', ProductName='Balance', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        self.small, self.medium = generate_product_variants(product)
+
+    def assertBalancesMatchLedger(self):
+        for product_variant in ProductVariant.objects.filter(pk__in=[self.small.pk, self.medium.pk]):
+            ledger = sum((stock.signed_quantity for stock in product_variant.stocks.all()), Decimal(0))
+            rollups = product_variant.daily_rollups.aggregate(
+                quantity_in=Sum('quantity_in'), quantity_out=Sum('quantity_out'), count=Sum('transaction_count')
+            )
+            with self.subTest(sku=product_variant.sku):
+                self.assertEqual(product_variant.stock_balance, ledger)
+                self.assertEqual((rollups['quantity_in'] or 0) - (rollups['quantity_out'] or 0), ledger)
+                self.assertEqual(rollups['count'] or 0, product_variant.stocks.count())
+        return {
+            sku: balance for sku, balance in
+            ProductVariant.objects.filter(pk__in=[self.small.pk, self.medium.pk]).values_list('sku', 'stock_balance')
+        }
+
+    def test_create_edit_and_delete(self):
+        received = Stock.objects.create(product_variant=self.small, quantity=10, transaction_type='IN')
+        Stock.objects.create(product_variant=self.small, quantity=3, transaction_type='OUT')
+        self.assertEqual(self.assertBalancesMatchLedger()['BAL-S'], 7)
+
+        received.quantity = 12
+        received.save()
+        self.assertEqual(self.assertBalancesMatchLedger()['BAL-S'], 9)
+
+        received.product_variant = self.medium
+        received.save()
+        self.assertEqual(self.assertBalancesMatchLedger(), {'BAL-S': -3, 'BAL-M': 12})
+
+        received.delete()
+        self.assertEqual(self.assertBalancesMatchLedger(), {'BAL-S': -3, 'BAL-M': 0})
+
+    def test_bulk_delete_and_update(self):
+        for quantity in (5, 6, 7):
+            Stock.objects.create(product_variant=self.small, quantity=quantity, transaction_type='IN')
+        Stock.objects.filter(quantity=5).delete()
+        self.assertEqual(self.assertBalancesMatchLedger()['BAL-S'], 13)
+
+        Stock.objects.filter(quantity=6).update(transaction_type='OUT')
+        self.assertEqual(self.assertBalancesMatchLedger()['BAL-S'], 1)
+        Stock.objects.filter(quantity=7).update(product_variant=self.medium)
+        self.assertEqual(self.assertBalancesMatchLedger(), {'BAL-S': -6, 'BAL-M': 7})
+        # Moving rows in time only rebuilds their rollups
+        last_week = timezone.now() - timedelta(days=7)
+        Stock.objects.filter(quantity=7).update(created_at=last_week)
+        self.assertEqual(self.assertBalancesMatchLedger(), {'BAL-S': -6, 'BAL-M': 7})
+        self.assertEqual(list(self.medium.daily_rollups.values_list('day', flat=True)), [timezone.localdate(last_week)])
+        # Other fields don't touch the balances
+        with self.assertNumQueries(1):
+            Stock.objects.update(notes='counted')
+
+    def test_deleting_a_variant_deletes_its_ledger(self):
+        Stock.objects.create(product_variant=self.small, quantity=4, transaction_type='IN')
+        self.small.delete()
+        self.assertFalse(Stock.objects.exists())
+
+    def test_rebuild_stock_balances(self):
+        Stock.objects.create(product_variant=self.small, quantity=4, transaction_type='IN')
+        Stock.objects.create(product_variant=self.medium, quantity=2, transaction_type='IN')
+        ProductVariant.objects.update(stock_balance=999)
+        self.assertEqual(rebuild_stock_balances(), (2, 1))
+        self.assertEqual(self.assertBalancesMatchLedger(), {'BAL-S': 4, 'BAL-M': 2})
+        self.assertEqual(Products.objects.get(ProductCode='BAL').TotalStock, 6)
+
+    def test_seeding_does_not_resync_per_batch(self):
+        days = 20
+        with CaptureQueriesContext(connection) as queries:
+            summary = seed_inventory(self.user, products=3, axes=(2, 2), stock_rows=200, days=days)
+        self.assertEqual(summary, {'products': 3, 'skus': 12, 'stock_rows': 200})
+        # An insert and a backdating update per simulated day, plus the import and the final rebuilds
+        self.assertLessEqual(len(queries), 2 * days + 30)
+        balances = dict(ProductVariant.objects.filter(
+            product__ProductCode__startswith=BENCHMARK_CODE_PREFIX
+        ).values_list('pk', 'stock_balance'))
+        ledger = dict.fromkeys(balances, Decimal(0))
+        for stock in Stock.objects.filter(product_variant__in=list(balances)):
+            ledger[stock.product_variant_id] += stock.signed_quantity
+        self.assertEqual(balances, ledger)
+
+
+class StockBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='batches', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Products.objects.create(ProductCode='BATCH', ProductName='Batch', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        self.small, self.medium = generate_product_variants(product)
+        Stock.objects.create(product_variant=self.small, quantity=5, transaction_type='IN')
+
+    def post(self, lines, atomic=True):
+        return self.client.post('/api/stock/batch/', {'lines': [
+            {'product_variant': str(product_variant.pk), 'quantity': quantity, 'transaction_type': transaction_type}
+            for product_variant, quantity, transaction_type in lines
+        ], 'atomic': atomic}, format='json')
+
+    def balances(self):
+        return dict(ProductVariant.objects.filter(product__ProductCode='BATCH').values_list('sku', 'stock_balance'))
+
+    def test_atomic_batch_rolls_back_every_line(self):
+        response = self.post([(self.medium, '4', 'IN'), (self.small, '9', 'OUT'), (self.small, '1', 'OUT')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'line': 1, 'detail': "Insufficient stock available."}])
+        self.assertEqual(Stock.objects.count(), 1)
+        self.assertEqual(self.balances(), {'BATCH-S': 5, 'BATCH-M': 0})
+
+    def test_non_atomic_batch_reports_failed_lines(self):
+        missing = ProductVariant(pk=uuid.uuid4())
+        response = self.post([(self.medium, '4', 'IN'), (missing, '1', 'IN'), (self.small, '9', 'OUT')], atomic=False)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(response.json()['errors'], [
+            {'line': 1, 'detail': "Invalid product variant."},
+            {'line': 2, 'detail': "Insufficient stock available."},
+        ])
+        self.assertEqual(self.balances(), {'BATCH-S': 5, 'BATCH-M': 4})
+
+    def test_balance_cannot_go_negative_within_a_batch(self):
+        # Each line is checked against the balance left by the lines before it
+        response = self.post([(self.small, '3', 'OUT'), (self.small, '3', 'OUT'), (self.small, '2', 'OUT')], atomic=False)
+        self.assertEqual(response.json()['errors'], [{'line': 1, 'detail': "Insufficient stock available."}])
+        self.assertEqual(self.balances()['BATCH-S'], 0)
+        self.assertEqual(
+            StockDailyRollup.objects.get(product_variant=self.small).quantity_out, Decimal(5)
+        )
+
+
+class StockSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='snapshots', password='secret')
+        product = Products.objects.create(ProductCode='SNAP', ProductName='Snapshot', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        self.variants = generate_product_variants(product)
+        self.start = timezone.now() - timedelta(days=30)
+        # Two movements a day for 30 days, alternating variants
+        for day in range(30):
+            for index, product_variant in enumerate(self.variants):
+                stock = Stock.objects.create(
+                    product_variant=product_variant, quantity=day + index + 1,
+                    transaction_type='OUT' if day % 3 == 2 else 'IN'
+                )
+                Stock.objects.filter(pk=stock.pk).update(created_at=self.start + timedelta(days=day, hours=index))
+        take_stock_snapshots(self.start + timedelta(days=10))
+        take_stock_snapshots(self.start + timedelta(days=20))
+
+    def assertMatchesLedger(self, at):
+        expected = {
+            product_variant.pk: sum(
+                (stock.signed_quantity for stock in Stock.objects.filter(product_variant=product_variant, created_at__lte=at)),
+                Decimal(0)
+            )
+            for product_variant in self.variants
+        }
+        self.assertEqual(dict(balances_as_of(at).values_list('pk', 'balance')), expected)
+
+    def test_balances_between_snapshots(self):
+        self.assertEqual(StockSnapshot.objects.count(), 4)
+        for days in (0, 5, 10, 15.5, 20, 25, 40):
+            with self.subTest(days=days):
+                self.assertMatchesLedger(self.start + timedelta(days=days))
+
+    def test_balances_after_editing_and_deleting_history(self):
+        def on_day(day):
+            return Stock.objects.filter(
+                created_at__gte=self.start + timedelta(days=day), created_at__lt=self.start + timedelta(days=day + 1)
+            )
+
+        # Only the snapshots taken after the changed row are discarded; the day 10 one stays in use
+        on_day(12).delete()
+        self.assertEqual(StockSnapshot.objects.count(), 2)
+        edited = on_day(15).first()
+        edited.quantity += 100
+        edited.transaction_type = 'OUT'
+        edited.save()
+        for days in (8, 15.5, 25):
+            with self.subTest(days=days):
+                self.assertMatchesLedger(self.start + timedelta(days=days))
+
+        edited = on_day(2).first()
+        edited.quantity += 100
+        edited.save()
+        self.assertEqual(StockSnapshot.objects.filter(product_variant=edited.product_variant).count(), 0)
+        for days in (8, 15.5, 25):
+            with self.subTest(days=days):
+                self.assertMatchesLedger(self.start + timedelta(days=days))
+
+
+class StockRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollups', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Products.objects.create(ProductCode='ROLL', ProductName='Rollup', CreatedUser=self.user)
+        variant = Variant.objects.create(product=self.product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        self.small, self.medium = generate_product_variants(self.product)
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+        old = Stock.objects.create(product_variant=self.small, quantity=20, transaction_type='IN')
+        Stock.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=1))
+        for path, product_variant, quantity, transaction_type in (
+            ('add_stock', self.small, '10', 'IN'),
+            ('add_stock', self.medium, '7', 'IN'),
+            ('remove_stock', self.small, '4', 'OUT'),
+            ('remove_stock', self.medium, '2', 'OUT'),
+        ):
+            response = self.client.post(f'/api/stock/{path}/', {
+                'product_variant': str(product_variant.pk), 'quantity': quantity, 'transaction_type': transaction_type
+            })
+            self.assertEqual(response.status_code, 201, response.content)
+
+    def assertRollupsMatchLedger(self):
+        expected = defaultdict(lambda: [Decimal(0), Decimal(0), 0])
+        for stock in Stock.objects.all():
+            totals = expected[(stock.product_variant_id, timezone.localdate(stock.created_at))]
+            totals[0 if stock.transaction_type == 'IN' else 1] += stock.quantity
+            totals[2] += 1
+        self.assertEqual({
+            (rollup.product_variant_id, rollup.day): [rollup.quantity_in, rollup.quantity_out, rollup.transaction_count]
+            for rollup in StockDailyRollup.objects.all()
+        }, dict(expected))
+
+    def test_rollups_follow_the_ledger(self):
+        self.assertRollupsMatchLedger()
+        Stock.objects.get(product_variant=self.medium, transaction_type='OUT').delete()
+        Stock.objects.filter(product_variant=self.small, quantity=10).delete()
+        self.assertRollupsMatchLedger()
+
+    def test_summary(self):
+        by_variant = sorted(self.client.get('/api/stock/summary/').json(), key=lambda row: row['sku'])
+        self.assertEqual(by_variant, [
+            {'product_variant': str(self.medium.pk), 'sku': 'ROLL-M', 'quantity_in': '7.00000000',
+             'quantity_out': '2.00000000', 'net': '5.00000000', 'transactions': 2},
+            {'product_variant': str(self.small.pk), 'sku': 'ROLL-S', 'quantity_in': '30.00000000',
+             'quantity_out': '4.00000000', 'net': '26.00000000', 'transactions': 3},
+        ])
+
+        by_product = self.client.get('/api/stock/summary/?group_by=product').json()
+        self.assertEqual(by_product, [{
+            'product': str(self.product.pk), 'product_name': 'Rollup', 'quantity_in': '37.00000000',
+            'quantity_out': '6.00000000', 'net': '31.00000000', 'transactions': 5,
+        }])
+
+        by_day = self.client.get('/api/stock/summary/?group_by=day').json()
+        self.assertEqual([(row['day'], row['net'], row['transactions']) for row in by_day], [
+            (self.yesterday.isoformat(), '20.00000000', 1), (self.today.isoformat(), '11.00000000', 4),
+        ])
+        today_only = self.client.get(f'/api/stock/summary/?group_by=day&start_date={self.today.isoformat()}').json()
+        self.assertEqual([row['day'] for row in today_only], [self.today.isoformat()])
+        self.assertEqual(self.client.get('/api/stock/summary/?group_by=week').status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cursors', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Products.objects.create(ProductCode='CUR', ProductName='Cursor', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.create(variant=variant, value='S')
+        small, = generate_product_variants(product)
+        Stock.objects.bulk_create([
+            Stock(product_variant=small, quantity=index + 1, transaction_type='IN') for index in range(13)
+        ])
+        # Only three distinct timestamps, so most page edges fall inside a run of equal created_at
+        now = timezone.now()
+        pks = list(Stock.objects.order_by('quantity').values_list('pk', flat=True))
+        for hours in range(3):
+            Stock.objects.filter(pk__in=pks[hours::3]).update(created_at=now - timedelta(hours=hours))
+        self.expected = [str(pk) for pk in Stock.objects.order_by('-created_at', 'id').values_list('pk', flat=True)]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row['id'] for row in response.json()['results']])
+            url = response.json()[link]
+        return pages
+
+    def test_cursors_neither_skip_nor_repeat_rows(self):
+        forward = self.walk('/api/stock/report/?cursor=&page_size=4', 'next')
+        self.assertEqual([len(page) for page in forward], [4, 4, 4, 1])
+        self.assertEqual([pk for page in forward for pk in page], self.expected)
+
+        # Back from the last page through the previous links
+        last = self.client.get('/api/stock/report/?cursor=&page_size=4')
+        for _ in range(3):
+            last = self.client.get(last.json()['next'])
+        backward = self.walk(last.json()['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+
+class StockReportExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exports', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        product = Products.objects.create(ProductCode='EXP', ProductName='Export, "quoted"', CreatedUser=self.user)
+        variant = Variant.objects.create(product=product, name='Size')
+        VariantOption.objects.bulk_create([VariantOption(variant=variant, value=value) for value in ('S', 'M')])
+        small, medium = generate_product_variants(product)
+        Stock.objects.create(product_variant=small, quantity=5, transaction_type='IN', notes='first,\nline')
+        Stock.objects.create(product_variant=medium, quantity='2.5', transaction_type='IN')
+        Stock.objects.create(product_variant=small, quantity=1, transaction_type='OUT', notes='sold')
+        self.report = self.client.get('/api/stock/report/').json()
+
+    def export(self, export_format):
+        response = self.client.get(f'/api/stock/report/?format={export_format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, body = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="stock-report.csv"')
+        reader = csv.DictReader(io.StringIO(body))
+        self.assertEqual(reader.fieldnames, ['id', 'product_name', 'sku', 'quantity', 'transaction_type', 'notes', 'created_at'])
+        self.assertEqual(list(reader), [
+            {key: '' if value is None else str(value) for key, value in row.items()} for row in self.report
+        ])
+
+    def test_ndjson(self):
+        response, body = self.export('ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.report)
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bench', password='secret')
+
+    def seed(self, products=4):
+        output = io.StringIO()
+        call_command(
+            'seed_inventory', user='bench', products=products, axes='2,3', stock_rows=300, days=15, stdout=output
+        )
+        return output.getvalue()
+
+    def assertBalancesMatchLedger(self):
+        ledger = defaultdict(Decimal)
+        for stock in Stock.objects.all():
+            ledger[stock.product_variant_id] += stock.signed_quantity
+        for product in Products.objects.prefetch_related('product_variants'):
+            with self.subTest(product=product.ProductCode):
+                for product_variant in product.product_variants.all():
+                    self.assertEqual(product_variant.stock_balance, ledger[product_variant.pk])
+                    self.assertGreaterEqual(product_variant.stock_balance, 0)
+                self.assertEqual(product.TotalStock, sum(ledger[variant.pk] for variant in product.product_variants.all()))
+
+    def test_seed_inventory(self):
+        self.assertIn("Seeded 4 products, 24 SKUs and 300 stock rows.", self.seed())
+        self.assertEqual(Products.objects.filter(ProductCode__startswith=BENCHMARK_CODE_PREFIX).count(), 4)
+        self.assertEqual(ProductVariant.objects.count(), 24)
+        self.assertEqual(Stock.objects.count(), 300)
+        self.assertEqual(StockDailyRollup.objects.aggregate(rows=Sum('transaction_count'))['rows'], 300)
+        self.assertBalancesMatchLedger()
+
+        # Seeding again adds new products next to the existing ones
+        self.seed(products=2)
+        self.assertEqual(Products.objects.count(), 6)
+        self.assertEqual(Stock.objects.count(), 600)
+        self.assertBalancesMatchLedger()
+
+        with self.assertRaises(CommandError):
+            call_command('seed_inventory', user='nobody', products=1)
+
+    def test_run_benchmarks(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('run_benchmarks', user='bench', iterations=2, output=path, stdout=io.StringIO())
+            with open(path) as output:
+                results = json.load(output)
+        self.assertEqual(set(results['results']), {
+            'dashboard_stats', 'dashboard_stats_cached', 'product_list', 'product_list_cursor', 'stock_report_30d',
+            'stock_report_csv_30d', 'add_stock', 'remove_stock', 'generate_variants',
+        })
+        for name, result in results['results'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result['iterations'], 2)
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+                self.assertEqual(result['queries'] == 0, name == 'dashboard_stats_cached')
+        # Three add_stock and three remove_stock requests: two timed, one instrumented each
+        self.assertEqual(results['dataset']['stock_rows'], Stock.objects.count())
+        self.assertEqual(Stock.objects.count(), 306)
+        # The write scenarios went through the ledger like any other stock movement
+        self.assertBalancesMatchLedger()
+
+    def test_benchmark_serialization(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark_serialization', user='bench', iterations=2, output=path, stdout=io.StringIO())
+            with open(path) as output:
+                results = json.load(output)
+        self.assertEqual(set(results['results']), {'products', 'product_variants', 'stock_report'})
+        for name, result in results['results'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result['serializer']['rows_per_request'], result['fast']['rows_per_request'])
+                self.assertGreater(result['fast']['rows_per_request'], 0)
@@ -1,14 +1,28 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, ProductVariantViewSet, StockViewSet,dashboard_stats
+from . import async_views
+from .views import JobViewSet, ProductViewSet, ProductVariantViewSet, StockViewSet,dashboard_stats, metrics
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 router.register(r'product-variants', ProductVariantViewSet)
 router.register(r'stock', StockViewSet, basename='stock')
+router.register(r'jobs', JobViewSet)
+
+# Async read endpoints for ASGI deployments, same responses as their DRF counterparts
+async_urlpatterns = [
+    path('stock/dashboard_stats/', async_views.dashboard_stats, name='async-dashboard-stats'),
+    path('stock/report/', async_views.stock_report, name='async-stock-report'),
+    path('products/', async_views.product_list, name='async-products-list'),
+    path('products/<str:pk>/', async_views.product_detail, name='async-products-detail'),
+    path('product-variants/', async_views.product_variant_list, name='async-product-variants-list'),
+]
 
 urlpatterns = [
+    # Ahead of the router, whose products/<pk>/ route would otherwise match it
+    path('products/check-code/', ProductViewSet.as_view({'get': 'check_code'})),
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
     path('stock/dashboard_stats/', dashboard_stats, name='dashboard-stats'),
-    path('products/check-code/', ProductViewSet.as_view({'get': 'check_code'})),
-]
\ No newline at end of file
+    path('metrics', metrics, name='metrics'),
+]
@@ -1,53 +1,170 @@
 import logging
-from django.db import transaction
-from .models import Products, Variant, VariantOption, ProductVariant, ProductVariantOption
+from collections import defaultdict
+from itertools import islice, product as itertools_product
+from django.db import connection, transaction
+from .models import Products, Variant, ProductVariant, ProductVariantOption
+from .lookups import invalidate_sku_lookups
+from .search import reindex_products_on_commit
+from .versions import touch_products
 
 logger = logging.getLogger(__name__)
 
-def generate_product_variants(product):
+BULK_BATCH_SIZE = 1000
+
+
+class QueryCounter:
+    """
+    Execute wrapper that counts the SQL statements run while it is installed
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def load_variant_axes(product):
     """
-    Generate all possible variants for a product
+    Return [(variant, [option, ...]), ...] for a product using a single prefetch
     """
     variants = Variant.objects.filter(product=product).prefetch_related('options')
-    if not variants.exists():
-        logger.warning(f"No variants found for product {product.id}")
-        return []
-    
-    from itertools import product as itertools_product
-    
-    options_per_variant = []
-    for variant in variants:
-        options = [opt.value for opt in variant.options.all()]
-        options_per_variant.append(options)
-    
-    combinations = list(itertools_product(*options_per_variant))
-    
+    return [(variant, list(variant.options.all())) for variant in variants]
+
+
+def _cache_options(product_variant, links):
+    # Prime the `options` prefetch cache so serializing fresh variants costs no queries
+    queryset = product_variant.options.all()
+    queryset._result_cache = links
+    queryset._prefetch_done = True
+    product_variant._prefetched_objects_cache = {'options': queryset}
+
+
+def build_variant_rows(product, axes, combinations):
+    """
+    Build unsaved ProductVariant and ProductVariantOption rows for the given option combinations
+    """
+    product_variants = []
+    links = []
+    for combo in combinations:
+        sku = '-'.join([product.ProductCode] + [option.value for option in combo])
+        product_variant = ProductVariant(product=product, sku=sku)
+        variant_links = [
+            ProductVariantOption(product_variant=product_variant, variant=variant, variant_option=option)
+            for (variant, _), option in zip(axes, combo)
+        ]
+        _cache_options(product_variant, variant_links)
+        product_variants.append(product_variant)
+        links.extend(variant_links)
+    return product_variants, links
+
+
+def _existing_combinations(product, axes):
+    """
+    Return {product variant id: (sku, is_active, key)} for the product's SKUs, where key is
+    the tuple of its option ids in `axes` order, or None when it lacks one of the axes
+    """
+    axis_ids = [variant.pk for variant, _ in axes]
+    chosen = defaultdict(dict)
+    for product_variant_id, variant_id, option_id in ProductVariantOption.objects.filter(
+        product_variant__product=product
+    ).values_list('product_variant_id', 'variant_id', 'variant_option_id'):
+        chosen[product_variant_id][variant_id] = option_id
+
+    existing = {}
+    for product_variant_id, sku, is_active in ProductVariant.objects.filter(product=product).values_list(
+        'id', 'sku', 'is_active'
+    ):
+        options = chosen.get(product_variant_id, {})
+        key = tuple(options.get(axis_id) for axis_id in axis_ids)
+        existing[product_variant_id] = (sku, is_active, None if None in key else key)
+    return existing
+
+
+def generate_product_variants(product, axes=None, batch_size=BULK_BATCH_SIZE, deactivate_orphans=False):
+    """
+    Create the product's missing variants: one per option combination not yet linked to a SKU.
+
+    The product's existing SKUs and their option links are read once and diffed in memory, so
+    regenerating after adding an option value only inserts the new combinations. Inactive SKUs
+    whose combination is offered again are reactivated; with `deactivate_orphans`, SKUs whose
+    combination is no longer offered (an option or axis was removed or added) are deactivated.
+    Returns the created variants.
+    """
+    counter = QueryCounter()
     created_variants = []
-    with transaction.atomic():
-        for combo in combinations:
-            sku_parts = [product.ProductCode]
-            variant_options = []
-            
-            for variant, option_value in zip(variants, combo):
-                sku_parts.append(option_value)
-                variant_option = VariantOption.objects.get(variant=variant, value=option_value)
-                variant_options.append((variant, variant_option))
-            
-            sku = '-'.join(sku_parts)
-            
-            product_variant = ProductVariant.objects.create(
-                product=product,
-                sku=sku
-            )
-            
-            for variant, variant_option in variant_options:
-                ProductVariantOption.objects.create(
-                    product_variant=product_variant,
-                    variant=variant,
-                    variant_option=variant_option
-                )
-            
-            created_variants.append(product_variant)
-    
-    logger.info(f"Generated {len(created_variants)} variants for product {product.id}")
-    return created_variants
\ No newline at end of file
+
+    with connection.execute_wrapper(counter):
+        if axes is None:
+            axes = load_variant_axes(product)
+        if not axes:
+            logger.warning(f"No variants found for product {product.id}")
+            return []
+
+        existing = _existing_combinations(product, axes)
+        offered = [{option.pk for option in options} for _, options in axes]
+        linked, reactivate, orphaned, unlinked, relinked = set(), [], set(), {}, []
+        for product_variant_id, (sku, is_active, key) in existing.items():
+            if key is not None and all(option_id in options for option_id, options in zip(key, offered)):
+                linked.add(key)
+                if not is_active:
+                    reactivate.append(product_variant_id)
+            else:
+                unlinked[sku] = product_variant_id
+                if is_active:
+                    orphaned.add(product_variant_id)
+        taken = {sku for sku, _, _ in existing.values()} - set(unlinked)
+
+        combinations = (
+            combo for combo in itertools_product(*[options for _, options in axes])
+            if tuple(option.pk for option in combo) not in linked
+        )
+        with transaction.atomic():
+            while True:
+                chunk = list(islice(combinations, batch_size))
+                if not chunk:
+                    break
+                product_variants, links = build_variant_rows(product, axes, chunk)
+                new_variants, new_links, chunk_relinked = [], [], []
+                for index, product_variant in enumerate(product_variants):
+                    sku_links = links[index * len(axes):(index + 1) * len(axes)]
+                    if product_variant.sku in unlinked:
+                        # An SKU with this code lost its options (e.g. one was deleted and re-added): link it again
+                        product_variant_id = unlinked[product_variant.sku]
+                        for link in sku_links:
+                            link.product_variant_id = product_variant_id
+                        chunk_relinked.append(product_variant_id)
+                    elif product_variant.sku in taken:
+                        logger.warning(f"Skipped variant {product_variant.sku} of product {product.id}: SKU is taken")
+                        continue
+                    else:
+                        new_variants.append(product_variant)
+                    new_links.extend(sku_links)
+                if chunk_relinked:
+                    ProductVariantOption.objects.filter(product_variant_id__in=chunk_relinked).delete()
+                    # Only the retired ones among them change state
+                    reactivate.extend(pk for pk in chunk_relinked if not existing[pk][1])
+                    orphaned.difference_update(chunk_relinked)
+                    relinked.extend(chunk_relinked)
+                ProductVariant.objects.bulk_create(new_variants, batch_size=batch_size)
+                ProductVariantOption.objects.bulk_create(new_links, batch_size=batch_size)
+                created_variants.extend(new_variants)
+            reactivated = deactivated = 0
+            if reactivate:
+                reactivated = ProductVariant.objects.filter(pk__in=reactivate, is_active=False).update(is_active=True)
+            if deactivate_orphans and orphaned:
+                deactivated = ProductVariant.objects.filter(pk__in=orphaned, is_active=True).update(is_active=False)
+            if reactivated or deactivated:
+                # .update() skips post_save; retired SKUs must stop resolving in scan lookups
+                invalidate_sku_lookups(variant_ids=[*reactivate, *(orphaned if deactivate_orphans else ())])
+            if created_variants or relinked or reactivated or deactivated:
+                # bulk_create skips post_save, so refresh the product's search row and version explicitly
+                reindex_products_on_commit([product.pk])
+                touch_products([product.pk])
+
+    logger.info(
+        f"Generated {len(created_variants)} variants for product {product.id} "
+        f"({len(linked)} existing, {len(relinked)} relinked, {reactivated} reactivated, "
+        f"{deactivated} deactivated) in {counter.count} queries"
+    )
+    return created_variants
@@ -0,0 +1,139 @@
+"""
+Cheap validators for conditional GETs on the catalogue endpoints.
+
+Products.UpdatedDate is bumped whenever anything in the product's nested payload changes
+(the product, its variants, options, SKUs or their stock), and a catalogue-wide counter in
+products_sequence is bumped after every such transaction commits. ETag/Last-Modified come
+from those values with one small query, so an unchanged list or detail is answered with a
+304 before anything is serialized.
+"""
+from functools import wraps
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from .models import Products, Sequence
+
+CATALOGUE_SEQUENCE = 'catalogue'
+
+
+def _bump_catalogue_version():
+    now = timezone.now()
+    updated = Sequence.objects.filter(name=CATALOGUE_SEQUENCE).update(
+        next_value=F('next_value') + 1, updated_at=now
+    )
+    if not updated:
+        Sequence.objects.get_or_create(name=CATALOGUE_SEQUENCE, defaults={'next_value': 1, 'updated_at': now})
+
+
+def catalogue_changed():
+    """
+    Bump the catalogue counter once the current transaction commits. Bumping after the commit
+    keeps the counter row out of long write transactions; a reader in between sees the new
+    data under the old ETag, which only costs that client one extra full response later.
+    """
+    transaction.on_commit(_bump_catalogue_version)
+
+
+def touch_products(product_ids):
+    """
+    Mark products (pks, or a queryset of them) as changed, e.g. after a write to their variants or stock
+    """
+    Products.objects.filter(pk__in=product_ids).update(UpdatedDate=timezone.now())
+    catalogue_changed()
+
+
+def _renderer_format(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return getattr(renderer, 'format', 'json')
+
+
+def _validators(request, prefix, row):
+    if row is None or row[1] is None:
+        return None, None
+    version, changed_at = row
+    return f'{prefix}-{version}-{_renderer_format(request)}', changed_at
+
+
+def catalogue_validators(request, *args, **kwargs):
+    row = Sequence.objects.filter(name=CATALOGUE_SEQUENCE).values_list('next_value', 'updated_at').first()
+    return _validators(request, 'catalogue', row)
+
+
+async def acatalogue_validators(request, *args, **kwargs):
+    row = await Sequence.objects.filter(name=CATALOGUE_SEQUENCE).values_list('next_value', 'updated_at').afirst()
+    return _validators(request, 'catalogue', row)
+
+
+def _product_row(row):
+    # The pk keeps ETags of different products apart; the microsecond timestamp is the version
+    if row is None or row[1] is None:
+        return None
+    pk, updated = row
+    return f'{pk}-{int(updated.timestamp() * 1_000_000)}', updated
+
+
+def product_validators(request, pk=None, *args, **kwargs):
+    try:
+        row = Products.objects.filter(pk=pk).values_list('pk', 'UpdatedDate').first()
+    except (ValidationError, ValueError):
+        row = None
+    return _validators(request, 'product', _product_row(row))
+
+
+async def aproduct_validators(request, pk=None, *args, **kwargs):
+    try:
+        row = await Products.objects.filter(pk=pk).values_list('pk', 'UpdatedDate').afirst()
+    except (ValidationError, ValueError):
+        row = None
+    return _validators(request, 'product', _product_row(row))
+
+
+def _settled_seconds(last_modified):
+    """
+    `last_modified` in the whole seconds of HTTP dates, or None while that second is still
+    running: another change within it would carry the same date, so If-Modified-Since could
+    not tell the two apart and the date is no validator yet
+    """
+    seconds = int(last_modified.timestamp())
+    return seconds if seconds < int(timezone.now().timestamp()) else None
+
+
+def not_modified(request, etag, last_modified):
+    """
+    A 304 (or 412) response when the request's preconditions say the client copy is current
+    """
+    if etag is None:
+        return None
+    return get_conditional_response(
+        request, etag=quote_etag(etag), last_modified=_settled_seconds(last_modified)
+    )
+
+
+def set_validators(response, etag, last_modified):
+    if etag is not None and response.status_code in (200, 304):
+        response['ETag'] = quote_etag(etag)
+        seconds = _settled_seconds(last_modified)
+        if seconds is not None:
+            response['Last-Modified'] = http_date(seconds)
+        # Let browsers keep the response but revalidate it on every use
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional(validators):
+    """
+    Decorate a viewset GET handler so `validators(request, *args, **kwargs)` -> (etag, last_modified)
+    answers matching If-None-Match / If-Modified-Since requests with a 304 without running it.
+    DRF authenticates and checks permissions before the handler, so 304s need the same access.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag, last_modified = validators(request, *args, **kwargs)
+            response = not_modified(request, etag, last_modified) or method(view, request, *args, **kwargs)
+            return set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -1,98 +1,140 @@
-from django.db.models import Sum, Q, F ,ExpressionWrapper
-from django.db import models
-from django.db.models.functions import Coalesce
-from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from django.db.models import Sum, Prefetch
+from rest_framework import generics, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from .models import Products, Variant, VariantOption, ProductVariant, ProductVariantOption, Stock
+from .models import Job, Products, Variant, VariantOption, ProductVariant, ProductVariantOption, Stock, StockDailyRollup
 from .serializers import (
     ProductSerializer, VariantSerializer, ProductVariantSerializer,
-    StockTransactionSerializer, StockReportSerializer
+    StockTransactionSerializer, StockReportSerializer, StockBatchSerializer, StockBalanceSerializer,
+    StockSummarySerializer, ProductSearchSerializer, SKUBatchLookupSerializer, ProductCodeCheckSerializer,
+    JobSerializer, StockReportExportSerializer
 )
 from datetime import datetime, timedelta
 import json
-from .utils import generate_product_variants  
+import os
+from .codes import existing_product_codes
+from .dashboard import get_dashboard_stats
+from .exports import stream_stock_report
+from .importers import CatalogueImportError, detect_format, import_catalogue
+from .jobs import enqueue
+from .metrics import IsMetricsScraper, request_metrics
+from .ledger import balances_as_of, post_stock_batch
+from .lookups import lookup_skus
+from .pagination import CursorOrPageNumberPagination, KeysetPagination
+from .payloads import (
+    fast_payloads_enabled, product_payloads, product_rows, product_variant_payloads, product_variant_rows,
+    stock_report_payloads, stock_report_rows
+)
+from .renderers import CSVRenderer, NDJSONRenderer, with_fast_json
+from .renditions import schedule_rendition_warming
+from .search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, search_products
+from .utils import generate_product_variants, load_variant_axes
+from .versions import catalogue_validators, conditional, product_validators
 import logging
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+SUMMARY_GROUPS = {
+    'variant': ('product_variant', 'product_variant__sku'),
+    'product': ('product_variant__product', 'product_variant__product__ProductName'),
+    'day': ('day',),
+}
+
+def parse_date_range(request):
+    """
+    Read start_date/end_date (YYYY-MM-DD) from the query string; end_date is returned exclusive
+    """
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+
+    if start_date:
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise ParseError("Invalid start_date format. Use YYYY-MM-DD.")
+
+    if end_date:
+        try:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
+        except ValueError:
+            raise ParseError("Invalid end_date format. Use YYYY-MM-DD.")
+
+    return start_date or None, end_date or None
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+def product_variant_queryset():
+    return ProductVariant.objects.prefetch_related(
+        Prefetch('options', queryset=ProductVariantOption.objects.select_related('variant', 'variant_option'))
+    )
+
+def filter_product_variants(queryset, query_params):
+    product_id = query_params.get('product_id')
+    if product_id:
+        queryset = queryset.filter(product_id=product_id)
+    is_active = query_params.get('is_active', '').lower()
+    if is_active in ('true', 'false'):
+        queryset = queryset.filter(is_active=is_active == 'true')
+    return queryset
+
+def product_queryset(fields=None):
+    # Everything ProductSerializer nests (or just the nested `fields`), loaded in a fixed number of queries
+    prefetches = {
+        'variants': Prefetch('variants', queryset=Variant.objects.prefetch_related('options')),
+        'product_variants': Prefetch('product_variants', queryset=product_variant_queryset()),
+    }
+    return Products.objects.all().order_by('-CreatedDate').prefetch_related(*(
+        prefetch for name, prefetch in prefetches.items() if fields is None or name in fields
+    ))
+
+def wants_background(request):
+    # ?background=true queues the work as a Job instead of running it in the request
+    return request.query_params.get('background', '').lower() in ('1', 'true', 'yes')
+
+def job_accepted(request, job):
+    serializer = JobSerializer(job, context={'request': request})
+    location = request.build_absolute_uri(reverse('job-detail', args=[job.pk]))
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+def get_row_or_404(view, rows):
+    """
+    view.get_object() for the values_list() rows of the fast read path
+    """
+    row = generics.get_object_or_404(rows, pk=view.kwargs[view.lookup_url_kwarg or view.lookup_field])
+    view.check_object_permissions(view.request, row)
+    return row
+
+def stock_report_queryset(request):
+    start_date, end_date = parse_date_range(request)
+
+    queryset = Stock.objects.all()
+
+    # Plain range lookups on created_at (not created_at__date) so the index can be used
+    if start_date:
+        queryset = queryset.filter(created_at__gte=start_of_day(start_date))
+
+    if end_date:
+        queryset = queryset.filter(created_at__lt=start_of_day(end_date))
+
+    return queryset.order_by('-created_at')
 
 # Standalone function for dashboard stats
 @api_view(['GET'])
 def dashboard_stats(request):
     try:
-        inventory_value = 0
-        total_products = Products.objects.count()
-        
-        # First annotate with proper decimal fields
-        product_variants = ProductVariant.objects.annotate(
-            total_in=Coalesce(
-                Sum('stocks__quantity', 
-                    filter=Q(stocks__transaction_type='IN'),
-                    output_field=models.DecimalField(max_digits=20, decimal_places=8)
-                ),
-                models.DecimalField(max_digits=20, decimal_places=8).clean(0, None)
-            ),
-            total_out=Coalesce(
-                Sum('stocks__quantity', 
-                    filter=Q(stocks__transaction_type='OUT'),
-                    output_field=models.DecimalField(max_digits=20, decimal_places=8)
-                ),
-                models.DecimalField(max_digits=20, decimal_places=8).clean(0, None)
-            )
-        ).annotate(
-            current_stock=ExpressionWrapper(
-                F('total_in') - F('total_out'),
-                output_field=models.DecimalField(max_digits=20, decimal_places=8)
-            )
-        )
-        
-        # Calculate inventory value
-        for pv in product_variants:
-            inventory_value += float(pv.current_stock) * 10  # Using float() to ensure proper conversion
-            
-        # Get counts with proper type handling
-        in_stock_count = product_variants.filter(
-            current_stock__gte=models.DecimalField(max_digits=20, decimal_places=8).clean(10, None)
-        ).count()
-        
-        low_stock_count = product_variants.filter(
-            current_stock__lt=models.DecimalField(max_digits=20, decimal_places=8).clean(10, None),
-            current_stock__gt=models.DecimalField(max_digits=20, decimal_places=8).clean(0, None)
-        ).count()
-        
-        out_of_stock_count = product_variants.filter(
-            current_stock=models.DecimalField(max_digits=20, decimal_places=8).clean(0, None)
-        ).count()
-        
-        # Get recent transactions
-        recent_transactions = Stock.objects.select_related(
-            'product_variant', 'product_variant__product'
-        ).order_by('-created_at')[:5]
-        
-        recent_serializer = StockReportSerializer(recent_transactions, many=True)
-        
-        return Response({
-            'total_products': total_products,
-            'inventory_value': round(inventory_value, 2),
-            'low_stock_items': low_stock_count,
-            'recent_transactions': recent_serializer.data,
-            'stock_status': {
-                'in_stock': in_stock_count,
-                'low_stock': low_stock_count,
-                'out_of_stock': out_of_stock_count
-            }
-        })
+        return Response(get_dashboard_stats())
     except Exception as e:
         logger.error(f"Dashboard stats error: {str(e)}")
         return Response(
@@ -100,6 +142,12 @@ def dashboard_stats(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser | IsMetricsScraper])
+def metrics(request):
+    # Staff users, or scrapers with METRICS_TOKEN
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Products.objects.all().order_by('-CreatedDate')
     serializer_class = ProductSerializer
@@ -129,15 +177,20 @@ class ProductViewSet(viewsets.ModelViewSet):
                 Variant.objects.filter(product=product).delete()
 
                 # Create variants
+                axes = []
                 for variant_data in variants_data:
                     options_data = variant_data.pop('options', [])
-                    variant = Variant.objects.create(product=product, **variant_data)
-                    
-                    for option_data in options_data:
-                        VariantOption.objects.create(variant=variant, **option_data)
-                        
-                generate_product_variants(product)
+                    variant = Variant(product=product, **variant_data)
+                    options = [VariantOption(variant=variant, **option_data) for option_data in options_data]
+                    axes.append((variant, options))
+
+                Variant.objects.bulk_create([variant for variant, _ in axes])
+                VariantOption.objects.bulk_create([option for _, options in axes for option in options])
+
+                generate_product_variants(product, axes)
+                schedule_rendition_warming(product)
             
+            serializer = self.get_serializer(self.get_queryset().get(pk=product.pk))
             headers = self.get_success_headers(serializer.data)
             return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
             
@@ -162,69 +215,128 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        exists = Products.objects.filter(ProductCode=code).exists()
-        return Response({"exists": exists})
+        return Response({"exists": code in existing_product_codes([code])})
+
+    @action(detail=False, methods=['post'], url_path='check-codes', serializer_class=ProductCodeCheckSerializer)
+    def check_codes(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        codes = serializer.validated_data['codes']
+        existing = existing_product_codes(codes)
+        return Response({"exists": {code: code in existing for code in codes}})
 
     queryset = Products.objects.all().order_by('-CreatedDate')
     serializer_class = ProductSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = CursorOrPageNumberPagination
+    cursor_ordering = ('-CreatedDate', 'ProductID')
+    renderer_classes = with_fast_json()
+
+    def get_queryset(self):
+        return product_queryset(self.get_requested_fields())
+
+    def get_requested_fields(self):
+        # ?fields= / ?expand= only shape the read endpoints
+        if self.action in ('list', 'retrieve'):
+            return ProductSerializer.requested_fields(self.request.query_params)
+        return None
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    @conditional(catalogue_validators)
+    def list(self, request, *args, **kwargs):
+        if not fast_payloads_enabled(request):
+            return super().list(request, *args, **kwargs)
+        fields = self.get_requested_fields()
+        rows = product_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(product_payloads(rows, request, fields))
+        return self.get_paginated_response(product_payloads(page, request, fields))
+
+    @conditional(product_validators)
+    def retrieve(self, request, *args, **kwargs):
+        if not fast_payloads_enabled(request):
+            return super().retrieve(request, *args, **kwargs)
+        row = get_row_or_404(self, product_rows(self.filter_queryset(self.get_queryset())))
+        return Response(product_payloads([row], request, self.get_requested_fields())[0])
     
     def perform_create(self, serializer):
         serializer.save(CreatedUser=self.request.user)
+
+    def perform_update(self, serializer):
+        product = serializer.save()
+        if 'ProductImage' in serializer.validated_data:
+            schedule_rendition_warming(product)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "q parameter is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = min(int(request.query_params.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+        except ValueError:
+            raise ParseError("limit must be an integer.")
+
+        serializer = ProductSearchSerializer(search_products(query, max(limit, 1)), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response(
+                {"file": "A CSV or XLSX file is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        generate_variants = request.data.get('generate_variants', 'true').lower() == 'true'
+        try:
+            file_format = detect_format(upload.name)
+            if wants_background(request):
+                job = enqueue(
+                    'import_catalogue', {'file_format': file_format, 'generate_variants': generate_variants},
+                    user=request.user, input=upload
+                )
+                return job_accepted(request, job)
+            report = import_catalogue(upload.file, file_format, request.user, generate_variants=generate_variants)
+        except CatalogueImportError as e:
+            return Response({"file": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            report,
+            status=status.HTTP_201_CREATED if report['products'] else status.HTTP_400_BAD_REQUEST
+        )
     
     @action(detail=True, methods=['post'])
     def generate_variants(self, request, pk=None):
         product = self.get_object()
         
-        variants = Variant.objects.filter(product=product).prefetch_related('options')
-        if not variants.exists():
+        axes = load_variant_axes(product)
+        if not axes:
             return Response(
                 {"detail": "No variants found for this product."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        # Only missing combinations are created; ?deactivate_orphans=true also retires SKUs no longer offered
+        deactivate_orphans = request.query_params.get('deactivate_orphans', '').lower() in ('1', 'true', 'yes')
+        if wants_background(request):
+            return job_accepted(request, enqueue(
+                'generate_variants', {'product': str(product.pk), 'deactivate_orphans': deactivate_orphans},
+                user=request.user
+            ))
         
-        queryset = Products.objects.all().prefetch_related(
-            'variants',
-            'variants__options',
-            'product_variants',
-            'product_variants__options'
-                ).order_by('-CreatedDate')
-        
-        from itertools import product as itertools_product
-        
-        options_per_variant = []
-        for variant in variants:
-            options = [opt.value for opt in variant.options.all()]
-            options_per_variant.append(options)
-        
-        combinations = list(itertools_product(*options_per_variant))
-        
-        created_variants = []
-        with transaction.atomic():
-            for combo in combinations:
-                sku_parts = [product.ProductCode]
-                variant_options = []
-                
-                for variant, option_value in zip(variants, combo):
-                    sku_parts.append(option_value)
-                    variant_option = VariantOption.objects.get(variant=variant, value=option_value)
-                    variant_options.append((variant, variant_option))
-                
-                sku = '-'.join(sku_parts)
-                
-                product_variant = ProductVariant.objects.create(
-                    product=product,
-                    sku=sku
-                )
-                
-                for variant, variant_option in variant_options:
-                    ProductVariantOption.objects.create(
-                        product_variant=product_variant,
-                        variant=variant,
-                        variant_option=variant_option
-                    )
-                
-                created_variants.append(product_variant)
+        created_variants = generate_product_variants(product, axes, deactivate_orphans=deactivate_orphans)
         
         serializer = ProductVariantSerializer(created_variants, many=True)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -232,13 +344,48 @@ class ProductViewSet(viewsets.ModelViewSet):
 class ProductVariantViewSet(viewsets.ModelViewSet):
     queryset = ProductVariant.objects.all()
     serializer_class = ProductVariantSerializer
+    pagination_class = CursorOrPageNumberPagination
+    cursor_ordering = ('sku',)
+    renderer_classes = with_fast_json()
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        product_id = self.request.query_params.get('product_id')
-        if product_id:
-            queryset = queryset.filter(product_id=product_id)
-        return queryset
+        return filter_product_variants(product_variant_queryset().select_related('product'), self.request.query_params)
+
+    @conditional(catalogue_validators)
+    def list(self, request, *args, **kwargs):
+        if not fast_payloads_enabled(request):
+            return super().list(request, *args, **kwargs)
+        rows = product_variant_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(product_variant_payloads(rows))
+        return self.get_paginated_response(product_variant_payloads(page))
+
+    @conditional(catalogue_validators)
+    def retrieve(self, request, *args, **kwargs):
+        if not fast_payloads_enabled(request):
+            return super().retrieve(request, *args, **kwargs)
+        row = get_row_or_404(self, product_variant_rows(self.filter_queryset(self.get_queryset())))
+        return Response(product_variant_payloads([row])[0])
+
+    @action(detail=False, methods=['get'], url_path=r'by-sku/(?P<sku>[^/]+)')
+    def by_sku(self, request, sku=None):
+        entry = lookup_skus([sku]).get(sku)
+        if entry is None:
+            raise NotFound(f"No product variant with SKU '{sku}'.")
+        return Response(entry)
+
+    @action(detail=False, methods=['post'], url_path='by-skus', serializer_class=SKUBatchLookupSerializer)
+    def by_skus(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        skus = list(dict.fromkeys(serializer.validated_data['skus']))
+        found = lookup_skus(skus)
+        return Response({
+            'results': [found[sku] for sku in skus if sku in found],
+            'missing': [sku for sku in skus if sku not in found],
+        })
     
 def create(self, request, *args, **kwargs):
     # Ensure product exists
@@ -291,6 +438,7 @@ def create(self, request, *args, **kwargs):
 class StockViewSet(viewsets.GenericViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockTransactionSerializer
+    cursor_ordering = ('-created_at', 'id')
     
     @action(detail=False, methods=['post'])
     def add_stock(self, request):
@@ -327,15 +475,18 @@ class StockViewSet(viewsets.GenericViewSet):
         product_variant = data['product_variant']
         quantity = data['quantity']
         
-        current_stock = product_variant.current_stock
-        if current_stock < quantity:
-            return Response(
-                {"detail": "Insufficient stock available."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         try:
             with transaction.atomic():
+                # Lock the variant row so concurrent removals see each other's balance
+                product_variant = ProductVariant.objects.select_for_update().select_related(
+                    'product'
+                ).get(pk=product_variant.pk)
+                if product_variant.current_stock < quantity:
+                    return Response(
+                        {"detail": "Insufficient stock available."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
                 stock = Stock.objects.create(
                     product_variant=product_variant,
                     quantity=quantity,
@@ -360,32 +511,148 @@ class StockViewSet(viewsets.GenericViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'], serializer_class=StockBatchSerializer)
+    def batch(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        atomic = serializer.validated_data['atomic']
+        stocks, errors = post_stock_batch(serializer.validated_data['lines'], atomic=atomic)
+
+        if not stocks:
+            return Response(
+                {"detail": "No stock movements were recorded.", "errors": errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            {"detail": "Stock batch recorded successfully.", "created": len(stocks), "errors": errors},
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['get'])
-    def report(self, request):
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-        
-        queryset = self.queryset
-        
-        if start_date:
+    def balances(self, request):
+        as_of = request.query_params.get('as_of')
+        if not as_of:
+            return Response(
+                {"detail": "as_of parameter is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        at = parse_datetime(as_of)
+        if at is None:
             try:
-                start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(created_at__date__gte=start_date)
+                # A bare date means the balance at the end of that day
+                day = datetime.strptime(as_of, '%Y-%m-%d')
             except ValueError:
                 return Response(
-                    {"detail": "Invalid start_date format. Use YYYY-MM-DD."},
+                    {"detail": "Invalid as_of format. Use YYYY-MM-DD or an ISO timestamp."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-        
+            at = day + timedelta(days=1) - timedelta(microseconds=1)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        variants = ProductVariant.objects.order_by('sku')
+        product_variant = request.query_params.get('product_variant')
+        if product_variant:
+            variants = variants.filter(pk=product_variant)
+        product_id = request.query_params.get('product_id')
+        if product_id:
+            variants = variants.filter(product_id=product_id)
+
+        queryset = balances_as_of(at, variants).values('id', 'sku', 'balance')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = StockBalanceSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = StockBalanceSerializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        start_date, end_date = parse_date_range(request)
+        group_by = request.query_params.get('group_by', 'variant')
+        if group_by not in SUMMARY_GROUPS:
+            return Response(
+                {"detail": f"Invalid group_by. Use one of: {', '.join(SUMMARY_GROUPS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = StockDailyRollup.objects.all()
+        if start_date:
+            queryset = queryset.filter(day__gte=start_date)
         if end_date:
-            try:
-                end_date = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
-                queryset = queryset.filter(created_at__date__lt=end_date)
-            except ValueError:
-                return Response(
-                    {"detail": "Invalid end_date format. Use YYYY-MM-DD."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        serializer = StockReportSerializer(queryset.order_by('-created_at'), many=True)
-        return Response(serializer.data)
\ No newline at end of file
+            queryset = queryset.filter(day__lt=end_date)
+
+        queryset = queryset.values(*SUMMARY_GROUPS[group_by]).annotate(
+            quantity_in=Sum('quantity_in'),
+            quantity_out=Sum('quantity_out'),
+            transactions=Sum('transaction_count'),
+        ).order_by(*SUMMARY_GROUPS[group_by])
+
+        serializer = StockSummarySerializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        renderer_classes=with_fast_json() + [CSVRenderer, NDJSONRenderer]
+    )
+    def report(self, request):
+        queryset = stock_report_queryset(request)
+
+        # ?format=csv / ?format=ndjson stream the rows instead of building one big list
+        export_format = request.accepted_renderer.format
+        if export_format in (CSVRenderer.format, NDJSONRenderer.format):
+            return stream_stock_report(queryset, export_format)
+
+        if fast_payloads_enabled(request):
+            queryset, serialize = stock_report_rows(queryset), stock_report_payloads
+        else:
+            queryset = queryset.select_related('product_variant__product')
+            serialize = lambda rows: StockReportSerializer(rows, many=True).data
+
+        # The report stays a plain list unless the client opts into keyset pages with ?cursor=
+        if KeysetPagination.cursor_query_param in request.query_params:
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(queryset, request, self)
+            return paginator.get_paginated_response(serialize(page))
+
+        return Response(serialize(queryset))
+
+    @action(detail=False, methods=['post'], url_path='report/export', serializer_class=StockReportExportSerializer)
+    def export_report(self, request):
+        # The full ledger can take longer than a proxy waits, so it is written to a file by a job
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        params = {'export_format': data['format']}
+        if data.get('start_date'):
+            params['start'] = start_of_day(data['start_date']).isoformat()
+        if data.get('end_date'):
+            params['end'] = start_of_day(data['end_date'] + timedelta(days=1)).isoformat()
+        return job_accepted(request, enqueue('stock_report', params, user=request.user))
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status, progress and results of background jobs; users see the jobs they queued
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if not job.output:
+            raise NotFound("This job has no file to download.")
+        filename = f"{job.kind.replace('_', '-')}-{job.pk}{os.path.splitext(job.output.name)[1]}"
+        return FileResponse(job.output.open('rb'), as_attachment=True, filename=filename)
@@ -46,6 +46,8 @@ const ProductList = () => {
         params: {
           search: searchTerm,
           page: page,
+          // Only what the table shows; skips the SKUs and their stock
+          fields: 'id,ProductName,ProductCode,variants',
         },
       });
       setProducts(response.data.results);